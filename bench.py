@@ -95,6 +95,242 @@ def eps_for_Model(Model, n_node, time_limit=0.5):
 
 # }}}
 
+# fused loop {{{
+
+def region_simulator(backend, n_tile=1, dtype='float64', n_workers=1):
+    from tvb.simulator import simulator, monitors
+    from tvb.datatypes.connectivity import Connectivity
+    conn = Connectivity(load_default=True)
+    conn.configure()
+    if n_tile > 1:
+        # block diagonal tiling of the default connectivity for larger networks
+        eye = numpy.eye(n_tile)
+        conn.weights = numpy.kron(eye, conn.weights)
+        conn.tract_lengths = numpy.kron(eye, conn.tract_lengths)
+        conn.centres = numpy.tile(conn.centres, (n_tile, 1))
+        conn.region_labels = numpy.tile(conn.region_labels, n_tile)
+    sim = simulator.Simulator(connectivity=conn, backend=backend, dtype=dtype, n_workers=n_workers,
+                              monitors=monitors.TemporalAverage(period=1.0))
+    return sim.configure()
+
+def time_for_backend(backend, n_tile, simulation_length=1e3):
+    sim = region_simulator(backend, n_tile)
+    # throw one away to exclude compilation
+    sim.run(simulation_length=sim.integrator.dt * 10)
+    tic = time.time()
+    sim.run(simulation_length=simulation_length)
+    return time.time() - tic
+
+def speedup_report_for_fused_loop():
+    sys.stdout.write('%10s%10s%10s%10s\n' % ('n_node', 'numpy', 'numba', 'speedup'))
+    for n_tile in (1, 4, 16):
+        tnp, tnb = [time_for_backend(backend, n_tile) for backend in ('numpy', 'numba')]
+        sys.stdout.write('%10d%10.2f%10.2f%10.1f\n' % (76 * n_tile, tnp, tnb, tnp / tnb))
+        sys.stdout.flush()
+
+# }}}
+
+# float32 {{{
+
+def run_for_dtype(dtype, backend, n_tile, simulation_length=1e3):
+    sim = region_simulator(backend, n_tile, dtype)
+    sim.run(simulation_length=sim.integrator.dt * 10)
+    tic = time.time()
+    (_, data), = sim.run(simulation_length=simulation_length)
+    return time.time() - tic, data
+
+def drift_report_for_float32():
+    sys.stdout.write('%10s%10s%10s%10s%10s%12s\n' % ('backend', 'n_node', 'float64', 'float32',
+                                                   'speedup', 'max drift'))
+    for backend in ('numpy', 'numba'):
+        for n_tile in (1, 4, 16):
+            # same initial conditions for both, so that drift is due to precision only
+            numpy.random.seed(42)
+            t64, y64 = run_for_dtype('float64', backend, n_tile)
+            numpy.random.seed(42)
+            t32, y32 = run_for_dtype('float32', backend, n_tile)
+            drift = numpy.abs(y64 - y32).max() / numpy.abs(y64).max()
+            sys.stdout.write('%10s%10d%10.2f%10.2f%10.1f%12.2e\n' % (backend, 76 * n_tile, t64, t32,
+                                                                     t64 / t32, drift))
+            sys.stdout.flush()
+
+# }}}
+
+# domain decomposition {{{
+
+def time_for_workers(n_workers, n_tile, simulation_length=1e3):
+    sim = region_simulator('numpy', n_tile, n_workers=n_workers)
+    tic = time.time()
+    sim.run(simulation_length=simulation_length)
+    return time.time() - tic
+
+def scaling_report_for_decomposition(max_workers=None):
+    import multiprocessing
+    max_workers = max_workers or multiprocessing.cpu_count()
+    n_workers = [n for n in (1, 2, 4, 8, 16, 32) if n <= max_workers]
+    sys.stdout.write('%10s' % ('n_node', ) + ''.join('%10d' % (n, ) for n in n_workers) + '\n')
+    for n_tile in (4, 16, 64):
+        sys.stdout.write('%10d' % (76 * n_tile, ))
+        t1 = None
+        for n in n_workers:
+            t = time_for_workers(n, n_tile)
+            t1 = t1 or t
+            # time and speedup relative to a single process
+            sys.stdout.write('%5.1f%5.1f' % (t, t1 / t))
+            sys.stdout.flush()
+        sys.stdout.write('\n')
+
+# }}}
+
+# delay buckets {{{
+
+def coupling_simulator(n_region, speed, engine):
+    from tvb.simulator import simulator
+    from tvb.datatypes.connectivity import Connectivity
+    conn = Connectivity.from_file('connectivity_%d.zip' % (n_region, ))
+    conn.speed = numpy.array([speed])
+    return simulator.Simulator(connectivity=conn, coupling_engine=engine).configure()
+
+def time_for_coupling_engine(sim, n_eval=500):
+    tic = time.time()
+    for step in range(n_eval):
+        sim.coupling(step, sim.history)
+    return (time.time() - tic) / n_eval
+
+def speedup_report_for_delay_buckets():
+    sys.stdout.write('%10s%10s%10s%10s%10s%10s%10s\n' % ('n_region', 'speed', 'n_delay', 'gather',
+                                                         'buckets', 'speedup', 'auto'))
+    for n_region in (66, 68, 76, 96, 192):
+        # faster conduction concentrates connections on fewer delays
+        for speed in (3.0, 30.0, 300.0):
+            sim = coupling_simulator(n_region, speed, 'auto')
+            auto = 'buckets' if sim.history.buckets is not None else 'gather'
+            n_delay = numpy.unique(sim.history.nnz_idelays).size
+            tg, tb = [time_for_coupling_engine(coupling_simulator(n_region, speed, engine))
+                      for engine in ('gather', 'buckets')]
+            sys.stdout.write('%10d%10.1f%10d%10.3f%10.3f%10.1f%10s\n' % (n_region, speed, n_delay, tg * 1e3,
+                                                                       tb * 1e3, tg / tb, auto))
+            sys.stdout.flush()
+
+# }}}
+
+# compiled history {{{
+
+def histories_for_connectivity(n_region, speed=3.0, n_mode=1):
+    from tvb.simulator.history import SparseHistory, CompiledHistory
+    from tvb.datatypes.connectivity import Connectivity
+    conn = Connectivity.from_file('connectivity_%d.zip' % (n_region, ))
+    conn.speed = numpy.array([speed])
+    conn.configure()
+    conn.set_idelays(0.1)
+    init = numpy.random.randn(conn.idelays.max() + 1, 1, n_region, n_mode)
+    histories = []
+    for History in (SparseHistory, CompiledHistory):
+        history = History(conn.weights, conn.idelays, numpy.r_[:1], n_mode)
+        history.initialize(init)
+        histories.append(history)
+    return histories
+
+def time_for_history(history, cfun, n_step=500):
+    state = numpy.random.randn(1, history.n_node, history.n_mode)
+    tic = time.time()
+    for step in range(1, n_step + 1):
+        cfun(step, history)
+        history.update(step, state)
+    return (time.time() - tic) / n_step
+
+def speedup_report_for_compiled_history():
+    from tvb.simulator import coupling
+    from tvb.simulator.history import CompiledHistory
+    if not CompiledHistory.available:
+        print 'compiled history not built, see tvb/_speedups/history.pyx'
+        return
+    sys.stdout.write('%10s%20s%10s%10s%10s\n' % ('n_region', 'coupling', 'numpy', 'compiled', 'speedup'))
+    for n_region in (66, 68, 76, 96, 192):
+        # linear coupling sums in the fused kernel, others gather the delayed state
+        for cfun in (coupling.Linear(), coupling.HyperbolicTangent(), coupling.Difference()):
+            cfun.configure()
+            tn, tc = [time_for_history(history, cfun) for history in histories_for_connectivity(n_region)]
+            sys.stdout.write('%10d%20s%10.3f%10.3f%10.1f\n' % (n_region, type(cfun).__name__, tn * 1e3,
+                                                              tc * 1e3, tn / tc))
+            sys.stdout.flush()
+
+# }}}
+
+# bold {{{
+
+def bold_monitor(surface, hrf_convolution, dt=1.0):
+    from tvb.simulator import simulator, integrators, monitors
+    from tvb.datatypes.connectivity import Connectivity
+    from tvb.datatypes.cortex import Cortex
+    from tvb.datatypes.region_mapping import RegionMapping
+    if surface:
+        surface = Cortex(region_mapping_data=RegionMapping.from_file('regionMapping_16k_76.txt'), load_default=True)
+    sim = simulator.Simulator(connectivity=Connectivity(load_default=True), surface=surface or None,
+                              integrator=integrators.HeunDeterministic(dt=dt),
+                              monitors=monitors.Bold(hrf_convolution=hrf_convolution))
+    return sim.configure().monitors[0]
+
+def time_for_bold(monitor, n_step=20000):
+    state = numpy.random.randn(2, monitor._stock.shape[2], 1)
+    tic = time.time()
+    for step in range(1, n_step + 1):
+        monitor.sample(step, state)
+    return (time.time() - tic) / (n_step * monitor.dt) * 1e3
+
+def report_for_bold_convolution():
+    sys.stdout.write('%10s%12s%12s%10s%12s%12s\n' % ('n_node', 'direct s', 'incr. s', 'speedup',
+                                                      'direct MB', 'incr. MB'))
+    for surface in (False, True):
+        monitors = [bold_monitor(surface, conv) for conv in ('direct', 'incremental')]
+        td, ti = [time_for_bold(monitor) for monitor in monitors]
+        md, mi = [(monitor._stock.nbytes + monitor._interim_stock.nbytes) / 2.0**20 for monitor in monitors]
+        sys.stdout.write('%10d%12.3f%12.3f%10.1f%12.1f%12.1f\n' % (monitors[0]._stock.shape[2], td, ti,
+                                                                   td / ti, md, mi))
+        sys.stdout.flush()
+
+# }}}
+
+# monitor graph {{{
+
+def four_monitor_simulator(surface, shared):
+    from tvb.simulator import simulator, integrators, monitors
+    from tvb.datatypes.connectivity import Connectivity
+    from tvb.datatypes.cortex import Cortex
+    from tvb.datatypes.region_mapping import RegionMapping
+    if surface:
+        surface = Cortex(region_mapping_data=RegionMapping.from_file('regionMapping_16k_76.txt'), load_default=True)
+    eeg = monitors.EEG.from_file()
+    eeg.period = 1.0
+    sim = simulator.Simulator(connectivity=Connectivity(load_default=True), surface=surface or None,
+                              integrator=integrators.HeunDeterministic(dt=0.1),
+                              monitors=(monitors.TemporalAverage(period=1.0), monitors.SpatialAverage(period=1.0),
+                                        monitors.Bold(), eeg))
+    sim.configure()
+    if not shared:
+        # each monitor computes its own pipeline, as if none were shared
+        sim._reduction_graph = None
+        for monitor in sim.monitors:
+            monitor.config_for_sim(sim)
+    return sim
+
+def time_for_monitors(sim, n_step=5000):
+    state = numpy.random.randn(*sim.current_state.shape)
+    tic = time.time()
+    for step in range(1, n_step + 1):
+        sim._loop_monitor_output(step, state)
+    return (time.time() - tic) / (n_step * sim.integrator.dt) * 1e3
+
+def report_for_monitor_graph():
+    sys.stdout.write('%10s%12s%12s%10s\n' % ('n_node', 'separate s', 'shared s', 'speedup'))
+    for surface in (False, True):
+        sims = [four_monitor_simulator(surface, shared) for shared in (False, True)]
+        ts, tg = [time_for_monitors(sim) for sim in sims]
+        sys.stdout.write('%10d%12.3f%12.3f%10.1f\n' % (sims[0].number_of_nodes, ts, tg, ts / tg))
+        sys.stdout.flush()
+
+# }}}
+
 def eps_report_for_components(comps, eps_func):
     n_nodes = [2 << i for i in range(14)]
     sys.stdout.write('%30s' % ('n_node',))
@@ -121,5 +357,20 @@ if __name__ == '__main__':
     from tvb.simulator.integrators import RungeKutta4thOrderDeterministic
     integs = list(integrators()) + [RungeKutta4thOrderDeterministic]
     eps_report_for_components(integs, eps_for_Integrator)
+    print 'benchmarking fused loop, 1 s of simulation time, in s'
+    speedup_report_for_fused_loop()
+    print 'benchmarking float32, 1 s of simulation time, in s, with drift relative to float64'
+    drift_report_for_float32()
+    print 'benchmarking domain decomposition, 1 s of simulation time, in s and speedup per worker count'
+    scaling_report_for_decomposition()
+    print 'benchmarking delay buckets against gathering from the sparse history, in ms per coupling evaluation'
+    speedup_report_for_delay_buckets()
+    print 'benchmarking the compiled history against NumPy, in ms per coupling evaluation and update'
+    speedup_report_for_compiled_history()
+    print 'benchmarking the Bold HRF convolution, in s per simulated second and MB of stock'
+    report_for_bold_convolution()
+    print 'benchmarking a shared monitor reduction graph against separate monitors, TemporalAverage, '\
+          'SpatialAverage, Bold and EEG, in s per simulated second'
+    report_for_monitor_graph()
 
 # vim: sw=4 sts=4 ai et foldmethod=marker
@@ -44,6 +44,16 @@ TVB_TEAM = "Stuart Knock, Marmaduke Woodman, Paula Sanz Leon, Jan Fousek, Lia Do
            "Bogdan Neacsa, Laurent Pezard, Jochen Mersmann, Anthony R McIntosh, Viktor Jirsa"
 TVB_INSTALL_REQUIREMENTS = []
 
+# the compiled history kernels are optional, the simulator falls back on NumPy without them
+try:
+    import numpy
+    from Cython.Build import cythonize
+    EXTENSIONS = cythonize([Extension('tvb._speedups.history', [os.path.join('tvb', '_speedups', 'history.pyx')],
+                                      include_dirs=[numpy.get_include()])],
+                           language_level='3str')
+except ImportError:
+    EXTENSIONS = []
+
 setuptools.setup(
     name='tvb',
     description='A package for performing whole brain simulations',
@@ -55,6 +65,7 @@ setuptools.setup(
     author_email='tvb-users@googlegroups.com',
     include_package_data=True,
     install_requires=TVB_INSTALL_REQUIREMENTS,
+    ext_modules=EXTENSIONS,
     long_description="""
 This package contains the scientific library from the Virtual Brain 
 project which provides data handling and numerical routines 
@@ -155,3 +155,121 @@ def get_state_with_mask(np.ndarray[double, ndim=4, mode="c"] history not None,
                 for m in range(modes):
                     h = history[delay, cvar_idx, nd, m]
                     delayed_states[ns, cv, nd, m] = h
+
+
+# Kernels of the sparse history, see tvb.simulator.history.CompiledHistory, with
+# a (time, cvar, node, mode) buffer in which the state of step t is at t % n_time.
+# Index arrays are checked once by the history, so kernels only check shapes.
+
+ctypedef fused buffer_t:
+    float
+    double
+
+ctypedef fused state_t:
+    float
+    double
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def update(buffer_t[:, :, :, ::1] buffer not None,
+           long step,
+           const int[::1] cvars not None,
+           const state_t[:, :, :] new_state not None
+           ):
+    """
+    Store the coupling variables of new_state, of shape (n_svar, n_node,
+    n_mode), in the buffer's slice for step.
+    """
+    cdef Py_ssize_t n_time = buffer.shape[0], n_cvar = buffer.shape[1]
+    cdef Py_ssize_t n_node = buffer.shape[2], n_mode = buffer.shape[3]
+    cdef Py_ssize_t t, c, j, m, cvar
+    if cvars.shape[0] != n_cvar or new_state.shape[1] != n_node or new_state.shape[2] != n_mode:
+        raise ValueError('State of shape (%d, %d, %d) does not match buffer of shape (%d, %d, %d, %d).'
+                         % (new_state.shape[0], new_state.shape[1], new_state.shape[2],
+                            n_time, n_cvar, n_node, n_mode))
+    for c in range(n_cvar):
+        if not 0 <= cvars[c] < new_state.shape[0]:
+            raise IndexError('Coupling variable %d out of range for %d state variables.'
+                             % (cvars[c], new_state.shape[0]))
+    t = step % n_time
+    with nogil:
+        for c in range(n_cvar):
+            cvar = cvars[c]
+            for j in range(n_node):
+                for m in range(n_mode):
+                    buffer[t, c, j, m] = new_state[cvar, j, m]
+
+
+cdef inline Py_ssize_t _time_index(long step, int delay, Py_ssize_t n_time) nogil:
+    cdef long t = (step - 1 - delay) % n_time
+    if t < 0:
+        t += n_time
+    return t
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def query_sparse(const buffer_t[:, :, :, ::1] buffer not None,
+                 long step,
+                 const int[::1] idelays not None,
+                 const int[::1] col not None,
+                 buffer_t[:, :, ::1] delayed_state not None
+                 ):
+    """
+    Gather the delayed state of each connection, from node col[k] delayed
+    by idelays[k] steps before step - 1, into delayed_state of shape
+    (n_cvar, n_connection, n_mode).
+    """
+    cdef Py_ssize_t n_time = buffer.shape[0], n_cvar = buffer.shape[1], n_mode = buffer.shape[3]
+    cdef Py_ssize_t n_conn = idelays.shape[0]
+    cdef Py_ssize_t t, c, k, m, j
+    if (col.shape[0] != n_conn or delayed_state.shape[0] != n_cvar or delayed_state.shape[1] != n_conn
+            or delayed_state.shape[2] != n_mode):
+        raise ValueError('Delayed state and connections do not match the buffer.')
+    with nogil:
+        for c in range(n_cvar):
+            for k in range(n_conn):
+                t = _time_index(step, idelays[k], n_time)
+                j = col[k]
+                for m in range(n_mode):
+                    delayed_state[c, k, m] = buffer[t, c, j, m]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def weighted_sum(const buffer_t[:, :, :, ::1] buffer not None,
+                 long step,
+                 const int[::1] idelays not None,
+                 const int[::1] col not None,
+                 const buffer_t[::1] weights not None,
+                 const int[::1] indptr not None,
+                 buffer_t[:, :, ::1] out not None
+                 ):
+    """
+    Sum the delayed state over the afferent connections of each node, weighted,
+    into out of shape (n_cvar, n_node, n_mode), without gathering the delayed
+    state of each connection first. The connections of node i are those from
+    indptr[i] to indptr[i + 1]. Sums are accumulated in double precision.
+    """
+    cdef Py_ssize_t n_time = buffer.shape[0], n_cvar = buffer.shape[1], n_mode = buffer.shape[3]
+    cdef Py_ssize_t n_conn = idelays.shape[0], n_row = indptr.shape[0] - 1
+    cdef Py_ssize_t t, c, i, k, m, j
+    cdef double acc
+    if (col.shape[0] != n_conn or weights.shape[0] != n_conn or n_row < 0 or out.shape[0] != n_cvar
+            or out.shape[1] != n_row or out.shape[2] != n_mode):
+        raise ValueError('Output and connections do not match the buffer.')
+    if indptr[0] != 0 or indptr[n_row] != n_conn:
+        raise IndexError('Row pointers do not cover the %d connections.' % (n_conn, ))
+    with nogil:
+        for c in range(n_cvar):
+            for i in range(n_row):
+                for m in range(n_mode):
+                    acc = 0.0
+                    for k in range(indptr[i], indptr[i + 1]):
+                        t = _time_index(step, idelays[k], n_time)
+                        j = col[k]
+                        acc = acc + weights[k] * buffer[t, c, j, m]
+                    out[c, i, m] = acc
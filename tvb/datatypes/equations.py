@@ -197,7 +197,15 @@ class TemporalApplicableEquation(Equation):
     Abstract class introduced just for filtering what equations to be displayed in UI,
     for setting the temporal component in Stimulus on region and surface.
     """
-    pass
+
+    def evaluate_time_chunk(self, start, stop, dt, n_time):
+        """
+        Evaluate the pattern at time points ``start`` to ``stop`` of the time
+        vector ``numpy.arange(n_time) * dt``, with the same values as setting
+        the pattern for the whole vector, but without creating it.
+        """
+        self.pattern = (numpy.arange(start, stop) * dt).reshape((1, -1))
+        return self.pattern
 
 
 class FiniteSupportEquation(TemporalApplicableEquation):
@@ -436,6 +444,28 @@ class PulseTrain(TemporalApplicableEquation):
 
     pattern = property(fget=_get_pattern, fset=_set_pattern)
 
+    def evaluate_time_chunk(self, start, stop, dt, n_time):
+        """
+        Evaluate the pattern at time points ``start`` to ``stop`` of the time
+        vector ``numpy.arange(n_time) * dt``, reproducing the roll of the whole
+        vector applied by setting the pattern.
+        """
+        onset = self.parameters["onset"]
+        # number of time points before onset
+        n_off = int(numpy.ceil(onset / dt))
+        while n_off > 0 and (n_off - 1) * dt >= onset:
+            n_off -= 1
+        while n_off * dt < onset:
+            n_off += 1
+        n_off = min(n_off, n_time)
+        index = numpy.arange(start, stop).reshape((1, -1))
+        off = index < n_off
+        var = ((index - n_off - 1) % n_time) * dt
+        var[..., off] = 0.0
+        self._pattern = numexpr.evaluate(self.equation, global_dict=self.parameters)
+        self._pattern[..., off] = 0.0
+        return self._pattern
+
 
 class HRFKernelEquation(Equation):
     "Base class for hemodynamic response functions."
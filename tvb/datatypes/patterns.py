@@ -38,6 +38,7 @@ methods that are associated with the pattern datatypes.
 """
 
 
+import collections
 import numpy
 from tvb.basic.traits import types_basic as basic, types_mapped
 from tvb.datatypes import arrays, surfaces, volumes, connectivity, equations
@@ -86,6 +87,54 @@ class SpatioTemporalCall(object):
         return pattern
 
 
+class ChunkedTemporalPattern(object):
+    """
+    Temporal pattern over the time vector ``numpy.arange(n_time) * dt``, which
+    evaluates the temporal equation for chunks of time points as they are
+    indexed, keeping at most ``cache_size`` chunks, such that its memory does
+    not depend on the length of the time vector.
+    """
+
+    def __init__(self, equation, dt, n_time, chunk_size=4096, cache_size=2):
+        self.equation = equation
+        self.dt = dt
+        self.n_time = n_time
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self._chunks = collections.OrderedDict()
+
+    @property
+    def shape(self):
+        return 1, self.n_time
+
+    def _chunk(self, i_chunk):
+        if i_chunk not in self._chunks:
+            start = i_chunk * self.chunk_size
+            stop = min(start + self.chunk_size, self.n_time)
+            chunk = self.equation.evaluate_time_chunk(start, stop, self.dt, self.n_time)
+            self._chunks[i_chunk] = numpy.reshape(chunk, (-1, ))
+            while len(self._chunks) > self.cache_size:
+                self._chunks.popitem(last=False)
+        return self._chunks[i_chunk]
+
+    def __getitem__(self, index):
+        "Index like the (1, n_time) array of the temporal pattern."
+        if isinstance(index, tuple) and len(index) == 2 and isinstance(index[1], (int, numpy.integer)):
+            t = int(index[1])
+            if t < 0:
+                t += self.n_time
+            if not 0 <= t < self.n_time:
+                raise IndexError('index %d is out of bounds for %d time points' % (index[1], self.n_time))
+            i_chunk, i = divmod(t, self.chunk_size)
+            return self._chunk(i_chunk)[i]
+        return numpy.asarray(self)[index]
+
+    def __array__(self, dtype=None):
+        "Evaluate the whole pattern."
+        pattern = self.equation.evaluate_time_chunk(0, self.n_time, self.dt, self.n_time)
+        return numpy.asarray(pattern, dtype=dtype).reshape(self.shape)
+
+
 class SpatialPattern(types_mapped.MappedType):
     """
     Equation for space variation.
@@ -175,6 +224,14 @@ class SpatioTemporalPattern(SpatialPattern, SpatioTemporalCall):
         self.time = time
         self.temporal_pattern = self.time
 
+    def configure_time_chunked(self, dt, n_time, chunk_size=4096, cache_size=2):
+        """
+        Set up the temporal pattern for the time vector ``numpy.arange(n_time) * dt``
+        to be evaluated lazily in chunks of time points, see ChunkedTemporalPattern.
+        """
+        self.time = None
+        self._temporal_pattern = ChunkedTemporalPattern(self.temporal, dt, n_time, chunk_size, cache_size)
+
 
 class StimuliRegion(SpatioTemporalPattern):
     """
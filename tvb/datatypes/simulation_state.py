@@ -33,9 +33,16 @@ DataType for storing a simulator's state in files and as DB reference.
 .. moduleauthor:: Lia Domide <lia.domide@codemart.ro>
 """
 
+import numpy
 import tvb.basic.traits.types_basic as basic
 import tvb.datatypes.arrays as arrays
 from tvb.basic.traits.types_mapped import MappedType
+from tvb.basic.logger.builder import get_logger
+from tvb.simulator.monitors import TemporalAverage
+from tvb.simulator.simulator import Simulator
+
+
+LOG = get_logger(__name__)
 
 
 class SimulationState(MappedType):
@@ -70,6 +77,108 @@ class SimulationState(MappedType):
     monitor_stock_14 = arrays.FloatArray(required=False)
     monitor_stock_15 = arrays.FloatArray(required=False)
 
+    # Number of steps summed so far in the current period of each monitor.
+    monitor_window_count_1 = arrays.IntegerArray(required=False)
+    monitor_window_count_2 = arrays.IntegerArray(required=False)
+    monitor_window_count_3 = arrays.IntegerArray(required=False)
+    monitor_window_count_4 = arrays.IntegerArray(required=False)
+    monitor_window_count_5 = arrays.IntegerArray(required=False)
+    monitor_window_count_6 = arrays.IntegerArray(required=False)
+    monitor_window_count_7 = arrays.IntegerArray(required=False)
+    monitor_window_count_8 = arrays.IntegerArray(required=False)
+    monitor_window_count_9 = arrays.IntegerArray(required=False)
+    monitor_window_count_10 = arrays.IntegerArray(required=False)
+    monitor_window_count_11 = arrays.IntegerArray(required=False)
+    monitor_window_count_12 = arrays.IntegerArray(required=False)
+    monitor_window_count_13 = arrays.IntegerArray(required=False)
+    monitor_window_count_14 = arrays.IntegerArray(required=False)
+    monitor_window_count_15 = arrays.IntegerArray(required=False)
+
+    # Last step summed by each monitor, which a continued run observes again.
+    monitor_window_step_1 = arrays.IntegerArray(required=False)
+    monitor_window_step_2 = arrays.IntegerArray(required=False)
+    monitor_window_step_3 = arrays.IntegerArray(required=False)
+    monitor_window_step_4 = arrays.IntegerArray(required=False)
+    monitor_window_step_5 = arrays.IntegerArray(required=False)
+    monitor_window_step_6 = arrays.IntegerArray(required=False)
+    monitor_window_step_7 = arrays.IntegerArray(required=False)
+    monitor_window_step_8 = arrays.IntegerArray(required=False)
+    monitor_window_step_9 = arrays.IntegerArray(required=False)
+    monitor_window_step_10 = arrays.IntegerArray(required=False)
+    monitor_window_step_11 = arrays.IntegerArray(required=False)
+    monitor_window_step_12 = arrays.IntegerArray(required=False)
+    monitor_window_step_13 = arrays.IntegerArray(required=False)
+    monitor_window_step_14 = arrays.IntegerArray(required=False)
+    monitor_window_step_15 = arrays.IntegerArray(required=False)
+
+    # Rounding compensation of the running sums of monitors summing with Kahan compensation.
+    monitor_window_compensation_1 = arrays.FloatArray(required=False)
+    monitor_window_compensation_2 = arrays.FloatArray(required=False)
+    monitor_window_compensation_3 = arrays.FloatArray(required=False)
+    monitor_window_compensation_4 = arrays.FloatArray(required=False)
+    monitor_window_compensation_5 = arrays.FloatArray(required=False)
+    monitor_window_compensation_6 = arrays.FloatArray(required=False)
+    monitor_window_compensation_7 = arrays.FloatArray(required=False)
+    monitor_window_compensation_8 = arrays.FloatArray(required=False)
+    monitor_window_compensation_9 = arrays.FloatArray(required=False)
+    monitor_window_compensation_10 = arrays.FloatArray(required=False)
+    monitor_window_compensation_11 = arrays.FloatArray(required=False)
+    monitor_window_compensation_12 = arrays.FloatArray(required=False)
+    monitor_window_compensation_13 = arrays.FloatArray(required=False)
+    monitor_window_compensation_14 = arrays.FloatArray(required=False)
+    monitor_window_compensation_15 = arrays.FloatArray(required=False)
+
+    # Running sum of the interim period of Bold monitors.
+    monitor_interim_stock_1 = arrays.FloatArray(required=False)
+    monitor_interim_stock_2 = arrays.FloatArray(required=False)
+    monitor_interim_stock_3 = arrays.FloatArray(required=False)
+    monitor_interim_stock_4 = arrays.FloatArray(required=False)
+    monitor_interim_stock_5 = arrays.FloatArray(required=False)
+    monitor_interim_stock_6 = arrays.FloatArray(required=False)
+    monitor_interim_stock_7 = arrays.FloatArray(required=False)
+    monitor_interim_stock_8 = arrays.FloatArray(required=False)
+    monitor_interim_stock_9 = arrays.FloatArray(required=False)
+    monitor_interim_stock_10 = arrays.FloatArray(required=False)
+    monitor_interim_stock_11 = arrays.FloatArray(required=False)
+    monitor_interim_stock_12 = arrays.FloatArray(required=False)
+    monitor_interim_stock_13 = arrays.FloatArray(required=False)
+    monitor_interim_stock_14 = arrays.FloatArray(required=False)
+    monitor_interim_stock_15 = arrays.FloatArray(required=False)
+
+    # Running sum over the nodes of Projection monitors which project once per sample.
+    monitor_node_sum_1 = arrays.FloatArray(required=False)
+    monitor_node_sum_2 = arrays.FloatArray(required=False)
+    monitor_node_sum_3 = arrays.FloatArray(required=False)
+    monitor_node_sum_4 = arrays.FloatArray(required=False)
+    monitor_node_sum_5 = arrays.FloatArray(required=False)
+    monitor_node_sum_6 = arrays.FloatArray(required=False)
+    monitor_node_sum_7 = arrays.FloatArray(required=False)
+    monitor_node_sum_8 = arrays.FloatArray(required=False)
+    monitor_node_sum_9 = arrays.FloatArray(required=False)
+    monitor_node_sum_10 = arrays.FloatArray(required=False)
+    monitor_node_sum_11 = arrays.FloatArray(required=False)
+    monitor_node_sum_12 = arrays.FloatArray(required=False)
+    monitor_node_sum_13 = arrays.FloatArray(required=False)
+    monitor_node_sum_14 = arrays.FloatArray(required=False)
+    monitor_node_sum_15 = arrays.FloatArray(required=False)
+
+    # Running sum over the sensors of Projection monitors which project every step.
+    monitor_state_1 = arrays.FloatArray(required=False)
+    monitor_state_2 = arrays.FloatArray(required=False)
+    monitor_state_3 = arrays.FloatArray(required=False)
+    monitor_state_4 = arrays.FloatArray(required=False)
+    monitor_state_5 = arrays.FloatArray(required=False)
+    monitor_state_6 = arrays.FloatArray(required=False)
+    monitor_state_7 = arrays.FloatArray(required=False)
+    monitor_state_8 = arrays.FloatArray(required=False)
+    monitor_state_9 = arrays.FloatArray(required=False)
+    monitor_state_10 = arrays.FloatArray(required=False)
+    monitor_state_11 = arrays.FloatArray(required=False)
+    monitor_state_12 = arrays.FloatArray(required=False)
+    monitor_state_13 = arrays.FloatArray(required=False)
+    monitor_state_14 = arrays.FloatArray(required=False)
+    monitor_state_15 = arrays.FloatArray(required=False)
+
 
     def __init__(self, **kwargs):
         """ 
@@ -85,12 +194,19 @@ class SimulationState(MappedType):
         """
         self.history = simulator_algorithm.history.buffer.copy()
         self.current_step = simulator_algorithm.current_step
-        self.current_state = simulator_algorithm.current_state
+        self.current_state = simulator_algorithm.current_state.copy()
 
         for i, monitor in enumerate(simulator_algorithm.monitors):
             field_name = "monitor_stock_" + str(i + 1)
-            setattr(self, field_name, monitor._stock)
+            setattr(self, field_name, monitor._stock.copy())
+            for attr in Simulator._monitor_state_attrs[1:]:
+                value = monitor.__dict__.get(attr)
+                if isinstance(value, numpy.ndarray):
+                    setattr(self, "monitor%s_%d" % (attr, i + 1), value.copy())
 
+            if not hasattr(self, "set_metadata"):
+                # metadata is only stored by the framework's storage
+                continue
             if hasattr(monitor, "_ui_name"):
                 self.set_metadata({'monitor_name': monitor._ui_name}, field_name)
             else:
@@ -106,7 +222,36 @@ class SimulationState(MappedType):
         simulator_algorithm.current_state = self.current_state
 
         for i, monitor in enumerate(simulator_algorithm.monitors):
-            monitor._stock = getattr(self, "monitor_stock_" + str(i + 1))
-  
-    
- 
\ No newline at end of file
+            self._fill_stock(monitor, getattr(self, "monitor_stock_" + str(i + 1)))
+            for attr in Simulator._monitor_state_attrs[1:]:
+                value = monitor.__dict__.get(attr)
+                stored = numpy.asarray(getattr(self, "monitor%s_%d" % (attr, i + 1)))
+                if not isinstance(value, numpy.ndarray) or stored.size == 0:
+                    # not part of the monitor's state, or stored before it was
+                    continue
+                if stored.shape != value.shape:
+                    raise ValueError("Stored %s of shape %r does not match the %r one of %s."
+                                     % (attr, stored.shape, value.shape, monitor))
+                value[...] = stored
+
+
+    def _fill_stock(self, monitor, stored):
+        """
+        Restore the stock of a monitor in place, as it may be shared with other
+        monitors, converting the stock of a temporal average stored before it
+        kept a running sum, of one row per step of its period.
+        """
+        stock = monitor._stock
+        stored = numpy.asarray(stored)
+        if stored.shape == stock.shape:
+            stock[...] = stored
+        elif isinstance(monitor, TemporalAverage) and stored.shape == (monitor.istep, ) + stock.shape:
+            # rows of the steps of the current period which have been seen
+            n_seen = self.current_step % monitor.istep
+            stock[...] = stored[:n_seen].sum(axis=0)
+            monitor._window_count[0] = n_seen
+            LOG.info("Converted %s stock of %d steps to a running sum.", monitor, monitor.istep)
+        else:
+            raise ValueError("Stored stock of shape %r does not match the %r stock of %s, it may have been "
+                             "stored with a different version or configuration of the monitor."
+                             % (stored.shape, stock.shape, monitor))
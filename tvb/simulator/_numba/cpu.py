@@ -0,0 +1,302 @@
+
+"""
+Fused CPU loop for region simulations.
+
+The history update, delayed sparse coupling, model dfun and integration scheme
+of each time step are compiled into a single loop, parallelized over nodes,
+which runs a chunk of time steps per call and writes the state of every step
+to an output array, from which the simulator feeds its monitors as usual.
+
+"""
+
+import math
+import numpy
+import numba
+from numba import prange
+from tvb.simulator import coupling, integrators, noise
+from tvb.simulator.common import get_logger
+from tvb.simulator.history import RaggedHistory
+from tvb.simulator.models.base import ModelNumbaDfun
+
+
+LOG = get_logger(__name__)
+
+
+# pre- & post-summation coupling functions, with parameters passed as an array
+
+@numba.njit(inline='always')
+def _cfe_pre_xj(xi, xj, cp):
+    return xj
+
+
+@numba.njit(inline='always')
+def _cfe_pre_difference(xi, xj, cp):
+    return xj - xi
+
+
+@numba.njit(inline='always')
+def _cfe_pre_tanh(xi, xj, cp):
+    return cp[0] * (1 + math.tanh((cp[1] * xj - cp[2]) / cp[3]))
+
+
+@numba.njit(inline='always')
+def _cfe_post_identity(gx, cp):
+    return gx
+
+
+@numba.njit(inline='always')
+def _cfe_post_scaling(gx, cp):
+    return cp[0] * gx
+
+
+@numba.njit(inline='always')
+def _cfe_post_linear(gx, cp):
+    return cp[0] * gx + cp[1]
+
+
+# coupling class -> pre, post, parameter names
+_cfes = {
+    coupling.Linear: (_cfe_pre_xj, _cfe_post_linear, ('a', 'b')),
+    coupling.Scaling: (_cfe_pre_xj, _cfe_post_scaling, ('a', )),
+    coupling.HyperbolicTangent: (_cfe_pre_tanh, _cfe_post_identity, ('a', 'b', 'midpoint', 'sigma')),
+    coupling.Difference: (_cfe_pre_difference, _cfe_post_scaling, ('a', )),
+}
+
+
+def make_node_dfun(kernel, n_param):
+    "Construct per-node dfun passing the rows of a parameter array to a model kernel."
+    ns = {'kernel': numba.njit(inline='always')(kernel)}
+    template = "def node_dfun(x, c, p, i, dx):\n    kernel(x, c, %s, dx)"
+    # 1-tuples index like the gufunc's scalar arguments, without creating array views
+    exec(template % ', '.join('(p[%d, i], )' % j for j in range(n_param)), ns)
+    return numba.njit(inline='always')(ns['node_dfun'])
+
+
+def make_euler(dfun, n_svar, stochastic):
+    "Construct per-node Euler scheme."
+
+    @numba.njit(inline='always')
+    def scheme(x, c, p, i, z, k, dt):
+        dfun(x, c, p, i, k[0])
+        for j in range(n_svar):
+            if stochastic:
+                x[j] = x[j] + k[0, j] * dt + z[j]
+            else:
+                x[j] = x[j] + dt * k[0, j]
+
+    return scheme
+
+
+def make_heun(dfun, n_svar, stochastic):
+    "Construct per-node Heun scheme."
+
+    @numba.njit(inline='always')
+    def scheme(x, c, p, i, z, k, dt):
+        dfun(x, c, p, i, k[0])
+        for j in range(n_svar):
+            if stochastic:
+                k[4, j] = x[j] + dt * k[0, j] + z[j]
+            else:
+                k[4, j] = x[j] + dt * k[0, j]
+        dfun(k[4], c, p, i, k[1])
+        for j in range(n_svar):
+            dx = (k[0, j] + k[1, j]) * dt / 2.0
+            if stochastic:
+                x[j] = x[j] + dx + z[j]
+            else:
+                x[j] = x[j] + dx
+
+    return scheme
+
+
+def make_rk4(dfun, n_svar, stochastic):
+    "Construct per-node Runge-Kutta 4th order scheme."
+
+    @numba.njit(inline='always')
+    def scheme(x, c, p, i, z, k, dt):
+        dt2 = dt / 2.0
+        dt6 = dt / 6.0
+        dfun(x, c, p, i, k[0])
+        for j in range(n_svar):
+            k[4, j] = x[j] + dt2 * k[0, j]
+        dfun(k[4], c, p, i, k[1])
+        for j in range(n_svar):
+            k[4, j] = x[j] + dt2 * k[1, j]
+        dfun(k[4], c, p, i, k[2])
+        for j in range(n_svar):
+            k[4, j] = x[j] + dt * k[2, j]
+        dfun(k[4], c, p, i, k[3])
+        for j in range(n_svar):
+            x[j] = x[j] + dt6 * (k[0, j] + 2.0 * k[1, j] + 2.0 * k[2, j] + k[3, j])
+
+    return scheme
+
+
+# integrator class -> scheme constructor, stochastic
+_schemes = {
+    integrators.EulerDeterministic: (make_euler, False),
+    integrators.EulerStochastic: (make_euler, True),
+    integrators.HeunDeterministic: (make_heun, False),
+    integrators.HeunStochastic: (make_heun, True),
+    integrators.RungeKutta4thOrderDeterministic: (make_rk4, False),
+}
+
+
+def make_loop(scheme, cfpre, cfpost, n_svar, n_cvar, stochastic):
+    "Construct fused loop over time steps for given scheme and coupling functions."
+
+    @numba.njit(parallel=True)
+    def loop(step0, X, out, noise, buf, cvars, indptr, col, idelays, weights, cp, p, dt):
+        n_node = X.shape[0]
+        n_time = buf.shape[0]
+        # flat indexing of the (time, cvar, node, mode) buffer, with a single mode
+        flat_buf = buf.reshape(-1)
+        time_stride = n_cvar * n_node
+        c = numpy.empty((n_node, n_cvar))
+        k = numpy.empty((n_node, 5, n_svar))
+        for t in range(out.shape[0]):
+            step = step0 + t
+            t_now = (step - 1) % n_time
+            t_noise = t if stochastic else 0
+            for i in prange(n_node):
+                # delayed coupling over afferents, evaluated like Coupling
+                for ic in range(n_cvar):
+                    gx = 0.0
+                    for jj in range(indptr[i], indptr[i + 1]):
+                        j = col[jj]
+                        # wrap without a modulo or branch per connection
+                        t_del = t_now - idelays[jj]
+                        t_del += n_time * (t_del < 0)
+                        xi = flat_buf[t_now * time_stride + ic * n_node + i]
+                        xj = flat_buf[t_del * time_stride + ic * n_node + j]
+                        gx += weights[jj] * cfpre(xi, xj, cp)
+                    c[i, ic] = cfpost(gx, cp)
+                scheme(X[i], c[i], p, i, noise[t_noise, :, i], k[i], dt)
+            # history update once all nodes have read the buffer for this step
+            for i in prange(n_node):
+                for ic in range(n_cvar):
+                    buf[step % n_time, ic, i, 0] = X[i, cvars[ic]]
+                for j in range(n_svar):
+                    out[t, j, i, 0] = X[i, j]
+
+    return loop
+
+
+# compiled loops, keyed by model kernel, coupling, scheme & sizes
+_loops = {}
+
+
+class FusedRegionLoop(object):
+    """
+    Compiled integration loop for a configured region simulator.
+
+    Models must provide a Numba kernel (see ``ModelNumbaDfun._numba_kernel``),
+    the coupling must be one of Linear, Scaling, HyperbolicTangent or
+    Difference with scalar parameters and the integrator one of the Euler,
+    Heun or Runge-Kutta 4th order schemes, stochastic schemes requiring
+    additive noise.  Noise is drawn from the integrator's noise per chunk of
+    time steps, in the same order as the NumPy loop.
+
+    """
+
+    chunk_size = 256
+
+    def __init__(self, sim):
+        self.sim = sim
+        self._check_supported()
+        model, history = sim.model, sim.history
+        self.kernel_parameters = model._numba_kernel_parameters()
+        cfpre, cfpost, self.coupling_parameters = _cfes[type(sim.coupling)]
+        make_scheme, self.stochastic = _schemes[type(sim.integrator)]
+        n_svar, n_cvar = model.nvar, history.n_cvar
+        key = (model._numba_kernel(), len(self.kernel_parameters), type(sim.coupling),
+               type(sim.integrator), n_svar, n_cvar)
+        if key not in _loops:
+            LOG.info('compiling fused loop for %s, %s and %s', type(model).__name__,
+                     type(sim.coupling).__name__, type(sim.integrator).__name__)
+            dfun = make_node_dfun(model._numba_kernel(), len(self.kernel_parameters))
+            scheme = make_scheme(dfun, n_svar, self.stochastic)
+            _loops[key] = make_loop(scheme, cfpre, cfpost, n_svar, n_cvar, self.stochastic)
+        self.loop = _loops[key]
+        # afferent connections of each node in compressed sparse row form
+        n_node = history.n_batch_node
+        self.indptr = numpy.searchsorted(history.nnz_row_el_idx, numpy.r_[:n_node + 1])
+
+    def _check_supported(self):
+        sim = self.sim
+        msg = None
+        if sim.surface is not None:
+            msg = 'surface simulations'
+        elif sim.stimulus is not None:
+            msg = 'stimuli'
+        elif (not isinstance(sim.model, ModelNumbaDfun) or sim.model._numba_kernel() is None
+              or sim.model._numba_kernel_parameters() is None):
+            msg = 'the %s model' % (type(sim.model).__name__, )
+        elif isinstance(sim.history, RaggedHistory):
+            msg = 'ragged histories'
+        elif sim.model.number_of_modes != 1:
+            msg = 'models with several modes'
+        elif type(sim.coupling) not in _cfes:
+            msg = 'the %s coupling' % (type(sim.coupling).__name__, )
+        elif type(sim.integrator) not in _schemes:
+            msg = 'the %s integrator' % (type(sim.integrator).__name__, )
+        elif sim.integrator.clamped_state_variable_values is not None:
+            msg = 'clamped state variables'
+        elif (isinstance(sim.integrator, integrators.IntegratorStochastic)
+              and not isinstance(sim.integrator.noise, noise.Additive)):
+            msg = 'non-additive noise'
+        if msg is not None:
+            raise NotImplementedError('The fused loop does not support %s.' % (msg, ))
+
+    def _parameters(self):
+        "Evaluate coupling & per-node model parameter arrays."
+        sim, n_node = self.sim, self.indptr.size - 1
+        cp = []
+        for name in self.coupling_parameters:
+            value = numpy.asarray(getattr(sim.coupling, name), numpy.float64).reshape(-1)
+            if value.size != 1:
+                raise NotImplementedError('The fused loop requires scalar coupling parameters, '
+                                          'but %s has size %d.' % (name, value.size))
+            cp.append(value[0])
+        p = numpy.empty((len(self.kernel_parameters), n_node))
+        for i, value in enumerate(self.kernel_parameters):
+            value = numpy.asarray(value, numpy.float64).reshape(-1)
+            if value.size not in (1, n_node):
+                raise ValueError('Model parameter of size %d does not match %d nodes.' % (value.size, n_node))
+            p[i] = value
+        return numpy.array(cp), p
+
+    def _generate_noise(self, n_step, shape, dtype=numpy.float64):
+        "Draw noise for a chunk of time steps, as the stochastic schemes would."
+        if not self.stochastic:
+            return numpy.zeros((1, ) + shape[:2], dtype)
+        integ = self.sim.integrator
+        z = numpy.empty((n_step, ) + shape[:2], dtype)
+        for t in range(n_step):
+            z_t = integ.noise.generate(shape)
+            z_t *= integ.noise.gfun(None)
+            z[t] = z_t[..., 0]
+        return z
+
+    def __call__(self, step, n_step, state, align=0):
+        """
+        Generate the step and state of each of n_step time steps from given step
+        and state. If align is given, chunks end on multiples of align steps, where
+        history and random stream are up to date, e.g. for checkpoints.
+
+        """
+        history, dt = self.sim.history, self.sim.integrator.dt
+        cp, p = self._parameters()
+        X = state[..., 0].T.copy()
+        while n_step > 0:
+            n = min(n_step, self.chunk_size)
+            if align:
+                n = min(n, align - (step - 1) % align)
+            out = numpy.empty((n, ) + state.shape, state.dtype)
+            z = self._generate_noise(n, state.shape, state.dtype)
+            self.loop(step, X, out, z, history.buffer, history.cvars, self.indptr, history.nnz_col_el_idx,
+                      history.nnz_idelays, history.nnz_weights, cp, p, dt)
+            for t in range(n):
+                yield step + t, out[t]
+            step += n
+            n_step -= n
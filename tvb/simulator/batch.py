@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Batched parameter sweeps, integrating several instances of the same network
+in a single simulation loop.
+
+Each batch member is a copy of the network with its own parameter values and
+random stream. The members are stacked along the node axis, so that history,
+coupling, model, integrator and node-wise monitors advance the whole batch
+with one set of array operations per integration step.
+
+"""
+
+import copy
+import time
+import math
+import numpy
+import tvb.basic.traits.types_basic as basic
+from tvb.simulator import simulator, integrators, monitors, coupling
+from .common import get_logger
+from .sinks import ArraySink
+from .reduction import ReductionGraph
+
+
+LOG = get_logger(__name__)
+
+
+class MemberStreams(object):
+    """
+    Draws each batch member's block of random variates from that member's own
+    random stream, such that every member sees the same noise as it would in
+    an independent simulation.
+
+    """
+
+    def __init__(self, streams):
+        self.streams = streams
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        size = list(size)
+        size[1] //= len(self.streams)
+        blocks = [stream.normal(loc, scale, size) for stream in self.streams]
+        return numpy.concatenate(blocks, axis=1)
+
+    def get_state(self):
+        return [stream.get_state() for stream in self.streams]
+
+    def set_state(self, states):
+        for stream, state in zip(self.streams, states):
+            stream.set_state(state)
+
+
+class BatchSimulator(simulator.Simulator):
+    """
+    A Simulator which integrates a batch of parameter sets for the same
+    connectivity in one loop.
+
+    Swept parameters are given as a mapping from attribute paths relative to
+    the simulator to sequences with one value per batch member, e.g.::
+
+        sim = BatchSimulator(connectivity=conn, coupling=coupling.Linear(),
+                             batch_parameters={'coupling.a': [0.0, 1e-3, 2e-3],
+                                               'model.I': [0.0, 0.1, 0.2]})
+        for (t, x), in sim.configure().run():
+            ...
+
+    Model, noise ``nsig`` and post-summation coupling parameters may be swept,
+    as well as ``integrator.noise.random_stream``, or ``counter_seed`` for
+    counter-based noise, to give each member its own noise seed. Monitors which operate node-wise (Raw, SubSample,
+    TemporalAverage, Bold) run once for the whole batch, while other
+    monitors are applied to each member's slice of the state.
+
+    """
+
+    batch_parameters = basic.Dict(
+        label="Batch parameters",
+        default={},
+        required=True,
+        order=-1,
+        doc="""Mapping of attribute paths relative to the simulator, such as
+        ``'coupling.a'``, ``'model.I'`` or ``'integrator.noise.nsig'``, to a
+        sequence holding the value of that attribute for each batch member.""")
+
+    n_batch = None
+    members = None
+    _member_monitors = None
+    _member_slices = None
+
+    _sweepable_owners = 'model', 'coupling', 'integrator.noise'
+    _sweepable_noise = 'nsig', 'random_stream', 'counter_seed'
+    _nodewise_monitors = monitors.Raw, monitors.SubSample, monitors.TemporalAverage, monitors.Bold
+
+    def _check_batch_parameters(self):
+        "Check swept attribute paths and return the number of batch members."
+        n_batch = set()
+        for path, values in self.batch_parameters.items():
+            owner, _, name = path.rpartition('.')
+            if owner not in self._sweepable_owners or (owner == 'integrator.noise'
+                                                       and name not in self._sweepable_noise):
+                raise ValueError('Cannot sweep %r in a batch, expected a model, coupling or '
+                                 'noise nsig/random_stream/counter_seed parameter.' % (path, ))
+            n_batch.add(len(values))
+        if len(n_batch) != 1 or 0 in n_batch:
+            raise ValueError('Batch parameters must all have the same non-zero number of values, '
+                             'found %r.' % (sorted(n_batch), ))
+        return n_batch.pop()
+
+    def _is_nodewise(self, monitor):
+        return isinstance(monitor, self._nodewise_monitors) and not isinstance(monitor, monitors.BoldRegionROI)
+
+    def _configure_member(self, index):
+        "Build and configure the simulator for a single batch member."
+        member = simulator.Simulator(
+            connectivity=self.connectivity,
+            conduction_speed=self.conduction_speed,
+            coupling=copy.deepcopy(self.coupling),
+            model=copy.deepcopy(self.model),
+            integrator=copy.deepcopy(self.integrator),
+            initial_conditions=self.initial_conditions,
+            monitors=[copy.deepcopy(monitor) for monitor in self.monitors if not self._is_nodewise(monitor)],
+            simulation_length=self.simulation_length,
+            history_layout=self.history_layout,
+            dtype=self.dtype,
+            cache_path=self.cache_path,
+            cache_size=self.cache_size)
+        for path, values in self.batch_parameters.items():
+            owner_path, _, name = path.rpartition('.')
+            owner = member
+            for attr in owner_path.split('.'):
+                owner = getattr(owner, attr)
+            setattr(owner, name, values[index])
+        return member.configure()
+
+    def configure(self, full_configure=True):
+        """Configure the batched simulator.
+
+        One simulator is configured per batch member, such that initial
+        conditions and derived parameters are obtained exactly as they would
+        be for independent simulations. The members' parameters, history,
+        current state and noise are then stacked along the node axis.
+
+        Returns
+        -------
+        sim: BatchSimulator
+            The configured BatchSimulator instance.
+
+        """
+        self.n_batch = self._check_batch_parameters()
+        if self.surface is not None or self.stimulus is not None:
+            raise NotImplementedError('Batched simulation supports only region simulations without stimulus.')
+        if not isinstance(self.coupling, coupling.SparseCoupling):
+            raise ValueError('Batched simulation requires a SparseCoupling, but %r was given.' % (self.coupling, ))
+        if self.backend != 'numpy':
+            raise ValueError("Batched simulation supports only the 'numpy' backend, but %r was given."
+                             % (self.backend, ))
+        if full_configure:
+            self.preconfigure()
+        self.members = [self._configure_member(i) for i in range(self.n_batch)]
+        n_node = self.number_of_nodes
+        self.number_of_nodes = self.n_batch * n_node
+        self._member_slices = [slice(i * n_node, (i + 1) * n_node) for i in range(self.n_batch)]
+        LOG.info('Batch of %d members with %d nodes each', self.n_batch, n_node)
+        self._configure_delays()
+        self.horizon = self.connectivity.idelays.max() + 1
+        self._configure_batch_parameters()
+        if isinstance(self.integrator, integrators.IntegratorStochastic):
+            self._configure_batch_noise()
+        self._configure_dtype()
+        self._configure_batch_history()
+        # Preallocate the integration scheme's arrays for the stacked state
+        self.integrator.configure_workspace(self.current_state.shape, self.dtype, self.model._dfun_takes_out())
+        self._configure_batch_monitors()
+        self._census_memory_requirement()
+        return self
+
+    def _stack_node_values(self, path, values, n_node):
+        "Broadcast each member's value of a parameter to its nodes and concatenate."
+        stacked = []
+        for value in values:
+            value = numpy.asarray(value).reshape((-1, ))
+            if value.size not in (1, n_node):
+                raise ValueError('Cannot batch %r with %d values per member.' % (path, value.size))
+            stacked.append(numpy.broadcast_to(value, (n_node, )))
+        return numpy.concatenate(stacked)
+
+    def _configure_batch_parameters(self):
+        "Set swept model and coupling parameters to per-node values over the batch."
+        n_node = self.number_of_nodes // self.n_batch
+        for path in self.batch_parameters:
+            owner, _, name = path.rpartition('.')
+            if owner == 'model':
+                values = [getattr(member.model, name) for member in self.members]
+                stacked = self._stack_node_values(path, values, n_node)
+                setattr(self.model, name, stacked.reshape(self.model.spatial_param_reshape))
+            elif owner == 'coupling':
+                values = [getattr(member.coupling, name) for member in self.members]
+                stacked = self._stack_node_values(path, values, n_node)
+                setattr(self.coupling, name, stacked.reshape((-1, 1)))
+        self.model.update_derived_parameters()
+
+    def _configure_batch_noise(self):
+        "Stack the members' noise dispersion, coloured noise state and random streams."
+        noise = self.integrator.noise
+        member_noises = [member.integrator.noise for member in self.members]
+        member_shape = self.model.nvar, self.number_of_nodes // self.n_batch, self.model.number_of_modes
+        if noise.ntau > 0.0:
+            noise.configure_coloured(self.integrator.dt, member_shape)
+            noise._eta = numpy.concatenate([member_noise._eta for member_noise in member_noises], axis=1)
+        else:
+            noise.configure_white(self.integrator.dt, member_shape)
+        nsigs = [numpy.broadcast_to(member_noise.nsig, member_shape) for member_noise in member_noises]
+        noise.nsig = numpy.concatenate(nsigs, axis=1)
+        streams = MemberStreams([member_noise.random_stream for member_noise in member_noises])
+        # bypass the trait's type check, the member streams only stand in for a RandomState
+        type(noise).random_stream._put_value_on_instance(noise, streams)
+
+    def _configure_batch_history(self):
+        "Stack the members' initial history and state into a batched sparse history."
+        self.history = self._sparse_history(n_batch=self.n_batch)
+        buffers = [member.history.buffer for member in self.members]
+        self.history.buffer = numpy.concatenate(buffers, axis=self.history.node_axis)
+        self.current_state = numpy.concatenate([member.current_state for member in self.members], axis=1)
+        self.current_step = self.members[0].current_step
+        # the members' own histories are no longer needed
+        for member in self.members:
+            member.history = None
+
+    def _configure_batch_monitors(self):
+        "Configure node-wise monitors for the whole batch, others are kept per member."
+        self._member_monitors = []
+        self._reduction_graph = ReductionGraph.observing(self)
+        member_monitors = iter(zip(*[member.monitors for member in self.members]))
+        for monitor in self.monitors:
+            if self._is_nodewise(monitor):
+                monitor.config_for_sim(self)
+                self._member_monitors.append(None)
+            else:
+                self._member_monitors.append(next(member_monitors))
+
+    def _handle_random_state(self, random_state):
+        "Set random state of each member's stream, from a sequence of states."
+        if random_state is not None:
+            if isinstance(self.integrator, integrators.IntegratorStochastic):
+                self.integrator.noise.random_stream.set_state(random_state)
+                LOG.info("random_state supplied for %d batch members", len(random_state))
+            else:
+                LOG.warn("random_state supplied for non-stochastic integration")
+
+    def _loop_monitor_output(self, step, state):
+        observed = self.model.observe(state)
+        output = [[None] * len(self.monitors) for _ in range(self.n_batch)]
+        have_output = False
+        for i, (monitor, member_monitors) in enumerate(zip(self.monitors, self._member_monitors)):
+            if member_monitors is None:
+                sample = monitor.record(step, observed)
+                if sample is not None:
+                    time, data = sample
+                    for member_output, member_slice in zip(output, self._member_slices):
+                        member_output[i] = [time, data[:, member_slice]]
+                    have_output = True
+            else:
+                for member_output, member_monitor, member_slice in zip(output, member_monitors,
+                                                                       self._member_slices):
+                    member_output[i] = member_monitor.record(step, observed[:, member_slice])
+                    have_output |= member_output[i] is not None
+        if have_output:
+            return output
+
+    def run(self, **kwds):
+        """Convenience method to call the simulator with **kwds and collect output data,
+        returning for each batch member what Simulator.run would return."""
+        simulation_length = kwds.get('simulation_length') or self.simulation_length
+        n_steps = int(math.ceil(simulation_length / self.integrator.dt))
+        sinks = []
+        for b in range(self.n_batch):
+            member_sinks = []
+            for monitor, member_monitors in zip(self.monitors, self._member_monitors):
+                if member_monitors is not None:
+                    monitor = member_monitors[b]
+                sink = ArraySink()
+                sink.open(monitor, self._n_monitor_samples(monitor, n_steps))
+                member_sinks.append(sink)
+            sinks.append(member_sinks)
+        wall_time_start = time.time()
+        for data in self(**kwds):
+            for member_sinks, member_data in zip(sinks, data):
+                for sink, t_x in zip(member_sinks, member_data):
+                    if t_x is not None:
+                        sink.write(*t_x)
+        elapsed_wall_time = time.time() - wall_time_start
+        LOG.info("%.3f s elapsed for %d batch members, %.3fx real time", elapsed_wall_time,
+                 self.n_batch, elapsed_wall_time * 1e3 / self.simulation_length)
+        return [[sink.close() for sink in member_sinks] for member_sinks in sinks]
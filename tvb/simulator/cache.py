@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+On-disk cache of arrays derived when configuring a simulator.
+
+Configuration derives arrays such as delays in integration steps, the index
+arrays of the sparse history, the local connectivity matrix or a region lead
+field from the simulator's inputs. The cache stores each set of derived arrays
+as .npy files in a directory named by a hash of the inputs and parameters they
+were computed from, such that a later configuration with the same inputs loads
+them, memory-mapped, instead of computing them again. When the cache exceeds
+its size limit, the least recently used entries are removed.
+
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy
+from .common import get_logger
+
+
+LOG = get_logger(__name__)
+
+
+def artifact_key(kind, *parts):
+    """
+    Return the cache key for the kind of artifact derived from given parts,
+    i.e. arrays, which are hashed by dtype, shape and content, and parameters,
+    which are hashed by their representation.
+
+    """
+    sha = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, numpy.ndarray):
+            part = numpy.ascontiguousarray(part)
+            sha.update(repr((part.dtype.str, part.shape)).encode('ascii'))
+            sha.update(part.view(numpy.uint8).reshape(-1) if part.size else b'')
+        else:
+            sha.update(repr(part).encode('utf-8'))
+        sha.update(b'|')
+    return '%s-%s' % (kind, sha.hexdigest())
+
+
+class ArtifactCache(object):
+    "A directory of named arrays under content hash keys, with a least recently used size limit."
+
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def keys(self):
+        "Keys of the entries in the cache, excluding those being written."
+        return sorted(name for name in os.listdir(self.path)
+                      if not name.startswith('.') and os.path.isdir(self._entry(name)))
+
+    def entry_bytes(self, key):
+        "Size of an entry's files in bytes."
+        entry = self._entry(key)
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    @property
+    def nbytes(self):
+        return sum(self.entry_bytes(key) for key in self.keys())
+
+    def get(self, key):
+        "Return a dict of read-only, memory-mapped arrays for key, or None if not cached."
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            self.misses += 1
+            return None
+        try:
+            arrays = {}
+            for name in os.listdir(entry):
+                if name.endswith('.npy'):
+                    arrays[name[:-4]] = numpy.load(os.path.join(entry, name), mmap_mode='r')
+        except (OSError, IOError, ValueError) as exc:
+            LOG.warning('Removing unreadable cache entry %s: %s', key, exc)
+            self.invalidate(key)
+            self.misses += 1
+            return None
+        # access time for least recently used eviction
+        os.utime(entry, None)
+        self.hits += 1
+        LOG.debug('cache hit for %s', key)
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Store a dict of arrays under key, then evict least recently used
+        entries beyond the size limit. Arrays are written to a temporary
+        directory which is renamed into place, such that concurrent readers
+        find either a complete entry or none.
+
+        """
+        work = tempfile.mkdtemp(prefix='.' + key, dir=self.path)
+        try:
+            for name, array in arrays.items():
+                numpy.save(os.path.join(work, name + '.npy'), numpy.asarray(array))
+            os.rename(work, self._entry(key))
+        except OSError:
+            # entry written meanwhile by another process
+            if not os.path.isdir(self._entry(key)):
+                raise
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        LOG.debug('cached %s', key)
+        self.evict(keep=key)
+
+    def fetch(self, key, compute):
+        "Return arrays cached under key, or compute, store & return them."
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, arrays)
+        return arrays
+
+    def evict(self, keep=None):
+        "Remove least recently used entries, except keep, until within the size limit."
+        if not self.max_bytes:
+            return
+        entries = [(os.path.getmtime(self._entry(key)), key, self.entry_bytes(key)) for key in self.keys()]
+        total = sum(nbytes for _, _, nbytes in entries)
+        for _, key, nbytes in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                LOG.debug('evicting %s, %d bytes', key, nbytes)
+                self.invalidate(key)
+                total -= nbytes
+
+    def invalidate(self, key=None):
+        "Remove the entry for key, or all entries if no key is given."
+        for key in ([key] if key is not None else self.keys()):
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+
+
+def fetch_artifacts(cache, kind, parts, compute):
+    """
+    Return the arrays computed by compute from parts, via cache unless it is
+    None. Cached arrays are read-only.
+
+    """
+    if cache is None:
+        return compute()
+    return cache.fetch(artifact_key(kind, *parts), compute)
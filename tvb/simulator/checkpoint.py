@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Memory-mapped checkpoint files for simulator state.
+
+A checkpoint file holds a fixed set of named arrays, laid out once when the
+file is created, in two slots which are written alternately: a checkpoint is
+copied into the inactive slot and flushed before the slot is marked active,
+so that a run interrupted while writing leaves the previous checkpoint intact.
+Repeated checkpoints only copy the arrays into the mapped slot.
+
+"""
+
+import json
+import numpy
+from .common import get_logger
+
+
+LOG = get_logger(__name__)
+
+
+class CheckpointFile(object):
+    "A memory-mapped file of named arrays in two alternating slots."
+
+    magic = b'TVBCKPT1'
+    alignment = 64
+
+    def __init__(self, path, arrays=None):
+        """
+        Open the checkpoint file at path, or, if arrays are given, create it
+        with a layout for arrays of the same names, dtypes and shapes.
+
+        """
+        self.path = path
+        if arrays is not None:
+            self._create(arrays)
+        else:
+            self._open()
+
+    def _align(self, offset):
+        return -(-offset // self.alignment) * self.alignment
+
+    def _build_layout(self, header_nbytes):
+        "Compute offsets of control block and arrays from the layout."
+        offset = self._align(len(self.magic) + 8 + header_nbytes)
+        self._control_offset = offset
+        offset = self._align(offset + 16)
+        self._offsets = []
+        for name, dtype, shape in self.layout:
+            self._offsets.append(offset)
+            offset = self._align(offset + numpy.dtype(dtype).itemsize * int(numpy.prod(shape)))
+        self._slot_offset = self._offsets[0] if self._offsets else offset
+        self._slot_nbytes = offset - self._slot_offset
+        return self._slot_offset + 2 * self._slot_nbytes
+
+    def _create(self, arrays):
+        self.layout = [(name, numpy.asarray(value).dtype.str, list(numpy.shape(value)))
+                       for name, value in sorted(arrays.items())]
+        header = json.dumps(self.layout).encode('ascii')
+        nbytes = self._build_layout(len(header))
+        self._map = numpy.memmap(self.path, numpy.uint8, 'w+', shape=(nbytes, ))
+        self._map[:len(self.magic)] = numpy.frombuffer(self.magic, numpy.uint8)
+        self._map[len(self.magic):len(self.magic) + 8].view('<u8')[0] = len(header)
+        self._map[len(self.magic) + 8:len(self.magic) + 8 + len(header)] = numpy.frombuffer(header, numpy.uint8)
+        self._control[:] = -1, 0
+        self._map.flush()
+        LOG.info('created checkpoint file %s of %.2f MB', self.path, nbytes * 2**-20)
+
+    def _open(self):
+        self._map = numpy.memmap(self.path, numpy.uint8, 'r+')
+        if self._map[:len(self.magic)].tobytes() != self.magic:
+            raise ValueError('%s is not a checkpoint file.' % (self.path, ))
+        header_nbytes = int(self._map[len(self.magic):len(self.magic) + 8].view('<u8')[0])
+        start = len(self.magic) + 8
+        header = self._map[start:start + header_nbytes].tobytes().decode('ascii')
+        self.layout = [tuple(entry) for entry in json.loads(header)]
+        self._build_layout(header_nbytes)
+
+    @property
+    def _control(self):
+        "Active slot, or -1 if none, and number of checkpoints written."
+        return self._map[self._control_offset:self._control_offset + 16].view('<i8')
+
+    def _slot_arrays(self, slot):
+        arrays = {}
+        for (name, dtype, shape), offset in zip(self.layout, self._offsets):
+            offset += slot * self._slot_nbytes
+            nbytes = numpy.dtype(dtype).itemsize * int(numpy.prod(shape))
+            arrays[name] = self._map[offset:offset + nbytes].view(dtype).reshape(shape)
+        return arrays
+
+    def matches(self, arrays):
+        "Whether the file's layout fits the given arrays."
+        return self.layout == [(name, numpy.asarray(value).dtype.str, list(numpy.shape(value)))
+                               for name, value in sorted(arrays.items())]
+
+    @property
+    def generation(self):
+        "Number of checkpoints written to the file."
+        return int(self._control[1])
+
+    def write(self, arrays):
+        "Write arrays to the inactive slot, then make it the active one."
+        active, generation = self._control
+        slot = 0 if active != 0 else 1
+        for name, view in self._slot_arrays(slot).items():
+            view[...] = arrays[name]
+        self._map.flush()
+        self._control[:] = slot, generation + 1
+        self._map.flush()
+
+    def read(self):
+        "Read copies of the arrays in the active slot."
+        active = int(self._control[0])
+        if active < 0:
+            raise ValueError('Checkpoint file %s holds no checkpoint.' % (self.path, ))
+        return dict((name, view.copy()) for name, view in self._slot_arrays(active).items())
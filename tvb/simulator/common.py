@@ -41,7 +41,11 @@ import numpy
 import os
 import zipfile
 import logging
+import hashlib
+import collections
+import scipy.sparse
 from ..basic.logger.builder import GLOBAL_LOGGER_BUILDER
+from ..datatypes import arrays
 
 # route framework imports through this module so they are more easily updated
 
@@ -133,6 +137,107 @@ except ImportError:
     LOG.warning(msg)
     psutil = None
 
+
+def cast_float_arrays(obj, dtype):
+    """
+    Cast the floating point array attributes of a traited object, i.e. its
+    traits and other public attributes, to dtype. Float array traits holding
+    integers, e.g. model parameters with integer defaults, are cast as well,
+    as they would otherwise promote computations to double precision.
+
+    """
+    dtype = numpy.dtype(dtype)
+    names = set(obj.trait.keys())
+    names.update(name for name in vars(obj) if not name.startswith('_'))
+    for name in sorted(names):
+        value = getattr(obj, name, None)
+        if not isinstance(value, numpy.ndarray) or value.dtype == dtype:
+            continue
+        if value.dtype.kind == 'f' or (value.dtype.kind in 'iu' and isinstance(obj.trait.get(name), arrays.FloatArray)):
+            setattr(obj, name, value.astype(dtype))
+
+
+# sparse products into preallocated output, falling back on allocating products
+try:
+    from scipy.sparse._sparsetools import csr_matvecs
+except ImportError:
+    csr_matvecs = None
+
+
+class SparseAverage(object):
+    """
+    Sparse operator reducing the values of nodes to groups of nodes, e.g.
+    vertices to regions, given the group index of each node. Values are
+    reduced along the first axis with one sparse product, into an optional
+    preallocated output.
+
+    """
+
+    def __init__(self, mapping, n_group=None):
+        self.mapping = numpy.asarray(mapping, dtype=numpy.intc)
+        self.n_node = self.mapping.size
+        self.n_group = int(n_group or self.mapping.max() + 1)
+        self.counts = numpy.bincount(self.mapping, minlength=self.n_group)
+        nodes = numpy.arange(self.n_node, dtype=numpy.intc)
+        shape = self.n_group, self.n_node
+        self.sum_matrix = scipy.sparse.csr_matrix((numpy.ones(self.n_node), (self.mapping, nodes)), shape=shape)
+        # empty groups average to zero
+        weights = 1.0 / numpy.maximum(self.counts, 1)
+        self.matrix = scipy.sparse.csr_matrix((weights[self.mapping], (self.mapping, nodes)), shape=shape)
+        self._work = {}
+
+    def _reduce(self, matrix, x, out):
+        x = numpy.asarray(x)
+        if x.shape[0] != self.n_node:
+            raise ValueError('Expected %d nodes along first axis, got shape %r.' % (self.n_node, x.shape))
+        n_vec = x.size // self.n_node if self.n_node else 0
+        if out is None:
+            # reduced values have the floating point type of x
+            dtype = x.dtype if x.dtype.kind == 'f' else numpy.float64
+            out = numpy.empty((self.n_group, ) + x.shape[1:], dtype)
+            if dtype == numpy.float64:
+                x = numpy.ascontiguousarray(x, dtype=numpy.float64)
+        if csr_matvecs is None or out.dtype != numpy.float64 or not out.flags.c_contiguous:
+            out[...] = matrix.dot(x.reshape((self.n_node, n_vec))).reshape(out.shape)
+            return out
+        if x.dtype != numpy.float64 or not x.flags.c_contiguous:
+            # repeated reductions into preallocated output reuse a work array as well
+            if x.shape not in self._work:
+                self._work[x.shape] = numpy.empty(x.shape)
+            work = self._work[x.shape]
+            work[...] = x
+            x = work
+        out.fill(0.0)
+        csr_matvecs(self.n_group, self.n_node, n_vec, matrix.indptr, matrix.indices, matrix.data,
+                    x.reshape(-1), out.reshape(-1))
+        return out
+
+    def average(self, x, out=None):
+        "Average x of shape (n_node, ...) within groups, into out of shape (n_group, ...)."
+        return self._reduce(self.matrix, x, out)
+
+    def sum(self, x, out=None):
+        "Sum x of shape (n_node, ...) within groups, into out of shape (n_group, ...)."
+        return self._reduce(self.sum_matrix, x, out)
+
+
+_sparse_averages = collections.OrderedDict()
+
+def sparse_average(mapping, n_group=None, cache_size=8):
+    """
+    Return the SparseAverage for given mapping and number of groups, shared
+    by all callers with the same mapping, e.g. the simulator and monitors.
+
+    """
+    mapping = numpy.asarray(mapping)
+    key = mapping.shape, hashlib.sha1(mapping.astype(numpy.intc).tobytes()).hexdigest(), n_group
+    if key not in _sparse_averages:
+        _sparse_averages[key] = SparseAverage(mapping, n_group)
+        while len(_sparse_averages) > cache_size:
+            _sparse_averages.popitem(last=False)
+    return _sparse_averages[key]
+
+
 class Struct(dict):
     """
     the Struct class is a dictionary with matlab/C struct-like access
@@ -116,6 +116,18 @@ class Coupling(core.Type):
     a Coupling subclass should not define the `__call__` method directly but
     rather appropriate `pre` and `post` methods, which are used by 
     `Coupling.__call__` to compute the coupling correctly.
+
+    The coupling is evaluated only for the non-zero weights of the history,
+    such that time and memory scale with the number of connections: `pre`
+    receives arrays of shape (n_cvar, n_connection, n_mode), with the current
+    state of each connection's target node and the delayed state of its
+    source node, and `post` receives the weighted sums of shape (n, n_node,
+    n_mode), n being the number of variables returned by `pre`. If `pre`
+    does not depend on the current state, the history may instead group the
+    connections by delay, see `DelayBuckets`, and `pre` then receives the
+    state of all nodes at each delay. If `pre` is the default, a compiled
+    history may sum the delayed state over afferents directly, see
+    `CompiledHistory`.
     
     Default implementations of `pre` and `post` are provided, which simply
     apply the connectivity to afferent activity, without scaling or other changes.
@@ -126,12 +138,50 @@ class Coupling(core.Type):
     _base_classes = ["Coupling", 'SparseCoupling']
 
     def __call__(self, step, history):
-        g_ij = history.es_weights
-        x_i, x_j = history.query(step)
-        x_i = x_i[numpy.newaxis].transpose((2, 1, 0, 3)) # (to, ncv, from, m)
-        pre = self.pre(x_i, x_j)
-        sum = (g_ij * pre).sum(axis=2) # (to, ncv, m)
-        return self.post(sum).transpose((1, 0, 2)) # (ncv, to, m)
+        h = history # type: SparseHistory
+        if h.buckets is not None:
+            return self.post(h.buckets.sum(step, h, self.pre))
+        if h.fused_sum and type(self).pre is Coupling.pre:
+            return self.post(h.weighted_sum(step))
+        x_i, x_j = h.query_sparse(step)
+        pre = self.pre(x_i[:, h.nnz_row_el_idx], x_j)
+        return self.post(self._sum_afferents(h, pre, x_i.dtype))
+
+    @staticmethod
+    def row_indices(nnz_row_el_idx):
+        "Indices where the afferent, non-zero-weight connections of each row start, and the rows."
+        rows = numpy.r_[-1, nnz_row_el_idx]
+        lri, = numpy.argwhere(numpy.diff(rows)).T
+        return lri, numpy.unique(nnz_row_el_idx)
+
+    def _lri(self, nnz_row_el_idx):
+        "Flat array of indices afferent, non-zero-weight connections."
+        if not hasattr(self, '_cached_lri'):
+            self._cached_lri, self._cached_nzr = self.row_indices(nnz_row_el_idx)
+            LOG.debug('lri.size %d nzr.size %d', self._cached_lri.size, self._cached_nzr.size)
+        return self._cached_lri, self._cached_nzr
+
+    def _sum_afferents(self, history, pre, dtype):
+        "Sum pre of shape (n, n_connection, n_mode), weighted, over each node's afferents."
+        h = history # type: SparseHistory
+        sum = numpy.zeros((pre.shape[0], h.n_batch_node, h.n_mode), dtype)
+        weights_col = h.nnz_weights.reshape((h.n_nnzw, 1))
+        lri, nzr = self._lri(h.nnz_row_el_idx)
+        sum[:, nzr] = numpy.add.reduceat(weights_col * pre, lri, axis=1)
+        return sum
+
+    def uses_current_state(self, n_cvar=1, n_mode=1):
+        """
+        Whether the coupling depends on the current state x_i, rather than only
+        on the delayed states, probed by evaluating `pre` on a NaN current state.
+        Couplings overriding `__call__` are assumed to.
+
+        """
+        if type(self).__call__ is not Coupling.__call__:
+            return True
+        x = numpy.ones((n_cvar, 1, n_mode))
+        with numpy.errstate(invalid='ignore'):
+            return not numpy.all(numpy.isfinite(self.pre(x * numpy.nan, x)))
 
     def pre(self, x_i, x_j):
         return x_j
@@ -142,31 +192,13 @@ class Coupling(core.Type):
 
 class SparseCoupling(Coupling):
     """
-    A coupling implementation which takes advantage of a sparse weights structure to reduce the
-    number of coupling terms evaluated.
+    Base class for coupling functions defined only by elementwise `pre` and
+    `post` functions with scalar parameters, which the fused CPU loop and
+    batched simulations support. All couplings evaluate the non-zero weights
+    only, see `Coupling`.
 
     """
 
-    def _lri(self, nnz_row_el_idx):
-        "Flat array of indices afferent, non-zero-weight connections."
-        if not hasattr(self, '_cached_lri'):
-            rows = numpy.r_[-1, nnz_row_el_idx]
-            self._cached_lri, = numpy.argwhere(numpy.diff(rows)).T
-            self._cached_nzr = numpy.unique(nnz_row_el_idx)
-            LOG.debug('lri.size %d nzr.size %d', self._cached_lri.size, self._cached_nzr.size)
-        return self._cached_lri, self._cached_nzr
-
-    def __call__(self, step, history):
-        h = history # type: SparseHistory
-        x_i, x_j = h.query_sparse(step)
-        sum = numpy.zeros_like(x_i)
-        x_i = x_i[:, h.nnz_col_el_idx]
-        pre = self.pre(x_i, x_j)
-        assert pre.shape == (h.n_cvar, h.n_nnzw, h.n_mode)
-        weights_col = h.nnz_weights.reshape((h.n_nnzw, 1))
-        lri, nzr = self._lri(h.nnz_row_el_idx)
-        sum[:, nzr] = numpy.add.reduceat(weights_col * pre, lri, axis=1)
-        return self.post(sum)
 
 class Linear(SparseCoupling):
     r"""
@@ -375,8 +407,8 @@ class SigmoidalJansenRit(Coupling):
         return simple_gen_astr(self, 'cmin cmax midpoint a r')
 
     def pre(self, x_i, x_j):
-        pre = self.cmax / (1.0 + numpy.exp(self.r * (self.midpoint - (x_j[:, 0] - x_j[:, 1]))))
-        return pre[:, numpy.newaxis]
+        pre = self.cmax / (1.0 + numpy.exp(self.r * (self.midpoint - (x_j[0] - x_j[1]))))
+        return pre[numpy.newaxis]
 
     def post(self, gx):
         return self.a * gx
@@ -445,29 +477,38 @@ class PreSigmoidal(Coupling):
     def __str__(self):
         return simple_gen_astr(self, 'H Q G P theta dynamic globalT')
 
-    def configure(self):
-        """Set the right indirect call."""
-        super(PreSigmoidal, self).configure()
-        self.sliceT = 0 if self.globalT else slice(None)
+    def _sigmoid(self, x, theta):
+        return self.H * (self.Q + numpy.tanh(self.G * (self.P * x - theta)))
 
     # override __call__ directly simpler than pre/post form
-    # TODO check use of arrays dims here
-    def __call__(self, step, history, na=numpy.newaxis):
-        g_ij = history.es_weights
-        x_i, x_j = history.query(step)
-        if self.dynamic:
-            _ = (self.P * x_j[:,0] - x_j[:,1,self.sliceT])[:,na]
-        else:
-            _ = self.P * x_j - self.theta[self.sliceT,na]
-        A_j = self.H * (self.Q + numpy.tanh(self.G * _))
+    def __call__(self, step, history):
+        """
+        Evaluate the sigmoid of each connection's delayed source state, summed
+        over afferents. With a dynamic threshold, given by the second coupling
+        variable, the source's delayed threshold applies, or with a global
+        threshold that of the first node, delayed by its delay to the source,
+        and the direct output of each node, evaluated on its current state, is
+        returned as second variable.
+
+        """
+        h = history # type: SparseHistory
+        x_i, x_j = h.query_sparse(step)
         if self.dynamic:
-            c_0 = (g_ij[:,0] * A_j[:,0]).sum(axis=0)
-            c_1 = numpy.diag(A_j[:,0,:,0])[:, na]
+            if self.globalT:
+                theta_i = h.delayed_node_state(step, 1, 0)
+                theta_j = theta_i[h.nnz_col_el_idx]
+            else:
+                theta_i, theta_j = x_i[1], x_j[1]
+            c_0 = self._sum_afferents(h, self._sigmoid(x_j[0], theta_j)[numpy.newaxis], x_i.dtype)[0]
+            c_1 = self._sigmoid(x_i[0], theta_i)
             if self.globalT:
                 c_1[:] = c_1.mean()
             return numpy.array([c_0, c_1])
         else: # static threshold
-            return (g_ij.transpose((2, 1, 0, 3)) * A_j).sum(axis=0)
+            theta = self.theta.reshape((-1, 1))
+            if theta.shape[0] > 1:
+                theta = theta[h.nnz_col_el_idx]
+            return self._sum_afferents(h, self._sigmoid(x_j, theta), x_i.dtype)
 
 
 class Difference(SparseCoupling):
@@ -522,4 +563,5 @@ class Kuramoto(SparseCoupling):
         return numpy.sin(x_j - x_i)
 
     def post(self, gx):
-        return self.a / gx.shape[0] * gx
+        # gx has shape (n_cvar, n_node, n_mode)
+        return self.a / gx.shape[1] * gx
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Domain decomposition of simulations over local processes.
+
+The regions of the connectivity are partitioned over forked worker processes,
+each of which owns the nodes of its regions, i.e. the regions themselves or,
+in surface simulations, the vertices mapped to them, and integrates their
+state with its own copy of the region-level history, of which it queries and
+sums the afferent connections of its own regions only. A worker only needs the
+states of other workers' regions once they are older than the minimum delay
+between regions of different workers, so the region states of a window of
+steps, one step longer than that delay, are exchanged through shared memory
+once per window. Local connectivity couples vertices across partitions
+without delay, so owned states are exchanged through a halo buffer each time
+the model applies it.
+
+Workers also write the state of each step to shared memory, from which the
+simulator's process runs the monitors of one window while the workers
+integrate the next.
+
+"""
+
+import multiprocessing
+import multiprocessing.sharedctypes
+import traceback
+import numpy
+import scipy.sparse
+from tvb.simulator import integrators
+from .common import get_logger, sparse_average
+from .coupling import Coupling
+from .history import RaggedHistory, DelayBuckets
+from .noise import BlockStream, CounterStream
+
+
+LOG = get_logger(__name__)
+
+
+def shared_array(shape, dtype):
+    "Allocate an array in shared memory, which forked processes inherit."
+    dtype = numpy.dtype(dtype)
+    raw = multiprocessing.sharedctypes.RawArray('b', max(1, int(numpy.prod(shape))) * dtype.itemsize)
+    return numpy.frombuffer(raw, dtype, int(numpy.prod(shape))).reshape(shape)
+
+
+def partition_regions(counts, n_part):
+    """
+    Split regions into n_part contiguous groups of about equal total node
+    counts, e.g. the number of vertices of each region.
+
+    """
+    n_region = len(counts)
+    if not 0 < n_part <= n_region:
+        raise ValueError('Cannot partition %d regions into %d parts.' % (n_region, n_part))
+    cumulative = numpy.cumsum(counts, dtype=numpy.float64)
+    targets = cumulative[-1] * numpy.r_[1:n_part] / n_part
+    bounds = numpy.searchsorted(cumulative, targets) + 1
+    # at least one region per group
+    for k in range(n_part - 1):
+        lo = bounds[k - 1] + 1 if k else 1
+        bounds[k] = min(max(bounds[k], lo), n_region - (n_part - 1 - k))
+    return numpy.split(numpy.r_[:n_region], bounds)
+
+
+def _index(nodes):
+    "Slice equivalent to a sorted index array, if contiguous."
+    if nodes.size and nodes[-1] - nodes[0] + 1 == nodes.size:
+        return slice(nodes[0], nodes[-1] + 1)
+    return nodes
+
+
+class HaloLocalCoupling(object):
+    """
+    Local coupling of a worker's nodes, applied like the sparse local coupling
+    matrix in a model's dfun. The state it is applied to is written into a
+    shared halo buffer, alternating between two halves, so that after one
+    barrier all workers read the states of all nodes.
+
+    """
+
+    __array_priority__ = 100.0
+
+    def __init__(self, matrix, nodes, halo, barrier):
+        self.matrix = matrix
+        self.nodes = nodes
+        self.halo = halo
+        self.barrier = barrier
+        self._n_call = 0
+
+    def __mul__(self, x):
+        buf = self.halo[self._n_call % 2]
+        self._n_call += 1
+        if numpy.ndim(x) == 1:
+            buf = buf[:, 0]
+        buf[self.nodes] = x
+        self.barrier.wait()
+        return self.matrix.dot(buf)
+
+    __rmul__ = __mul__
+
+
+class NodeStream(object):
+    "Random stream drawing the variates of a subset of nodes of the full noise."
+
+    def __init__(self, stream, nodes, n_node):
+        self.stream = stream
+        self.nodes = nodes
+        self.n_node = n_node
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        size = list(size)
+        size[1] = self.n_node
+        if isinstance(self.stream, CounterStream):
+            return self.stream.normal(loc, scale, size, nodes=self.nodes)
+        return self.stream.normal(loc, scale, size)[:, self.nodes]
+
+    def get_state(self):
+        return self.stream.get_state()
+
+    def set_state(self, state):
+        self.stream.set_state(state)
+
+
+class WorkerError(RuntimeError):
+    "Error raised in a worker process."
+    pass
+
+
+class DomainDecomposition(object):
+    """
+    Integration loop of a configured simulator with its regions partitioned
+    over n_worker processes. Like the fused loop, calling it generates the step
+    and full state of each time step, such that the simulator feeds monitors as
+    usual, and the simulator's history, noise and state are updated at the end.
+
+    Requires the 'fork' start method, i.e. a POSIX platform. Batches, stimuli
+    applied to vertices other than through the spatial pattern, clamped state
+    variables and periodic checkpoints are not supported.
+
+    """
+
+    max_window = 32
+    # seconds to wait for workers, or None to wait indefinitely
+    timeout = None
+
+    def __init__(self, sim, n_worker):
+        self.sim = sim
+        self.n_worker = n_worker
+        self._check_supported()
+        n_reg = sim.connectivity.number_of_regions
+        self.regmap = sim._regmap if sim.surface is not None else numpy.r_[:n_reg]
+        counts = numpy.bincount(self.regmap, minlength=n_reg)
+        self.regions = partition_regions(counts, n_worker)
+        self.owner = numpy.empty(n_reg, numpy.intp)
+        for rank, regions in enumerate(self.regions):
+            self.owner[regions] = rank
+        self.nodes = [numpy.flatnonzero(self.owner[self.regmap] == rank) for rank in range(n_worker)]
+        self.window = self._window()
+        LOG.info('%d nodes in %d regions partitioned over %d workers, exchanging every %d steps',
+                 len(self.regmap), n_reg, n_worker, self.window)
+
+    def _check_supported(self):
+        sim = self.sim
+        msg = None
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            msg = 'platforms without fork'
+        elif sim.history.n_batch > 1:
+            msg = 'batches'
+        elif isinstance(sim.history, RaggedHistory):
+            msg = 'ragged histories'
+        elif sim.integrator.clamped_state_variable_values is not None:
+            msg = 'clamped state variables'
+        elif sim.checkpoint_path and sim.checkpoint_interval:
+            msg = 'periodic checkpoints'
+        if msg is not None:
+            raise NotImplementedError('Domain decomposition does not support %s.' % (msg, ))
+
+    def _window(self):
+        "Number of steps between exchanges of region states."
+        history = self.sim.history
+        rows, cols = history.nnz_row_el_idx, history.nnz_col_el_idx
+        cross = self.owner[rows] != self.owner[cols]
+        if not cross.any():
+            return self.max_window
+        if self.sim.coupling.uses_current_state(history.n_cvar, history.n_mode):
+            return 1
+        return int(min(history.nnz_idelays[cross].min() + 1, self.max_window))
+
+    def __call__(self, step, n_step, state):
+        "Generate the step and state of each of n_step time steps from given step and state."
+        sim, window = self.sim, self.window
+        ctx = multiprocessing.get_context('fork')
+        stream = getattr(getattr(sim.integrator, 'noise', None), 'random_stream', None)
+        if isinstance(stream, BlockStream):
+            # workers inherit the stream, but not a block drawn in the background
+            stream.rewind()
+        n_cvar, n_reg, n_mode = sim.history.n_cvar, sim.history.n_node, sim.history.n_mode
+        shared = {
+            'states': shared_array((2, window) + state.shape, state.dtype),
+            'exchange': shared_array((2, window, n_cvar, n_reg, n_mode), sim.history.buffer.dtype),
+            'halo': shared_array((2, state.shape[1], state.shape[2]), state.dtype),
+            'window_barrier': ctx.Barrier(self.n_worker + 1),
+            'halo_barrier': ctx.Barrier(self.n_worker),
+            'results': ctx.Queue(),
+        }
+        workers = [ctx.Process(target=self._work, args=(rank, step, n_step, state, shared),
+                               name='domain worker %d' % (rank, ))
+                   for rank in range(self.n_worker)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        finished = False
+        try:
+            for w, start in enumerate(range(0, n_step, window)):
+                self._wait(shared)
+                states = shared['states'][w % 2]
+                for t in range(min(window, n_step - start)):
+                    if start + t == n_step - 1:
+                        # the last state outlives the shared buffers
+                        yield step + start + t, states[t].copy()
+                    else:
+                        yield step + start + t, states[t]
+            self._finish(shared)
+            finished = True
+        finally:
+            if not finished:
+                shared['window_barrier'].abort()
+            for worker in workers:
+                worker.join(self.timeout)
+                if worker.is_alive():
+                    worker.terminate()
+
+    def _raise_worker_error(self, shared):
+        try:
+            kind, rank, payload = shared['results'].get(timeout=self.timeout)
+        except Exception:
+            raise WorkerError('A domain worker stopped without reporting an error.')
+        raise WorkerError('Domain worker %d failed:\n%s' % (rank, payload))
+
+    def _wait(self, shared):
+        try:
+            shared['window_barrier'].wait(self.timeout)
+        except Exception:
+            self._raise_worker_error(shared)
+
+    def _finish(self, shared):
+        "Collect the final history and noise state of the workers into the simulator."
+        sim = self.sim
+        noise = getattr(sim.integrator, 'noise', None)
+        for _ in range(self.n_worker):
+            kind, rank, payload = shared['results'].get(timeout=self.timeout)
+            if kind == 'error':
+                raise WorkerError('Domain worker %d failed:\n%s' % (rank, payload))
+            if rank == 0:
+                sim.history.buffer[:] = payload['history']
+                if 'random_state' in payload:
+                    noise.random_stream.set_state(payload['random_state'])
+            if payload.get('eta') is not None:
+                noise._eta[:, self.nodes[rank]] = payload['eta']
+
+    def _work(self, rank, step, n_step, state, shared):
+        "Integrate the nodes of a worker, in a forked process."
+        try:
+            self._integrate(rank, step, n_step, state, shared)
+        except Exception:
+            shared['results'].put(('error', rank, traceback.format_exc()))
+            shared['window_barrier'].abort()
+            shared['halo_barrier'].abort()
+
+    def _restrict(self, nodes, n_node):
+        "Restrict the forked simulator's model and noise to the worker's nodes."
+        sim = self.sim
+        names = set(sim.model.trait.keys())
+        names.update(name for name in vars(sim.model) if not name.startswith('_'))
+        for name in sorted(names):
+            value = getattr(sim.model, name, None)
+            if isinstance(value, numpy.ndarray) and value.ndim > 0 and value.shape[0] == n_node:
+                setattr(sim.model, name, value[nodes])
+        sim.model.update_derived_parameters()
+        if isinstance(sim.integrator, integrators.IntegratorStochastic):
+            noise = sim.integrator.noise
+            if noise.nsig.ndim == 3 and noise.nsig.shape[1] == n_node:
+                noise.nsig = noise.nsig[:, nodes]
+            if noise._eta is not None:
+                noise._eta = noise._eta[:, nodes]
+            # bypass the trait's type check, the node stream only stands in for a RandomState
+            type(noise).random_stream._put_value_on_instance(
+                noise, NodeStream(noise.random_stream, nodes, n_node))
+
+    def _worker_history(self, rank):
+        """
+        History of the connections to the worker's regions only, sharing the
+        buffer of the simulator's history, such that each worker queries and
+        sums the afferents of its own regions.
+
+        """
+        history, conn = self.sim.history, self.sim.connectivity
+        weights = conn.weights.copy()
+        weights[self.owner != rank] = 0.0
+        if not weights.any():
+            # no afferents to sum, but the coupling may still depend on the delayed state otherwise
+            return history
+        worker_history = type(history)(weights, conn.idelays, history.cvars, history.n_mode)
+        type(history).buffer.share(history, worker_history)
+        if history.buckets is not None:
+            worker_history.buckets = DelayBuckets(worker_history)
+        return worker_history
+
+    def _integrate(self, rank, step, n_step, state, shared):
+        sim, window = self.sim, self.window
+        nodes, regions = self.nodes[rank], _index(self.regions[rank])
+        others = numpy.flatnonzero(self.owner != rank)
+        index, n_node = _index(nodes), state.shape[1]
+        region_index = _index(self.regmap[nodes])
+        self._restrict(nodes, n_node)
+        history, cvar = self._worker_history(rank), sim.model.cvar
+        sim.coupling._cached_lri, sim.coupling._cached_nzr = Coupling.row_indices(history.nnz_row_el_idx)
+        local_coupling = sim._prepare_local_coupling()
+        if scipy.sparse.issparse(local_coupling):
+            local_coupling = HaloLocalCoupling(local_coupling.tocsr()[nodes], nodes,
+                                               shared['halo'], shared['halo_barrier'])
+        stimulus = sim._prepare_stimulus()
+        if sim.stimulus is not None:
+            own_stimulus = stimulus[:, index].copy()
+        else:
+            own_stimulus = stimulus
+        if sim.surface is not None:
+            # regions are owned whole, so their average is over the worker's vertices
+            local_regions = numpy.searchsorted(self.regions[rank], self.regmap[nodes])
+            region_average = sparse_average(local_regions, len(self.regions[rank]))
+        X = state[:, index].copy()
+        scheme, dfun = sim.integrator.scheme, sim.model.dfun
+        for w, start in enumerate(range(0, n_step, window)):
+            n = min(window, n_step - start)
+            states, exchange = shared['states'][w % 2], shared['exchange'][w % 2]
+            for t in range(n):
+                step_t = step + start + t
+                node_coupling = sim.coupling(step_t, history)[:, region_index]
+                if sim.stimulus is not None:
+                    sim._loop_update_stimulus(step_t, stimulus)
+                    own_stimulus[...] = stimulus[:, index]
+                X = scheme(X, dfun, node_coupling, local_coupling, own_stimulus)
+                if sim.surface is not None:
+                    region_state = region_average.average(X[cvar].transpose((1, 0, 2))).transpose((1, 0, 2))
+                else:
+                    region_state = X[cvar]
+                history.buffer[step_t % history.n_time][:, regions] = region_state
+                exchange[t][:, regions] = region_state
+                states[t][:, index] = X
+            shared['window_barrier'].wait(self.timeout)
+            # other workers' region states of this window
+            for t in range(n):
+                step_t = step + start + t
+                history.buffer[step_t % history.n_time][:, others] = exchange[t][:, others]
+        payload = {}
+        if rank == 0:
+            payload['history'] = history.buffer
+        if isinstance(sim.integrator, integrators.IntegratorStochastic):
+            noise = sim.integrator.noise
+            if rank == 0:
+                payload['random_state'] = noise.random_stream.get_state()
+            payload['eta'] = noise._eta
+        shared['results'].put(('done', rank, payload))
@@ -34,6 +34,7 @@ Data descriptors for declaring workspace for algorithms and checking usage.
 
 """
 
+import copy
 import numpy
 import collections
 import weakref
@@ -48,12 +49,23 @@ class StaticAttr(object):
     "Base class which requires all attributes to be declared at class level."
 
     def __setattr__(self, name, value):
-        attr_exists = hasattr(self, name)
-        if not hasattr(self, name):
+        # checked on the class, as getting an attribute may initialize it
+        if not hasattr(type(self), name):
             raise AttributeError('%r has no attr %r.' % (self, name))
         else:
             super(StaticAttr, self).__setattr__(name, value)
 
+    def __deepcopy__(self, memo):
+        "Copy, sharing the arrays of read-only descriptors, which cannot change once set."
+        other = object.__new__(type(self))
+        memo[id(self)] = other
+        for klass in type(self).__mro__:
+            for attr in vars(klass).values():
+                if isinstance(attr, (NDArray, Final)) and self in attr.instance_state:
+                    attr.copy_state(self, other, memo)
+        other.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return other
+
 
 class ImmutableAttrError(AttributeError):
     "Error due to modifying an immutable attribute."
@@ -73,11 +85,22 @@ class NDArray(StaticAttr):
     State = collections.namedtuple('State', 'array initialized')
 
     shape, dtype, read_only, instance_state = (), None, True, {}
+    init, workspace = None, False
+
+    def __init__(self, shape, dtype, read_only=True, init=None, workspace=False):
+        """
+        :param init: Name of the owner's method setting the array, called on
+            first access if it was not set before, for arrays only some uses
+            of the owner require.
+        :param workspace: Whether the array is overwritten by each use, such
+            that copies of the owner make their own rather than copy it.
 
-    def __init__(self, shape, dtype, read_only=True):
+        """
         self.shape = shape # may have strings which eval in owner ns
         self.dtype = dtype
         self.read_only = read_only
+        self.init = init
+        self.workspace = workspace
         self.instance_state = weakref.WeakKeyDictionary()
 
     def _make_array(self, instance):
@@ -104,11 +127,17 @@ class NDArray(StaticAttr):
             self.instance_state[instance] = NDArray.State(array, False)
         return self.instance_state[instance]
 
+    def allocated(self, instance):
+        "Whether the array of instance has been created."
+        return instance in self.instance_state
+
     def __get__(self, instance, _):
         if instance is None:
             LOG.debug('NDArray returning self for None instance.')
             return self
         else:
+            if self.init is not None and instance not in self.instance_state:
+                getattr(instance, self.init)()
             return self._get_or_create_state(instance).array
 
     def __set__(self, instance, value):
@@ -126,6 +155,18 @@ class NDArray(StaticAttr):
         if not state.initialized:
             self.instance_state[instance] = NDArray.State(state.array, True)
 
+    def share(self, source, target):
+        "Set target's array to the array of source itself, rather than copying values into it."
+        self.instance_state[target] = self.instance_state[source]
+
+    def copy_state(self, source, target, memo):
+        "Set target's array to that of source, shared if read-only, otherwise copied unless a workspace."
+        if self.workspace:
+            return
+        state = self.instance_state[source]
+        array = state.array if self.read_only else copy.deepcopy(state.array, memo)
+        self.instance_state[target] = NDArray.State(array, state.initialized)
+
 
 class Final(object):
     "A descriptor for an attribute, possibly type-checked, that once initialized, cannot be changed."
@@ -154,6 +195,10 @@ class Final(object):
                                       % (value, self.type))
             self.instance_state[instance] = Final.State(value, True)
 
+    def copy_state(self, source, target, memo):
+        "Set target's value to that of source."
+        self.instance_state[target] = self.instance_state[source]
+
     def __get__(self, instance, owner):
         if instance is None:
             LOG.debug('Final returning self for None instance.')
@@ -38,11 +38,18 @@ Simulator history implementations.
 
 
 import numpy
-from tvb.simulator.common import get_logger
+import scipy.sparse
+from tvb.simulator.common import get_logger, csr_matvecs
 from .descriptors import StaticAttr, Dim, NDArray
 
 LOG = get_logger(__name__)
 
+# compiled kernels of the sparse history, if the extension is built, see CompiledHistory
+try:
+    from tvb._speedups import history as _speedups
+except ImportError:
+    _speedups = None
+
 
 class BaseHistory(StaticAttr):
     "Abstract base class for history implementations."
@@ -64,7 +71,7 @@ class BaseHistory(StaticAttr):
         self.delays = delays
         self.cvars = cvars
 
-    def initialize(self, init):
+    def initialize(self, init, step=0):
         raise NotImplemented
 
     def update(self, step, new_state):
@@ -77,35 +84,41 @@ class BaseHistory(StaticAttr):
 class DenseHistory(BaseHistory):
     "TVB's traditional history implementation."
 
-    # extended shape arrays for indexing
+    # extended shape arrays for indexing, of n_node**2 elements, built on first use by the dense query
     _es = 'n_node', 'n_cvar', 'n_node'
-    es_icvar = NDArray(_es, 'i')
-    es_idelays = NDArray(_es, 'i')
-    es_weights = NDArray(_es + ('n_mode', ), 'f')
-    es_node_ids = NDArray(_es, 'i')
+    es_icvar = NDArray(_es, 'i', init='_index_dense')
+    es_idelays = NDArray(_es, 'i', init='_index_dense')
+    es_weights = NDArray(_es + ('n_mode', ), 'f', init='_index_dense')
+    es_node_ids = NDArray(_es, 'i', init='_index_dense')
     buffer = NDArray(('n_time', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
     current_state = NDArray(('n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
-    delayed_state = NDArray(('n_node', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
+    delayed_state = NDArray(('n_node', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False,
+                            init='_clear_delayed_state', workspace=True)
+
+    # arrays of the dense query, counted once allocated
+    dense_names = ('es_icvar', 'es_idelays', 'es_weights', 'es_node_ids', 'delayed_state')
 
     @property
     def nbytes(self):
-        arrays = 'icvar idelays weights node_ids'.split()
-        nbytes = sum([getattr(self, 'es_' + ary).nbytes for ary in arrays])
+        nbytes = sum([getattr(self, name).nbytes for name in self.dense_names
+                      if getattr(type(self), name).allocated(self)])
         nbytes += self.buffer.nbytes
         nbytes += BaseHistory.nbytes.fget(self)
         return nbytes
 
-    def __init__(self, weights, delays, cvars, n_mode):
-        super(DenseHistory, self).__init__(weights, delays, cvars, n_mode)
-
-        # initialize indexing arrays
+    def _index_dense(self):
+        "Initialize the indexing arrays of the dense query."
         na = numpy.newaxis
         self.es_icvar = numpy.r_[:len(self.cvars)][na, :, na]
         self.es_idelays = self.delays[:, na, :].astype('i')
         self.es_weights = self.weights[:, na, :, na]
         self.es_node_ids = numpy.r_[:self.n_node][na, na, :]
 
-    def initialize(self, init):
+    def _clear_delayed_state(self):
+        "Initialize the delayed state, of which sparse queries only set connected elements."
+        self.delayed_state = 0.0
+
+    def initialize(self, init, step=0):
         if init.shape[1] > len(self.cvars):
             init = init[:, self.cvars] # simulator still thinks history is (time, svar, ..)
         self.buffer = init
@@ -121,11 +134,21 @@ class DenseHistory(BaseHistory):
 
 
 class SparseHistory(DenseHistory):
-    "History implementation which stores data only for non-zero weights."
+    """
+    History implementation which stores data only for non-zero weights.
+
+    With ``n_batch > 1``, the buffer holds ``n_batch`` independent instances of
+    the network stacked along the node axis, and the non-zero connections of
+    each instance are offset into its own block of nodes, such that a single
+    sparse query serves the whole batch.
+
+    """
 
     n_nnzw = Dim()
     n_nnzr = Dim()
+    n_batch = Dim()
     time_stride = Dim()
+    buffer = NDArray(('n_time', 'n_cvar', 'n_batch_node', 'n_mode'), 'f', read_only=False)
     nnz_mask = NDArray(('n_node', 'n_node'), numpy.bool)
     const_indices = NDArray(('n_cvar', n_nnzw, 'n_mode'), 'i')
     nnz_idelays = NDArray((n_nnzw,), 'i')
@@ -133,33 +156,69 @@ class SparseHistory(DenseHistory):
     nnz_col_el_idx = NDArray((n_nnzw, ), 'i')
     nnz_weights = NDArray((n_nnzw, ), 'f')
     nnz_row_idx = NDArray((n_nnzr, ), 'i')
+    # connections grouped by delay, if used for coupling, see DelayBuckets
+    buckets = None
+    # axis of the buffer along which nodes, and batch members, are stacked
+    node_axis = 2
+    # whether weighted_sum sums the delayed state over afferents without gathering it first
+    fused_sum = False
 
-    def __init__(self, weights, delays, cvars, n_mode):
+    @property
+    def n_batch_node(self):
+        "Number of nodes in the buffer, over all batch members."
+        return self.n_batch * self.n_node
+
+    # arrays derived from weights, delays & cvars, see compute_indices
+    index_names = ('nnz_mask', 'nnz_weights', 'nnz_row_el_idx', 'nnz_col_el_idx',
+                   'nnz_row_idx', 'nnz_idelays', 'const_indices')
+
+    def __init__(self, weights, delays, cvars, n_mode, n_batch=1, indices=None):
         super(SparseHistory, self).__init__(weights, delays, cvars, n_mode)
-        self.time_stride = self.n_cvar * self.n_node * self.n_mode
-        self.nnz_mask = weights_nonzero = weights != 0.0 # type: numpy.ndarray
-        self.n_nnzw = nnz = weights_nonzero.sum()
-        self.nnz_weights = weights[self.nnz_mask]
-        self.nnz_row_el_idx, self.nnz_col_el_idx = numpy.argwhere(self.nnz_mask).T
-        nnz_row_idx = numpy.unique(self.nnz_row_el_idx)
-        self.n_nnzr = len(nnz_row_idx)
-        self.nnz_row_idx = nnz_row_idx
-        self.nnz_idelays = delays[weights_nonzero].astype('i')
+        self.n_batch = n_batch
+        self.time_stride = self.n_cvar * self.n_batch_node * self.n_mode
+        if indices is None:
+            indices = self.compute_indices(weights, delays, cvars, n_mode, n_batch)
+        self.n_nnzw = len(indices['nnz_weights'])
+        self.n_nnzr = len(indices['nnz_row_idx'])
+        for name in self.index_names:
+            setattr(self, name, indices[name])
+
+        LOG.info('history has n_time=%d n_cvar=%d n_node=%d n_nmode=%d n_batch=%d, requires %.2f MB',
+                 self.n_time, self.n_cvar, self.n_node, self.n_mode, self.n_batch, self.nbytes*2**-20)
+        LOG.debug('sparse flat time_stride=%d', self.time_stride)
+        LOG.info('sparse history has n_nnzw=%d, i.e. %.2f %% sparse', self.n_nnzw,
+                 self.n_nnzw * 100.0 / self.n_batch / self.n_node**2)
+
+    @staticmethod
+    def compute_indices(weights, delays, cvars, n_mode, n_batch=1):
+        "Compute the index arrays of a sparse history, which may be passed to the constructor as indices."
+        n_node = delays.shape[0]
+        nnz_mask = weights != 0.0 # type: numpy.ndarray
+        nnz = nnz_mask.sum()
+        # each batch member's connections are offset into its own block of nodes
+        offsets = numpy.repeat(numpy.r_[:n_batch] * n_node, nnz)
+        row_el_idx, col_el_idx = numpy.argwhere(nnz_mask).T
+        nnz_row_el_idx = numpy.tile(row_el_idx, n_batch) + offsets
+        nnz_col_el_idx = numpy.tile(col_el_idx, n_batch) + offsets
         # build const indices
-        n, m = self.n_node, self.n_mode
+        n, m = n_batch * n_node, n_mode
         icvars_ = numpy.r_[:len(cvars)].reshape((-1, 1, 1)) * n * m
-        nodes_ = numpy.tile(numpy.r_[:n], (n, 1))[self.nnz_mask, numpy.newaxis] * m
+        nodes_ = nnz_col_el_idx[:, numpy.newaxis] * m
         modes_ = numpy.r_[:m]
-        self.const_indices = icvars_ + nodes_ + modes_
-        self.delayed_state[:] = 0.0
-
-        LOG.info('history has n_time=%d n_cvar=%d n_node=%d n_nmode=%d, requires %.2f MB',
-                 self.n_time, self.n_cvar, self.n_node, self.n_mode, self.nbytes*2**-20)
-        LOG.debug('sparse flat time_stride=%d', self.time_stride)
-        LOG.info('sparse history has n_nnzw=%d, i.e. %.2f %% sparse', self.n_nnzw,
-                 self.n_nnzw * 100.0 / self.n_node**2)
+        return {
+            'nnz_mask': nnz_mask,
+            'nnz_weights': numpy.tile(weights[nnz_mask], n_batch),
+            'nnz_row_el_idx': nnz_row_el_idx,
+            'nnz_col_el_idx': nnz_col_el_idx,
+            'nnz_row_idx': numpy.unique(nnz_row_el_idx),
+            'nnz_idelays': numpy.tile(delays[nnz_mask].astype('i'), n_batch),
+            'const_indices': icvars_ + nodes_ + modes_,
+        }
 
     def query(self, step, out=None):
+        if self.n_batch > 1:
+            raise ValueError('Dense delayed state is not available for a batched history, '
+                             'use a SparseCoupling or query_sparse instead.')
         current, delayed = self.query_sparse(step)
         self.delayed_state.transpose((1, 0, 2, 3))[:, self.nnz_mask] = delayed
         return current, self.delayed_state
@@ -168,17 +227,250 @@ class SparseHistory(DenseHistory):
         time_indices = ((step - 1 - self.nnz_idelays + self.n_time) % self.n_time) # type: numpy.ndarray
         time_indices = time_indices.reshape((-1, 1)) * self.time_stride # type: numpy.ndarray
         delayed_state = self.buffer.take(time_indices + self.const_indices)
-        current_state = self.buffer[(step - 1) % self.n_time]
-        return current_state, delayed_state
+        return self.sample(step - 1), delayed_state
+
+    def sample(self, step):
+        "State of all nodes at given step, of shape (n_cvar, n_batch_node, n_mode)."
+        return self.buffer[step % self.n_time]
+
+    def delayed_node_state(self, step, cvar, node):
+        """
+        State of the given coupling variable of a node, as of the step before
+        given step, delayed by the node's delay to each node, whether they are
+        connected or not, of shape (n_batch_node, n_mode), each batch member
+        giving the state of its own node.
+
+        """
+        delays = numpy.tile(self.delays[:, node].astype('i'), self.n_batch)
+        nodes = numpy.repeat(numpy.r_[:self.n_batch] * self.n_node + node, self.n_node)
+        return self.buffer[(step - 1 - delays) % self.n_time, cvar, nodes]
 
     @property
     def nbytes(self):
         arrays = 'nnz_mask const_indices nnz_idelays nnz_row_el_idx nnz_col_el_idx nnz_weights nnz_row_idx'.split()
         nbytes = sum([getattr(self, ary).nbytes for ary in arrays])
         nbytes += DenseHistory.nbytes.fget(self)
+        if self.buckets is not None:
+            nbytes += self.buckets.nbytes
         return nbytes
 
 
+class CompiledHistory(SparseHistory):
+    """
+    Sparse history whose buffer update and delayed state query run in the
+    compiled kernels of ``tvb._speedups.history``, available if the extension
+    is built, e.g. by ``python setup.py build_ext --inplace`` with Cython.
+
+    For couplings summing the delayed state itself, ``weighted_sum`` further
+    fuses the query with the weighted sum over each node's afferents, without
+    gathering the delayed state of each connection.
+
+    """
+
+    n_indptr = Dim()
+    nnz_indptr = NDArray(('n_indptr', ), 'i')
+    fused_sum = True
+    available = _speedups is not None
+
+    def __init__(self, weights, delays, cvars, n_mode, n_batch=1, indices=None):
+        if not self.available:
+            raise ImportError('The compiled history requires the tvb._speedups.history extension.')
+        self.n_indptr = n_batch * delays.shape[0] + 1
+        super(CompiledHistory, self).__init__(weights, delays, cvars, n_mode, n_batch, indices)
+        # kernels do not check indices, so check them once here
+        if self.n_nnzw > 0 and not (0 <= self.nnz_idelays.min() and self.nnz_idelays.max() < self.n_time
+                                    and 0 <= self.nnz_col_el_idx.min()
+                                    and self.nnz_col_el_idx.max() < self.n_batch_node):
+            raise IndexError('Delays or nodes of the connections are out of range of the buffer.')
+        if numpy.any(numpy.diff(self.nnz_row_el_idx) < 0):
+            raise ValueError('Connections must be sorted by target node.')
+        self.nnz_indptr = numpy.searchsorted(self.nnz_row_el_idx, numpy.r_[:self.n_indptr])
+
+    def update(self, step, new_state):
+        _speedups.update(self.buffer, step, self.cvars, new_state)
+
+    def query_sparse(self, step):
+        delayed_state = numpy.empty((self.n_cvar, self.n_nnzw, self.n_mode), self.buffer.dtype)
+        _speedups.query_sparse(self.buffer, step, self.nnz_idelays, self.nnz_col_el_idx, delayed_state)
+        return self.sample(step - 1), delayed_state
+
+    def weighted_sum(self, step):
+        "Weighted sum of the delayed state over each node's afferents, of shape (n_cvar, n_batch_node, n_mode)."
+        out = numpy.empty((self.n_cvar, self.n_batch_node, self.n_mode), self.buffer.dtype)
+        _speedups.weighted_sum(self.buffer, step, self.nnz_idelays, self.nnz_col_el_idx, self.nnz_weights,
+                               self.nnz_indptr, out)
+        return out
+
+    @property
+    def nbytes(self):
+        return self.nnz_indptr.nbytes + SparseHistory.nbytes.fget(self)
+
+
+class RaggedHistory(SparseHistory):
+    """
+    Sparse history in which each source node keeps only as many past samples
+    as its longest efferent delay requires, instead of ``n_time`` for every
+    node.
+
+    The samples of all nodes are packed into a single buffer of shape
+    (n_cvar, n_packed, n_mode), node j occupying ``depth[j]`` consecutive
+    slots from ``offsets[j]``, in which the sample of step t is found at slot
+    ``offsets[j] + t % depth[j]``. Per connection offsets and depths make
+    queries a single take on the buffer, as for the sparse history. A node
+    with no efferent connections keeps its current state only.
+
+    """
+
+    n_packed = Dim()
+    buffer = NDArray(('n_cvar', 'n_packed', 'n_mode'), 'f', read_only=False)
+    depth = NDArray(('n_batch_node', ), 'i')
+    offsets = NDArray(('n_batch_node', ), 'i')
+    nnz_depth = NDArray(('n_nnzw', ), 'i')
+    nnz_offsets = NDArray(('n_nnzw', ), 'i')
+    cvar_mode_indices = NDArray(('n_cvar', 'n_mode'), 'i')
+    node_axis = 1
+
+    def __init__(self, weights, delays, cvars, n_mode, n_batch=1, indices=None):
+        if indices is None:
+            indices = self.compute_indices(weights, delays, cvars, n_mode, n_batch)
+        depth = numpy.ones((n_batch * delays.shape[0], ), 'i')
+        numpy.maximum.at(depth, indices['nnz_col_el_idx'], indices['nnz_idelays'] + 1)
+        self.n_packed = depth.sum()
+        super(RaggedHistory, self).__init__(weights, delays, cvars, n_mode, n_batch, indices)
+        self.depth = depth
+        self.offsets = numpy.r_[0, numpy.cumsum(depth)[:-1]]
+        self.nnz_depth = depth[self.nnz_col_el_idx]
+        self.nnz_offsets = self.offsets[self.nnz_col_el_idx]
+        icvars = numpy.r_[:self.n_cvar].reshape((-1, 1)) * self.n_packed * self.n_mode
+        self.cvar_mode_indices = icvars + numpy.r_[:self.n_mode]
+        full_nbytes = self.buffer.itemsize * self.n_time * self.n_cvar * self.n_batch_node * self.n_mode
+        LOG.info('ragged history buffer keeps %d of %d samples per cvar and mode, %.2f MB instead of %.2f MB',
+                 self.n_packed, self.n_time * self.n_batch_node, self.buffer.nbytes * 2**-20, full_nbytes * 2**-20)
+
+    def initialize(self, init, step=0):
+        """
+        Pack a full history of shape (n_time, n_cvar, n_batch_node, n_mode),
+        whose sample of each step t is at t % n_time, the latest being that of
+        given step.
+
+        """
+        if init.shape[1] > len(self.cvars):
+            init = init[:, self.cvars]
+        node = numpy.repeat(numpy.r_[:self.n_batch_node], self.depth)
+        slot = numpy.r_[:self.n_packed] - self.offsets[node]
+        # the step of each slot, among the depth steps up to the given one
+        slot_step = step - (step - slot) % self.depth[node]
+        self.buffer = init[slot_step % self.n_time, :, node].transpose((1, 0, 2))
+
+    def update(self, step, new_state):
+        self.buffer[:, self.offsets + step % self.depth] = new_state[self.cvars]
+
+    def query_sparse(self, step):
+        slots = self.nnz_offsets + (step - 1 - self.nnz_idelays) % self.nnz_depth
+        delayed_state = self.buffer.take(slots.reshape((-1, 1)) * self.n_mode + self.cvar_mode_indices[:, numpy.newaxis])
+        return self.sample(step - 1), delayed_state
+
+    def sample(self, step):
+        """
+        State of all nodes at given step, of shape (n_cvar, n_batch_node,
+        n_mode), for nodes keeping that step, other nodes giving an older sample.
+
+        """
+        return self.buffer[:, self.offsets + step % self.depth]
+
+    def delayed_node_state(self, step, cvar, node):
+        delays = numpy.tile(self.delays[:, node].astype('i'), self.n_batch)
+        nodes = numpy.repeat(numpy.r_[:self.n_batch] * self.n_node + node, self.n_node)
+        if (delays >= self.depth[nodes]).any():
+            raise ValueError('Node %d keeps fewer samples than its delays to other nodes require, '
+                             'use the full history layout.' % (node, ))
+        return self.buffer[cvar, self.offsets[nodes] + (step - 1 - delays) % self.depth[nodes]]
+
+    @property
+    def nbytes(self):
+        arrays = 'depth offsets nnz_depth nnz_offsets cvar_mode_indices'.split()
+        return sum([getattr(self, ary).nbytes for ary in arrays]) + SparseHistory.nbytes.fget(self)
+
+
+class DelayBuckets(object):
+    """
+    The connections of a sparse history grouped by delay, into one weight
+    matrix per distinct delay, which is dense if at least ``dense_fraction``
+    of its elements are non-zero and sparse otherwise.
+
+    For a coupling whose pre-summation function does not depend on the
+    current state, the weighted sum over afferents is then a sum over delays
+    of the product of each weight matrix with the pre-summation function of
+    the history's sample at that delay. Samples are contiguous and products
+    stream through memory, where querying the sparse history gathers the
+    delayed state of each connection. Each weight matrix only has columns of
+    nodes keeping the sample at its delay, so that a ragged history's older
+    samples for other nodes do not contribute.
+
+    """
+
+    dense_fraction = 0.25
+    # mean number of connections per delay, and per delay and node, from which buckets are used
+    min_bucket_size = 4096
+    min_fill = 1.0
+
+    def __init__(self, history):
+        h = history # type: SparseHistory
+        n = h.n_batch_node
+        order = numpy.argsort(h.nnz_idelays, kind='mergesort')
+        delays = h.nnz_idelays[order]
+        self.delays, starts = numpy.unique(delays, return_index=True)
+        bounds = numpy.r_[starts, delays.size]
+        self.blocks = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            conn = order[lo:hi]
+            weights = h.nnz_weights[conn].astype(numpy.float64)
+            block = scipy.sparse.csr_matrix((weights, (h.nnz_row_el_idx[conn], h.nnz_col_el_idx[conn])), (n, n))
+            if block.nnz >= self.dense_fraction * n * n:
+                block = block.toarray()
+            self.blocks.append(block)
+        n_dense = sum(isinstance(block, numpy.ndarray) for block in self.blocks)
+        LOG.info('coupling sums over %d delays, %d of them with dense weights', len(self.blocks), n_dense)
+
+    @classmethod
+    def suitable(cls, history):
+        "Whether the connections of history are spread over few enough delays for buckets to be faster."
+        n_delay = numpy.unique(history.nnz_idelays).size
+        min_size = max(cls.min_bucket_size, cls.min_fill * history.n_batch_node)
+        return history.n_nnzw > 0 and history.n_nnzw >= n_delay * min_size
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes if isinstance(block, numpy.ndarray)
+                   else block.data.nbytes + block.indices.nbytes + block.indptr.nbytes
+                   for block in self.blocks)
+
+    def __deepcopy__(self, memo):
+        # not modified once built, so shared by copies of the history
+        return self
+
+    def sum(self, step, history, pre):
+        "Sum pre of the delayed samples of history, weighted, over each node's afferents."
+        h = history # type: SparseHistory
+        n_cvar, n, n_mode = h.n_cvar, h.n_batch_node, h.n_mode
+        gx = None
+        for delay, block in zip(self.delays, self.blocks):
+            x = h.sample(step - 1 - delay)
+            x = numpy.ascontiguousarray(pre(x, x), dtype=numpy.float64) # (k, n, n_mode)
+            if gx is None:
+                gx = numpy.zeros(x.shape)
+            for k in range(x.shape[0]):
+                if isinstance(block, numpy.ndarray) or csr_matvecs is None:
+                    gx[k] += block.dot(x[k])
+                else:
+                    # accumulates into gx
+                    csr_matvecs(n, n, n_mode, block.indptr, block.indices, block.data, x[k].reshape(-1),
+                                gx[k].reshape(-1))
+        if gx is None:
+            gx = numpy.zeros((n_cvar, n, n_mode))
+        return gx.astype(h.buffer.dtype)
+
+
 # implement in order  NumPy, Numba & OpenCL versions
 
 # simulator.history becomes impl instance
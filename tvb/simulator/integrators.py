@@ -57,6 +57,29 @@ from .common import get_logger, simple_gen_astr
 LOG = get_logger(__name__)
 
 
+class Workspace(object):
+    """
+    Preallocated arrays of an integration scheme, for states of a given shape
+    and dtype: one array per name, and a pair of arrays for the next state,
+    used in turn such that the next state is never written into the current.
+
+    """
+
+    def __init__(self, shape, dtype, names):
+        self.shape, self.dtype = tuple(shape), numpy.dtype(dtype)
+        for name in names:
+            setattr(self, name, numpy.empty(shape, dtype))
+        self._next = numpy.empty(shape, dtype), numpy.empty(shape, dtype)
+
+    def fits(self, X):
+        return X.shape == self.shape and X.dtype == self.dtype
+
+    def next(self, X):
+        "Array for the state following X."
+        a, b = self._next
+        return b if X is a else a
+
+
 class Integrator(core.Type):
     """
     The Integrator class is a base class for the integration methods...
@@ -98,6 +121,47 @@ class Integrator(core.Type):
         default = None,
         order=-1)
 
+    # names of the arrays a scheme needs besides the next state, see Workspace
+    _workspace_names = ()
+    _workspace = None
+    _dfun_out = False
+
+    def configure_workspace(self, shape, dtype=numpy.float64, dfun_out=False):
+        """
+        Preallocate the arrays of the scheme for states of given shape and
+        dtype, which are then updated in place, such that steps do not
+        allocate. The state returned by the scheme is then one of two arrays
+        used in turn, overwritten two steps later. If dfun_out, the dfun passed
+        to the scheme writes derivatives into its out argument, see
+        `Model.dfun`.
+
+        """
+        self._workspace = Workspace(shape, dtype, self._workspace_names)
+        self._dfun_out = dfun_out
+
+    def _work(self, X):
+        "Workspace for state X, allocated per step if not configured, and when X changes shape."
+        work = self._workspace
+        if work is None:
+            return Workspace(X.shape, X.dtype, self._workspace_names)
+        if not work.fits(X):
+            LOG.debug('reallocating %s workspace for state of shape %r', type(self).__name__, X.shape)
+            work = self._workspace = Workspace(X.shape, X.dtype, self._workspace_names)
+        return work
+
+    def _dfun(self, dfun, X, coupling, local_coupling, out):
+        "Evaluate dfun into out, without allocating if dfun takes an out argument."
+        if self._dfun_out:
+            dfun(X, coupling, local_coupling, out=out)
+        else:
+            out[...] = dfun(X, coupling, local_coupling)
+        return out
+
+    def _add_stimulus(self, X, stimulus, work):
+        "Add dt times the stimulus to X, using work as temporary, unless there is no stimulus."
+        if not numpy.isscalar(stimulus) or stimulus != 0.0:
+            numpy.multiply(stimulus, self.dt, out=work)
+            X += work
 
     def scheme(self, X, dfun, coupling, local_coupling, stimulus):
         """
@@ -162,6 +226,7 @@ class HeunDeterministic(Integrator):
     """
 
     _ui_name = "Heun"
+    _workspace_names = 'k1', 'k2', 'inter'
 
     def scheme(self, X, dfun, coupling, local_coupling, stimulus):
         r"""
@@ -175,14 +240,20 @@ class HeunDeterministic(Integrator):
         cf. Equation 1.11, page 283.
 
         """
-        #import pdb; pdb.set_trace()
-        m_dx_tn = dfun(X, coupling, local_coupling)
-        inter = X + self.dt * (m_dx_tn  + stimulus)
+        work = self._work(X)
+        m_dx_tn = self._dfun(dfun, X, coupling, local_coupling, work.k1)
+        inter = numpy.add(m_dx_tn, stimulus, out=work.inter)
+        inter *= self.dt
+        inter += X
         self.clamp_state(inter)
 
-        dX = (m_dx_tn + dfun(inter, coupling, local_coupling)) * self.dt / 2.0
+        dX = self._dfun(dfun, inter, coupling, local_coupling, work.k2)
+        dX += m_dx_tn
+        dX *= self.dt
+        dX /= 2.0
 
-        X_next = X + dX + self.dt * stimulus
+        X_next = numpy.add(X, dX, out=work.next(X))
+        self._add_stimulus(X_next, stimulus, inter)
         self.clamp_state(X_next)
         return X_next
 
@@ -195,6 +266,7 @@ class HeunStochastic(IntegratorStochastic):
     """
 
     _ui_name = "Stochastic Heun"
+    _workspace_names = 'k1', 'k2', 'inter'
 
     def scheme(self, X, dfun, coupling, local_coupling, stimulus):
         """
@@ -216,16 +288,26 @@ class HeunStochastic(IntegratorStochastic):
                        noise_gfun.shape, (noise.shape[0], noise.shape[1])))
             raise Exception(msg)
 
-        m_dx_tn = dfun(X, coupling, local_coupling)
+        work = self._work(X)
+        X_next = work.next(X)
+        m_dx_tn = self._dfun(dfun, X, coupling, local_coupling, work.k1)
 
         noise *= noise_gfun
 
-        inter = X + self.dt * m_dx_tn + noise + self.dt * stimulus
+        inter = numpy.multiply(m_dx_tn, self.dt, out=work.inter)
+        inter += X
+        inter += noise
+        self._add_stimulus(inter, stimulus, X_next)
         self.clamp_state(inter)
 
-        dX = (m_dx_tn + dfun(inter, coupling, local_coupling)) * self.dt / 2.0
+        dX = self._dfun(dfun, inter, coupling, local_coupling, work.k2)
+        dX += m_dx_tn
+        dX *= self.dt
+        dX /= 2.0
 
-        X_next = X + dX + noise + self.dt * stimulus
+        numpy.add(X, dX, out=X_next)
+        X_next += noise
+        self._add_stimulus(X_next, stimulus, inter)
         self.clamp_state(X_next)
         return X_next
 
@@ -240,6 +322,7 @@ class EulerDeterministic(Integrator):
     """
 
     _ui_name = "Euler"
+    _workspace_names = 'k1',
 
     def scheme(self, X, dfun, coupling, local_coupling, stimulus):
         r"""
@@ -251,9 +334,12 @@ class EulerDeterministic(Integrator):
 
         """
 
-        self.dX = dfun(X, coupling, local_coupling) 
+        work = self._work(X)
+        self.dX = self._dfun(dfun, X, coupling, local_coupling, work.k1)
 
-        X_next = X + self.dt * (self.dX + stimulus)
+        X_next = numpy.add(self.dX, stimulus, out=work.next(X))
+        X_next *= self.dt
+        X_next += X
         self.clamp_state(X_next)
         return X_next
 
@@ -268,6 +354,7 @@ class EulerStochastic(IntegratorStochastic):
     """
 
     _ui_name = "Euler-Maruyama"
+    _workspace_names = 'k1',
 
     def scheme(self, X, dfun, coupling, local_coupling, stimulus):
         r"""
@@ -284,10 +371,14 @@ class EulerStochastic(IntegratorStochastic):
 
         """
 
+        work = self._work(X)
         noise = self.noise.generate(X.shape)
-        dX = dfun(X, coupling, local_coupling) * self.dt 
-        noise_gfun = self.noise.gfun(X)
-        X_next = X + dX + noise_gfun * noise + self.dt * stimulus
+        dX = self._dfun(dfun, X, coupling, local_coupling, work.k1)
+        dX *= self.dt
+        noise *= self.noise.gfun(X)
+        X_next = numpy.add(X, dX, out=work.next(X))
+        X_next += noise
+        self._add_stimulus(X_next, stimulus, dX)
         self.clamp_state(X_next)
         return X_next
 
@@ -299,6 +390,7 @@ class RungeKutta4thOrderDeterministic(Integrator):
     """
 
     _ui_name = "Runge-Kutta 4th order"
+    _workspace_names = 'k1', 'k2', 'k3', 'k4', 'inter'
 
     def scheme(self, X, dfun, coupling, local_coupling=0.0, stimulus=0.0):
         r"""
@@ -324,20 +416,33 @@ class RungeKutta4thOrderDeterministic(Integrator):
         dt2 = dt / 2.0
         dt6 = dt / 6.0
 
-        k1 = dfun(X, coupling, local_coupling)
-        inter_k1 = X + dt2 * k1
-        self.clamp_state(inter_k1)
-        k2 = dfun(inter_k1, coupling, local_coupling)
-        inter_k2 = X + dt2 * k2
-        self.clamp_state(inter_k2)
-        k3 = dfun(inter_k2, coupling, local_coupling)
-        inter_k3 = X + dt * k3
-        self.clamp_state(inter_k3)
-        k4 = dfun(inter_k3, coupling, local_coupling)
-
-        dX = dt6 * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
-
-        X_next = X + dX + self.dt * stimulus
+        work = self._work(X)
+        inter = work.inter
+        k1 = self._dfun(dfun, X, coupling, local_coupling, work.k1)
+        numpy.multiply(k1, dt2, out=inter)
+        inter += X
+        self.clamp_state(inter)
+        k2 = self._dfun(dfun, inter, coupling, local_coupling, work.k2)
+        numpy.multiply(k2, dt2, out=inter)
+        inter += X
+        self.clamp_state(inter)
+        k3 = self._dfun(dfun, inter, coupling, local_coupling, work.k3)
+        numpy.multiply(k3, dt, out=inter)
+        inter += X
+        self.clamp_state(inter)
+        k4 = self._dfun(dfun, inter, coupling, local_coupling, work.k4)
+
+        # dt6 * (k1 + 2 k2 + 2 k3 + k4), accumulated into k2
+        dX = k2
+        dX *= 2.0
+        dX += k1
+        k3 *= 2.0
+        dX += k3
+        dX += k4
+        dX *= dt6
+
+        X_next = numpy.add(X, dX, out=work.next(X))
+        self._add_stimulus(X_next, stimulus, inter)
         self.clamp_state(X_next)
         return X_next
 
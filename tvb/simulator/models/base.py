@@ -60,18 +60,37 @@ class Model(core.Type):
     _nvar = None
     number_of_modes = 1
     cvar = None
+    # whether the dfun of the class declaring it takes an out argument, see dfun
+    dfun_out = False
 
     def _build_observer(self):
-        template = ("def observe(state):\n"
-                            "    {svars} = state\n"
-                            "    return numpy.array([{voi_names}])")
-        svars = ','.join(self.state_variables)
-        if len(self.state_variables) == 1:
-            svars += ','
-        code = template.format(
-            svars = svars,
-            voi_names = ','.join(self.variables_of_interest)
-        )
+        """
+        Build the observe function, returning the variables of interest of a
+        state. Where these are state variables, it returns a view of the state
+        for a contiguous range of them or takes them in a single operation,
+        without evaluating each variable separately, so that callers keeping
+        the observed state beyond the time step copy it.
+
+        """
+        state_variables = list(self.state_variables)
+        voi_names = list(self.variables_of_interest)
+        if voi_names and all(name in state_variables for name in voi_names):
+            indices = [state_variables.index(name) for name in voi_names]
+            if indices == list(range(indices[0], indices[-1] + 1)):
+                code = "def observe(state):\n    return state[%d:%d]" % (indices[0], indices[-1] + 1)
+            else:
+                code = "def observe(state):\n    return state.take(%r, axis=0)" % (indices, )
+        else:
+            template = ("def observe(state):\n"
+                                "    {svars} = state\n"
+                                "    return numpy.array([{voi_names}])")
+            svars = ','.join(self.state_variables)
+            if len(self.state_variables) == 1:
+                svars += ','
+            code = template.format(
+                svars = svars,
+                voi_names = ','.join(self.variables_of_interest)
+            )
         namespace = {'numpy': numpy}
         LOG.debug('building observer with code:\n%s', code)
         exec(code, namespace)
@@ -121,9 +140,22 @@ class Model(core.Type):
         state from other regions of the brain currently arriving ``coupling``,
         and the current state of the "local" neighbourhood ``local_coupling``.
 
+        Models setting ``dfun_out`` take an additional ``out`` argument, an
+        array of the shape of ``state_variables`` into which the derivatives
+        are written and returned, such that integrators evaluate
+        dfun without allocating, see `Integrator.configure_workspace`. A
+        subclass overriding dfun sets it again if its dfun also takes ``out``.
+
         """
         pass
 
+    def _dfun_takes_out(self):
+        "Whether dfun takes an out argument, as declared by the class defining dfun."
+        for klass in type(self).__mro__:
+            if 'dfun' in vars(klass):
+                return bool(vars(klass).get('dfun_out', False))
+        return False
+
     # TODO refactor as a NodeSimulator class
     def stationary_trajectory(self,
                               coupling=numpy.array([[0.0]]),
@@ -177,4 +209,31 @@ class ModelNumbaDfun(Model):
 
     @property
     def spatial_param_reshape(self):
-        return -1,
\ No newline at end of file
+        return -1,
+
+    @staticmethod
+    def _gufunc_out(out):
+        "View of a dfun out array of shape (n_svar, n_node, 1) as the gufunc's output, or None."
+        return None if out is None else out.reshape(out.shape[:-1]).T
+
+    @staticmethod
+    def _no_local_coupling(local_coupling):
+        "Whether local coupling is the zero of region simulations, which dfuns need not apply."
+        return numpy.isscalar(local_coupling) and local_coupling == 0.0
+
+    def _numba_kernel(self):
+        """
+        Per-node kernel from which the dfun gufunc is built, taking the state,
+        coupling, kernel parameters and derivative arrays of a single node, or
+        None if the model does not provide one.
+
+        """
+        return None
+
+    def _numba_kernel_parameters(self):
+        """
+        Kernel parameters for a region simulation, in the order taken by the
+        kernel, or None if the model does not provide a kernel.
+
+        """
+        return None
@@ -32,10 +32,9 @@ Hindmarsh-Rose-Jirsa Epileptor model.
 """
 
 from .base import ModelNumbaDfun, LOG, numpy, basic, arrays
-from numba import guvectorize, float64
+from numba import guvectorize, float64, float32
 
-@guvectorize([(float64[:],) * 18], '(n),(m)' + ',()'*15 + '->(n)', nopython=True)
-def _numba_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, tau, ydot):
+def _numba_dfun_kernel(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, tau, ydot):
     "Gufunc for Hindmarsh-Rose-Jirsa Epileptor model equations."
 
     c_pop1 = c_pop[0]
@@ -68,6 +67,9 @@ def _numba_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf
     ydot[5] = tt[0] * (-0.01 * (y[5] - 0.1 * y[0]))
 
 
+_numba_dfun = guvectorize([(float32[:],) * 18, (float64[:],) * 18], '(n),(m)' + ',()'*15 + '->(n)', nopython=True)(_numba_dfun_kernel)
+
+
 class Epileptor(ModelNumbaDfun):
     r"""
     The Epileptor is a composite neural mass model of six dimensions which
@@ -353,11 +355,22 @@ class Epileptor(ModelNumbaDfun):
 
         return ydot
 
-    def dfun(self, x, c, local_coupling=0.0):
+    dfun_out = True
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
-        Iext = self.Iext + local_coupling * x[0, :, 0]
+        Iext = self.Iext
+        if not self._no_local_coupling(local_coupling):
+            Iext = Iext + local_coupling * x[0, :, 0]
         deriv = _numba_dfun(x_, c_,
                          self.x0, Iext, self.Iext2, self.a, self.b, self.slope, self.tt, self.Kvf,
-                         self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.tau)
-        return deriv.T[..., numpy.newaxis]
\ No newline at end of file
+                         self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.tau, self._gufunc_out(out))
+        return deriv.T[..., numpy.newaxis]
+
+    def _numba_kernel(self):
+        return _numba_dfun_kernel
+
+    def _numba_kernel_parameters(self):
+        return [self.x0, self.Iext, self.Iext2, self.a, self.b, self.slope, self.tt, self.Kvf,
+                self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.tau]
\ No newline at end of file
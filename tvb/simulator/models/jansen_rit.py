@@ -33,7 +33,7 @@ Jansen-Rit and derivative models.
 
 from .base import ModelNumbaDfun, Model, LOG, numpy, basic, arrays
 import math
-from numba import guvectorize, float64
+from numba import guvectorize, float64, float32
 
 class JansenRit(ModelNumbaDfun):
     r"""
@@ -301,22 +301,30 @@ class JansenRit(ModelNumbaDfun):
             self.B * self.b * (self.a_4 * self.J * sigm_y0_3) - 2.0 * self.b * y5 - self.b ** 2 * y2,
         ])
 
-    def dfun(self, y, c, local_coupling=0.0):
-        src =  local_coupling*(y[1] - y[2])[:, 0]
+    dfun_out = True
+
+    def dfun(self, y, c, local_coupling=0.0, out=None):
+        src = 0.0 if self._no_local_coupling(local_coupling) else local_coupling*(y[1] - y[2])[:, 0]
         y_ = y.reshape(y.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
         deriv = _numba_dfun_jr(y_, c_, src,
                                self.nu_max, self.r, self.v0, self.a, self.a_1, self.a_2, self.a_3, self.a_4,
-                               self.A, self.b, self.B, self.J, self.mu
+                               self.A, self.b, self.B, self.J, self.mu, self._gufunc_out(out)
                                )
         return deriv.T[..., numpy.newaxis]
 
+    def _numba_kernel(self):
+        return _numba_dfun_jr_kernel
+
+    def _numba_kernel_parameters(self):
+        return [0.0, self.nu_max, self.r, self.v0, self.a, self.a_1, self.a_2, self.a_3, self.a_4,
+                self.A, self.b, self.B, self.J, self.mu]
+
 
-@guvectorize([(float64[:],) * 17], '(n),(m)' + ',()'*14 + '->(n)', nopython=True)
-def _numba_dfun_jr(y, c,
-                   src,
-                   nu_max, r, v0, a, a_1, a_2, a_3, a_4, A, b, B, J, mu,
-                   dx):
+def _numba_dfun_jr_kernel(y, c,
+                          src,
+                          nu_max, r, v0, a, a_1, a_2, a_3, a_4, A, b, B, J, mu,
+                          dx):
     sigm_y1_y2 = 2.0 * nu_max[0] / (1.0 + math.exp(r[0] * (v0[0] - (y[1] - y[2]))))
     sigm_y0_1 = 2.0 * nu_max[0] / (1.0 + math.exp(r[0] * (v0[0] - (a_1[0] * J[0] * y[0]))))
     sigm_y0_3 = 2.0 * nu_max[0] / (1.0 + math.exp(r[0] * (v0[0] - (a_3[0] * J[0] * y[0]))))
@@ -328,6 +336,10 @@ def _numba_dfun_jr(y, c,
     dx[5] = B[0] * b[0] * (a_4[0] * J[0] * sigm_y0_3) - 2.0 * b[0] * y[5] - b[0] ** 2 * y[2]
 
 
+_numba_dfun_jr = guvectorize([(float32[:],) * 17, (float64[:],) * 17], '(n),(m)' + ',()'*14 + '->(n)', nopython=True)(
+    _numba_dfun_jr_kernel)
+
+
 class ZetterbergJansen(Model):
     """
     Zetterberg et al derived a model inspired by the Wilson-Cowan equations. It served as a basis for the later,
@@ -63,8 +63,16 @@ class Linear(Model):
     _nvar = 1
     cvar = numpy.array([0], dtype=numpy.int32)
 
-    def dfun(self, state, coupling, local_coupling=0.0):
+    dfun_out = True
+
+    def dfun(self, state, coupling, local_coupling=0.0, out=None):
         x, = state
         c, = coupling
-        dx = self.gamma * x + c + local_coupling * x
-        return numpy.array([dx])
\ No newline at end of file
+        if out is None:
+            dx = self.gamma * x + c + local_coupling * x
+            return numpy.array([dx])
+        dx = numpy.multiply(self.gamma, x, out=out[0])
+        dx += c
+        if not (numpy.isscalar(local_coupling) and local_coupling == 0.0):
+            dx += local_coupling * x
+        return out
\ No newline at end of file
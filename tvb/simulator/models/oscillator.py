@@ -33,7 +33,7 @@ Oscillator models.
 
 from .base import Model, ModelNumbaDfun, LOG, numpy, basic, arrays
 import numexpr
-from numba import guvectorize, float64
+from numba import guvectorize, float64, float32
 
 
 
@@ -409,17 +409,25 @@ class Generic2dOscillator(ModelNumbaDfun):
 
         return derivative
 
-    def dfun(self, vw, c, local_coupling=0.0):
-        lc_0 = local_coupling * vw[0, :, 0]
+    dfun_out = True
+
+    def dfun(self, vw, c, local_coupling=0.0, out=None):
+        lc_0 = 0.0 if self._no_local_coupling(local_coupling) else local_coupling * vw[0, :, 0]
         vw_ = vw.reshape(vw.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
         deriv = _numba_dfun_g2d(vw_, c_, self.tau, self.I, self.a, self.b, self.c, self.d, self.e, self.f, self.g,
-                                self.beta, self.alpha, self.gamma, lc_0)
+                                self.beta, self.alpha, self.gamma, lc_0, self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
+    def _numba_kernel(self):
+        return _numba_dfun_g2d_kernel
+
+    def _numba_kernel_parameters(self):
+        return [self.tau, self.I, self.a, self.b, self.c, self.d, self.e, self.f, self.g,
+                self.beta, self.alpha, self.gamma, 0.0]
+
 
-@guvectorize([(float64[:],) * 16], '(n),(m)' + ',()'*13 + '->(n)', nopython=True)
-def _numba_dfun_g2d(vw, c_0, tau, I, a, b, c, d, e, f, g, beta, alpha, gamma, lc_0, dx):
+def _numba_dfun_g2d_kernel(vw, c_0, tau, I, a, b, c, d, e, f, g, beta, alpha, gamma, lc_0, dx):
     "Gufunc for reduced Wong-Wang model equations."
     V = vw[0]
     V2 = V * V
@@ -428,6 +436,9 @@ def _numba_dfun_g2d(vw, c_0, tau, I, a, b, c, d, e, f, g, beta, alpha, gamma, lc
     dx[1] = d[0] * (a[0] + b[0] * V + c[0] * V2 - beta[0] * W) / tau[0]
 
 
+_numba_dfun_g2d = guvectorize([(float32[:],) * 16, (float64[:],) * 16], '(n),(m)' + ',()'*13 + '->(n)', nopython=True)(_numba_dfun_g2d_kernel)
+
+
 class Kuramoto(Model):
     r"""
     The Kuramoto model is a model of synchronization phenomena derived by
@@ -522,8 +533,8 @@ class Kuramoto(Model):
 
         I = coupling[0, :] + local_range_coupling
 
-        if not hasattr(self, 'derivative'):
-            self.derivative = numpy.empty((1,) + theta.shape)
+        if not hasattr(self, 'derivative') or self.derivative.dtype != theta.dtype:
+            self.derivative = numpy.empty((1,) + theta.shape, theta.dtype)
 
         # phase update
         self.derivative[0] = self.omega + I
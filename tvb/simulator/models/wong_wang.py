@@ -32,10 +32,9 @@ Models based on Wong-Wang's work.
 """
 
 from .base import ModelNumbaDfun, LOG, numpy, basic, arrays
-from numba import guvectorize, float64
+from numba import guvectorize, float64, float32
 
-@guvectorize([(float64[:],)*11], '(n),(m)' + ',()'*8 + '->(n)', nopython=True)
-def _numba_dfun(S, c, a, b, d, g, ts, w, j, io, dx):
+def _numba_dfun_kernel(S, c, a, b, d, g, ts, w, j, io, dx):
     "Gufunc for reduced Wong-Wang model equations."
 
     if S[0] < 0.0:
@@ -48,6 +47,9 @@ def _numba_dfun(S, c, a, b, d, g, ts, w, j, io, dx):
         dx[0] = - (S[0] / ts[0]) + (1.0 - S[0]) * h * g[0]
 
 
+_numba_dfun = guvectorize([(float32[:],) * 11, (float64[:],) * 11], '(n),(m)' + ',()'*8 + '->(n)', nopython=True)(_numba_dfun_kernel)
+
+
 class ReducedWongWang(ModelNumbaDfun):
     r"""
     .. [WW_2006] Kong-Fatt Wong and Xiao-Jing Wang,  *A Recurrent Network
@@ -190,9 +192,19 @@ class ReducedWongWang(ModelNumbaDfun):
         derivative = numpy.array([dS])
         return derivative
 
-    def dfun(self, x, c, local_coupling=0.0):
+    dfun_out = True
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
         x_ = x.reshape(x.shape[:-1]).T
-        c_ = c.reshape(c.shape[:-1]).T + local_coupling * x[0]
+        c_ = c.reshape(c.shape[:-1]).T
+        if not self._no_local_coupling(local_coupling):
+            c_ = c_ + local_coupling * x[0]
         deriv = _numba_dfun(x_, c_, self.a, self.b, self.d, self.gamma,
-                        self.tau_s, self.w, self.J_N, self.I_o)
-        return deriv.T[..., numpy.newaxis]
\ No newline at end of file
+                        self.tau_s, self.w, self.J_N, self.I_o, self._gufunc_out(out))
+        return deriv.T[..., numpy.newaxis]
+
+    def _numba_kernel(self):
+        return _numba_dfun_kernel
+
+    def _numba_kernel_parameters(self):
+        return [self.a, self.b, self.d, self.gamma, self.tau_s, self.w, self.J_N, self.I_o]
\ No newline at end of file
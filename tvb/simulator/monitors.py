@@ -70,7 +70,9 @@ import tvb.datatypes.equations as equations
 import tvb.basic.traits.util as util
 import tvb.basic.traits.types_basic as basic
 import tvb.basic.traits.core as core
-from tvb.simulator.common import iround, numpy_add_at
+from tvb.simulator.common import iround, sparse_average
+from tvb.simulator.cache import fetch_artifacts
+from tvb.simulator.reduction import ReductionGraph, Select, WindowSum, Subsample, ModeSum, NodeAverage
 
 
 LOG = get_logger(__name__)
@@ -104,6 +106,7 @@ class Monitor(core.Type):
     dt = None
     voi = None
     _stock = numpy.empty([])
+    _dtype = numpy.dtype(numpy.float64)
 
     def __str__(self):
         clsname = self.__class__.__name__
@@ -122,10 +125,20 @@ class Monitor(core.Type):
         """
         self.dt = simulator.integrator.dt
         self.istep = iround(self.period / self.dt)
+        self._dtype = numpy.dtype(simulator.dtype)
         self.voi = self.variables_of_interest
         if self.voi is None or self.voi.size == 0:
             self.voi = numpy.r_[:len(simulator.model.variables_of_interest)]
 
+    def _reduction_pipeline(self, simulator, *stages):
+        """
+        Merge the monitor's reduction pipeline, the selection of its variables
+        of interest followed by given stages, into the reduction graph of the
+        simulator's monitors, returning the stages which compute it.
+
+        """
+        return ReductionGraph.shared(simulator).pipeline(Select(self.voi), *stages)
+
     def record(self, step, observed):
         """Record a sample of the observed state at given step.
 
@@ -209,7 +222,8 @@ class Raw(Monitor):
 
     def sample(self, step, state):
         time = step * self.dt
-        return [time, state]
+        # the observed state may be a view of the simulator's state
+        return [time, state.copy()]
 
 
 class SubSample(Monitor):
@@ -219,10 +233,15 @@ class SubSample(Monitor):
     """
     _ui_name = "Temporally sub-sample"
 
+    def config_for_sim(self, simulator):
+        super(SubSample, self).config_for_sim(simulator)
+        _, self._subsample = self._reduction_pipeline(simulator, Subsample(self.istep))
+
     def sample(self, step, state):
-        if step % self.istep == 0:
+        subsample = self._subsample.value(step, state)
+        if subsample is not None:
             time = step * self.dt
-            return [time, state[self.voi, :]]
+            return [time, subsample.copy()]
 
 
 class SpatialAverage(Monitor):
@@ -298,20 +317,21 @@ class SpatialAverage(Monitor):
             raise Exception(msg)
 
         util.log_debug_array(LOG, self.spatial_mask, "spatial_mask", owner=self.__class__.__name__)
-        spatial_sum = numpy.zeros((number_of_nodes, number_of_areas))
-        spatial_sum[numpy.arange(number_of_nodes), self.spatial_mask] = 1
-        spatial_sum = spatial_sum.T
-        util.log_debug_array(LOG, spatial_sum, "spatial_sum")
-        nodes_per_area = numpy.sum(spatial_sum, axis=1)[:, numpy.newaxis]
-        self.spatial_mean = spatial_sum / nodes_per_area
-        util.log_debug_array(LOG, self.spatial_mean, "spatial_mean", owner=self.__class__.__name__)
+        # shared with the simulator's vertex to region averaging for the same mask
+        self._spatial_average = sparse_average(self.spatial_mask, number_of_areas)
+        _, _, self._node_average = self._reduction_pipeline(
+            simulator, Subsample(self.istep), NodeAverage(self._spatial_average))
 
+    @property
+    def spatial_mean(self):
+        "Dense matrix averaging nodes within areas, samples are averaged by the sparse one."
+        return self._spatial_average.matrix.toarray()
 
     def sample(self, step, state):
-        if step % self.istep == 0:
+        monitored_state = self._node_average.value(step, state)
+        if monitored_state is not None:
             time = step * self.dt
-            monitored_state = numpy.dot(self.spatial_mean, state[self.voi, :])
-            return [time, monitored_state.transpose((1, 0, 2))]
+            return [time, monitored_state]
 
     def create_time_series(self, storage_path, connectivity=None, surface=None,
                            region_map=None, region_volume_map=None):
@@ -338,11 +358,16 @@ class GlobalAverage(Monitor):
     """
     _ui_name = "Global average"
 
+    def config_for_sim(self, simulator):
+        super(GlobalAverage, self).config_for_sim(simulator)
+        _, self._subsample = self._reduction_pipeline(simulator, Subsample(self.istep))
+
     def sample(self, step, state):
         """Records if integration step corresponds to sampling period."""
-        if step % self.istep == 0:
+        subsample = self._subsample.value(step, state)
+        if subsample is not None:
             time = step * self.dt
-            data = numpy.mean(state[self.voi, :], axis=1)[:, numpy.newaxis, :]
+            data = numpy.mean(subsample, axis=1)[:, numpy.newaxis, :]
             return [time, data]
 
     def create_time_series(self, storage_path, connectivity=None, surface=None,
@@ -355,20 +380,27 @@ class TemporalAverage(Monitor):
     """
     Monitors the averaged value for the model's variable/s of interest over all
     the nodes at each sampling period. Time steps that are not modulo ``istep``
-    are stored temporarily in the ``_stock`` attribute and then that temporary
-    store is averaged and returned when time step is modulo ``istep``.
+    are summed in the ``_stock`` attribute, counting them in ``_window_count``,
+    and that sum is averaged and returned when time step is modulo ``istep``.
 
     """
     _ui_name = "Temporal average"
 
+    compensated_sum = basic.Bool(
+        label="Compensated sum", default=False, required=False, order=-1,
+        doc="""Compensate the sum of the states over each period for rounding
+        (Kahan summation), for long periods of many integration steps, at the
+        cost of a few more operations per step.""")
+
     def config_for_sim(self, simulator):
         super(TemporalAverage, self).config_for_sim(simulator)
-        stock_size = (self.istep, self.voi.shape[0],
-                      simulator.number_of_nodes,
-                      simulator.model.number_of_modes)
-        LOG.debug("Temporal average stock_size is %s" % (str(stock_size), ))
-        self._stock = numpy.zeros(stock_size)
-
+        _, self._window = self._reduction_pipeline(simulator, WindowSum(self.istep, self.compensated_sum))
+        # the running sum, shared with monitors summing the same variables over the same period
+        self._stock = self._window.total
+        self._window_count = self._window.count
+        self._window_step = self._window.last_step
+        self._window_compensation = self._window.compensation
+        LOG.debug("Temporal average stock_size is %s" % (str(self._stock.shape), ))
 
     def sample(self, step, state):
         """
@@ -377,9 +409,9 @@ class TemporalAverage(Monitor):
         period, the ``_stock`` is averaged over time for return. 
 
         """
-        self._stock[((step % self.istep) - 1), :] = state[self.voi]
-        if step % self.istep == 0:
-            avg_stock = numpy.mean(self._stock, axis=0)
+        total = self._window.value(step, state)
+        if total is not None:
+            avg_stock = total / self._window.n_summed
             time = (step - self.istep / 2.0) * self.dt
             return [time, avg_stock]
 
@@ -395,6 +427,13 @@ class Projection(Monitor):
             " connectivity. For iEEG/EEG/MEG monitors, this must be specified when performing a region"
             " simulation but is optional for a surface simulation.")
 
+    project_once = basic.Bool(
+        label="Project once per period", default=True, required=False, order=6,
+        doc="Sum the state of the sources over each sampling period and apply the gain once per"
+            " sample rather than at every time step. As the projection is linear, samples equal"
+            " those projected per step up to rounding. Monitors of a simulation summing the same"
+            " variables of interest over the same period, e.g. a TemporalAverage, share the sum.")
+
     @staticmethod
     def oriented_gain(gain, orient):
         "Apply orientations to gain matrix."
@@ -479,8 +518,11 @@ class Projection(Monitor):
 
         # reduce to region lead field if region sim
         if not using_cortical_surface and self.gain.shape[1] == self.rmap.size:
-            gain = numpy.zeros((self.gain.shape[0], conn.number_of_regions))
-            numpy_add_at(gain.T, self.rmap, self.gain.T)
+            region_gain = lambda: {'gain': sparse_average(self.rmap, conn.number_of_regions).sum(self.gain.T).T}
+            parts = self.gain, self.rmap, conn.number_of_regions
+            gain = fetch_artifacts(simulator._artifact_cache, 'region_gain', parts, region_gain)['gain']
+            # cached gain is read-only, but it is modified in place below
+            gain = numpy.array(gain)
             LOG.debug('Region mapping gain shape %s to %s', self.gain.shape, gain.shape)
             self.gain = gain
 
@@ -502,21 +544,45 @@ class Projection(Monitor):
         LOG.debug('Zeroed %d NaN gain coefficients', nan_mask.sum())
 
         # attrs used for recording
-        self._state = numpy.zeros((self.gain.shape[0], len(self.voi)))
+        self.gain = self.gain.astype(self._dtype)
+        self._state = numpy.zeros((self.gain.shape[0], len(self.voi)), self._dtype)
         self._period_in_steps = int(self.period / self.dt)
         LOG.debug('State shape %s, period in steps %s', self._state.shape, self._period_in_steps)
+        self._window = self._node_sum = None
+        if self.project_once:
+            _, self._window, self._node_state = self._reduction_pipeline(
+                simulator, WindowSum(self._period_in_steps), ModeSum())
+            # the shared sum is part of the monitor's state, e.g. for checkpoints
+            self._node_sum = self._window.total
+            self._window_count = self._window.count
+            self._window_step = self._window.last_step
+        else:
+            _, self._node_state = self._reduction_pipeline(simulator, ModeSum())
 
         LOG.info('Projection configured gain shape %s', self.gain.shape)
 
     def sample(self, step, state):
         "Record state, returning sample at sampling frequency / period."
-        self._state += self.gain.dot(state[self.voi].sum(axis=-1).T)
+        if self._window is not None:
+            return self._sample_once(step, state)
+        self._state += self.gain.dot(self._node_state.value(step, state).T)
         if step % self._period_in_steps == 0:
             time = (step - self._period_in_steps / 2.0) * self.dt
             sample = self._state.copy() / self._period_in_steps
             self._state[:] = 0.0
             return time, sample.T[..., numpy.newaxis] # for compatibility
 
+    def _sample_once(self, step, state):
+        "Sum the state over the period, projecting the sum once per sample."
+        node_sum = self._node_state.value(step, state)
+        if node_sum is not None:
+            time = (step - self._period_in_steps / 2.0) * self.dt
+            sample = self.gain.dot(node_sum.T)
+            sample /= self._window.n_summed
+            return time, sample.T[..., numpy.newaxis]
+
+    _window = None
+    _node_state = None
     _gain = None
 
     def _get_gain(self):
@@ -801,12 +867,33 @@ class Bold(Monitor):
         doc= """Duration of the hrf kernel""",
         order=-1)
 
+    hrf_convolution = basic.String(
+        label="HRF convolution",
+        default="incremental",
+        required=False,
+        order=-1,
+        doc="""How the stock of temporally averaged states is convolved with
+        the HRF: 'direct' keeps the stock of the whole HRF duration and
+        applies the HRF to all of it at each sample, while 'incremental', the
+        default, adds each stock sample, weighted by the HRF at its lag, to
+        the partial sums of the samples to which it contributes, keeping only
+        as many partial sums as samples fall within the HRF duration. Both
+        give the same signal, up to rounding.""")
+
+    compensated_sum = basic.Bool(
+        label="Compensated sum", default=False, required=False, order=-1,
+        doc="""Compensate the sum of the states over each interim period, of
+        which the stock holds the averages, for rounding (Kahan summation),
+        for small integration steps.""")
+
     _interim_period = None
     _interim_istep = None
     _interim_stock = None
     _stock_steps = None
     _stock_time = None
     _stock_sample_rate = 2 ** -2
+    _lag_weights = None
+    _weight_table = None
     hemodynamic_response_function = None
 
     def compute_hrf(self):
@@ -837,36 +924,93 @@ class Bold(Monitor):
 
     def config_for_sim(self, simulator):
         super(Bold, self).config_for_sim(simulator)
+        if self.hrf_convolution not in ('direct', 'incremental'):
+            raise ValueError("Unknown HRF convolution %r, expected 'direct' or 'incremental'."
+                             % (self.hrf_convolution, ))
         self.compute_hrf()
         sample_shape = self.voi.shape[0], simulator.number_of_nodes, simulator.model.number_of_modes
-        self._interim_stock = numpy.zeros((self._interim_istep,) + sample_shape)
+        self.hemodynamic_response_function = self.hemodynamic_response_function.astype(self._dtype)
+        _, self._interim_window = self._reduction_pipeline(
+            simulator, WindowSum(self._interim_istep, self.compensated_sum))
+        # the running sum of the states of an interim period
+        self._interim_stock = self._interim_window.total
+        self._window_count = self._interim_window.count
+        self._window_step = self._interim_window.last_step
+        self._window_compensation = self._interim_window.compensation
         LOG.debug("BOLD inner buffer %s %.2f MB" % (
             self._interim_stock.shape, self._interim_stock.nbytes/2**20))
-        self._stock = numpy.zeros((self._stock_steps,) + sample_shape)
+        if self.hrf_convolution == 'direct':
+            n_stock = self._stock_steps
+        else:
+            # weight of the stock sample at each lag, as the direct convolution applies the HRF
+            self._lag_weights = numpy.roll(self.hemodynamic_response_function[0, ::-1], 1)
+            # partial sums of the samples within the HRF duration from a stock sample
+            n_stock = int(numpy.ceil(self._stock_steps * self._interim_istep / float(self.istep))) + 1
+            self._configure_weight_table()
+        self._stock = numpy.zeros((n_stock,) + sample_shape, self._dtype)
         LOG.debug("BOLD outer buffer %s %.2f MB" % (
             self._stock.shape, self._stock.nbytes/2**20))
 
+    def _configure_weight_table(self):
+        """
+        Tabulate the HRF weights of a stock sample for the samples it contributes
+        to, from the first at or after it, which repeat with the stock steps
+        between steps at which both a sample and a stock sample are due.
+
+        """
+        n_period = self.istep // numpy.gcd(self.istep, self._interim_istep)
+        self._weight_table = []
+        for stock_step in range(n_period, 2 * n_period):
+            step = stock_step * self._interim_istep
+            samples = numpy.r_[-(-step // self.istep):(stock_step + self._stock_steps) * self._interim_istep
+                               // self.istep + 1]
+            lags = samples * self.istep // self._interim_istep - stock_step
+            weights = self._lag_weights[lags[lags < self._stock_steps]]
+            self._weight_table.append(weights.reshape((-1, 1, 1, 1)))
+
+    def _add_to_stock(self, step, stock_sample):
+        "Add a stock sample to the stock, as the direct or incremental convolution requires."
+        stock_step = step // self._interim_istep
+        if self.hrf_convolution == 'direct':
+            self._stock[((stock_step % self._stock_steps) - 1), :] = stock_sample
+            return
+        # the partial sums of consecutive samples, wrapping around the stock
+        weights = self._weight_table[stock_step % len(self._weight_table)]
+        n_stock, n_weight = self._stock.shape[0], weights.shape[0]
+        first = -(-step // self.istep) % n_stock
+        n_before_wrap = min(n_weight, n_stock - first)
+        self._stock[first:first + n_before_wrap] += weights[:n_before_wrap] * stock_sample
+        if n_before_wrap < n_weight:
+            self._stock[:n_weight - n_before_wrap] += weights[n_before_wrap:] * stock_sample
+
+    def _convolve(self, step):
+        "Convolution of the stock with the HRF at a sample step."
+        if self.hrf_convolution == 'direct':
+            hrf = numpy.roll(self.hemodynamic_response_function,
+                             ((step // self._interim_istep % self._stock_steps) - 1),
+                             axis=1)
+            bold = numpy.dot(hrf, self._stock.transpose((1, 2, 0, 3)))
+            return bold.reshape(self._stock.shape[1:])
+        partial_sum = self._stock[step // self.istep % self._stock.shape[0]]
+        bold = partial_sum.copy()
+        partial_sum[:] = 0.0
+        return bold
 
     def sample(self, step, state):
         # Update the interim-stock at every step
-        self._interim_stock[((step % self._interim_istep) - 1), :] = state[self.voi, :]
+        interim_sum = self._interim_window.value(step, state)
         # At stock's period update it with the temporal average of interim-stock
-        if step % self._interim_istep == 0:
-            avg_interim_stock = numpy.mean(self._interim_stock, axis=0)
-            self._stock[((step/self._interim_istep % self._stock_steps) - 1), :] = avg_interim_stock
+        if interim_sum is not None:
+            avg_interim_stock = interim_sum / self._interim_window.n_summed
+            self._add_to_stock(step, avg_interim_stock)
         # At the monitor's period, apply the heamodynamic response function to
         # the stock and return the resulting BOLD signal.
         if step % self.istep == 0:
             time = step * self.dt
-            hrf = numpy.roll(self.hemodynamic_response_function,
-                             ((step/self._interim_istep % self._stock_steps) - 1),
-                             axis=1)
+            bold = self._convolve(step)
             if isinstance(self.hrf_kernel, equations.FirstOrderVolterra):
                 k1_V0 = self.hrf_kernel.parameters["k_1"] * self.hrf_kernel.parameters["V_0"]
-                bold = (numpy.dot(hrf, self._stock.transpose((1, 2, 0, 3))) - 1.0) * k1_V0
-            else:
-                bold = numpy.dot(hrf, self._stock.transpose((1, 2, 0, 3)))
-            bold = bold.reshape(self._stock.shape[1:])
+                bold = (bold - 1.0) * k1_V0
             return [time, bold]
 
 
@@ -878,7 +1022,8 @@ class BoldRegionROI(Bold):
 
     This was originated to compare the results of a Bold monitor with a
     region level simulation with that of an otherwise identical surface
-    simulation.
+    simulation, so that samples have the shape of the region simulation's,
+    (variables of interest, regions, modes).
 
     """
     _ui_name = "BOLD Region ROI (only with surface)"
@@ -886,14 +1031,14 @@ class BoldRegionROI(Bold):
     def config_for_sim(self, simulator):
         super(BoldRegionROI, self).config_for_sim(simulator)
         self.region_mapping = simulator.surface.region_mapping
+        # sparse average of vertices and non-cortical regions, as the simulator's
+        self._region_average = NodeAverage(simulator._region_average)
 
-    def sample(self, step, state, array=numpy.array):
+    def sample(self, step, state):
         result = super(BoldRegionROI, self).sample(step, state)
         if result:
             t, data = result
-            # TODO use reduceat
-            return [t, array([data.flat[self.region_mapping==i].mean()
-                              for i in range(self.region_mapping.max())])]
+            return [t, self._region_average.average(data)]
         else:
             return None
 
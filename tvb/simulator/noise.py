@@ -41,14 +41,44 @@ RandomState.
 
 """
 
+import os
+import copy
+import math
+import threading
 import numpy
+from multiprocessing.pool import ThreadPool
 from tvb.datatypes import arrays, equations
 from tvb.basic.traits import types_basic as basic, core
 from .common import get_logger, simple_gen_astr
 
+try:
+    from numpy.random import Generator, Philox
+except ImportError:
+    # counter-based streams require NumPy 1.17 or later
+    Generator = Philox = None
+
 
 LOG = get_logger(__name__)
 
+# thread pools of the random streams of this process, by number of threads
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+
+
+def _thread_pool(n_thread):
+    "Thread pool of n_thread threads, shared by the random streams of this process and started on first use."
+    # a forked process inherits the pools but not their threads
+    key = n_thread, os.getpid()
+    with _thread_pools_lock:
+        if key not in _thread_pools:
+            _thread_pools[key] = ThreadPool(n_thread)
+        return _thread_pools[key]
+
+
+def _same_state(state, other):
+    "Whether two states of a RandomState are equal."
+    return len(state) == len(other) and all(numpy.array_equal(a, b) for a, b in zip(state, other))
+
 
 class RandomStream(core.Type):
     """
@@ -97,6 +127,222 @@ class RandomStream(core.Type):
         numpy.random.RandomState.__init__(self.value, seed=self.init_seed)
 
 
+class CounterStream(object):
+    """
+    A counter-based random stream, which draws the variates of each block of
+    nodes from a Philox generator keyed by the seed and starting from a counter
+    given by the index of the draw and of the block. The variates of a node
+    thus depend only on seed, draw and node, and not on how nodes are
+    partitioned over threads, processes or batch members, and any draw can be
+    regenerated from the seed alone, e.g. to continue from a checkpoint.
+
+    Nodes lie along the second axis of the drawn arrays, as for the
+    (state variable, node, mode) shape of noise.
+
+    """
+
+    block_size = 64
+
+    def __init__(self, seed=42, n_thread=1):
+        if Philox is None:
+            raise ImportError('Counter-based random streams require NumPy 1.17 or later.')
+        self.seed = seed
+        self.n_thread = n_thread
+        self.draw = 0
+
+    def _blocks(self, shape):
+        "Index, node axis and slice into an array of given shape of each node block."
+        if not shape:
+            return [(0, None, Ellipsis)]
+        axis = 1 if len(shape) > 1 else 0
+        return [(block, axis, (slice(None), ) * axis + (slice(lo, lo + self.block_size), ))
+                for block, lo in enumerate(range(0, shape[axis], self.block_size))]
+
+    def _fill(self, draw, out, blocks, method):
+        "Fill given blocks of out with standard variates of given draw."
+        bit_generator = Philox(key=self.seed)
+        state = bit_generator.state
+        generator = Generator(bit_generator)
+        for block, axis, index in blocks:
+            state['state']['counter'] = numpy.array([0, 0, block, draw], numpy.uint64)
+            bit_generator.state = state
+            view = out[index]
+            if axis is None:
+                view[...] = getattr(generator, method)()
+                continue
+            # a partial last block is cut from a full one, so that a node's
+            # variates do not depend on the number of nodes
+            shape = list(view.shape)
+            shape[axis] = self.block_size
+            view[...] = getattr(generator, method)(tuple(shape))[index[:axis] + (slice(0, view.shape[axis]), )]
+
+    def _standard(self, method, size, nodes=None):
+        "Draw standard variates, block-wise and in parallel if n_thread > 1."
+        shape = tuple(numpy.atleast_1d(size)) if size is not None else ()
+        out = numpy.empty(shape)
+        blocks = self._blocks(shape)
+        if nodes is not None:
+            # only the blocks holding the given nodes
+            needed = set(numpy.asarray(nodes) // self.block_size)
+            blocks = [block for block in blocks if block[0] in needed]
+        if self.n_thread > 1 and len(blocks) > 1:
+            parts = [part for part in numpy.array_split(numpy.arange(len(blocks)), self.n_thread) if part.size]
+            fill = lambda part: self._fill(self.draw, out, [blocks[i] for i in part], method)
+            _thread_pool(self.n_thread).map(fill, parts)
+        else:
+            self._fill(self.draw, out, blocks, method)
+        self.draw += 1
+        if nodes is not None:
+            out = out[:, nodes] if len(shape) > 1 else out[nodes]
+        return out
+
+    def normal(self, loc=0.0, scale=1.0, size=None, nodes=None):
+        """
+        Draw normal variates of given size. If nodes are given, only the
+        variates of those nodes are drawn, as they would be in the full array.
+
+        """
+        variates = self._standard('standard_normal', size, nodes)
+        if scale != 1.0:
+            variates *= scale
+        if loc != 0.0:
+            variates += loc
+        return variates
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        variates = self._standard('random', size)
+        variates *= high - low
+        variates += low
+        return variates
+
+    def get_state(self):
+        return 'Philox', self.seed, self.draw
+
+    def set_state(self, state):
+        _, self.seed, self.draw = state
+        self.seed, self.draw = int(self.seed), int(self.draw)
+
+
+class BlockStream(object):
+    """
+    Draws the normal variates of many consecutive draws of the same size with
+    a single call to a wrapped RandomState, and hands them out one draw at a
+    time. As a RandomState draws a block of n rows exactly like n successive
+    draws of one row, the variates are those the wrapped stream would give per
+    draw. With background set, the next block is drawn by a thread while the
+    current one is handed out.
+
+    A block is started by the second consecutive draw of a size, such that
+    single draws, e.g. of initial conditions, do not fill a block. Any other
+    use of the stream, except get_state and set_state, first rewinds the
+    wrapped stream to just after the variates handed out so far.
+
+    """
+
+    # bound on the size of a block, for large (e.g. surface) noise shapes
+    max_bytes = 2 ** 24
+
+    def __init__(self, stream, n_step=256, background=False):
+        self.stream = stream
+        self.n_step = n_step
+        self.background = background
+        self._size = None
+        # stream state before the current block, the block, its length and next row
+        self._state = None
+        self._block = None
+        self._n_row = 0
+        self._row = 0
+        self._pending = None
+        # last state given by get_state within the block, and the position in the block it stands for
+        self._saved = None
+
+    def __getstate__(self):
+        self.rewind()
+        state = self.__dict__.copy()
+        # other references to the stream may have been copied before rewinding it
+        state['stream'] = copy.deepcopy(self.stream)
+        return state
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'stream':
+            raise AttributeError(name)
+        self.rewind()
+        return getattr(self.stream, name)
+
+    def _draw(self, size):
+        "Draw a block of variates of given size, with the stream's state before the draw."
+        n_step = max(1, min(self.n_step, self.max_bytes // (8 * int(numpy.prod(size)))))
+        state = self.stream.get_state()
+        return state, self.stream.normal(size=(n_step, ) + size)
+
+    def _next_block(self):
+        if self._pending is not None:
+            self._state, self._block = self._pending.get()
+            self._pending = None
+        else:
+            self._state, self._block = self._draw(self._size)
+        self._n_row, self._row = self._block.shape[0], 0
+        self._saved = None
+        if self.background:
+            self._pending = _thread_pool(1).apply_async(self._draw, (self._size, ))
+
+    def rewind(self):
+        "Set the wrapped stream just after the variates handed out, dropping drawn blocks."
+        if self._pending is not None:
+            self._pending.wait()
+            self._pending = None
+        if self._block is not None:
+            self.stream.set_state(self._state)
+            if self._row:
+                self.stream.normal(size=(self._row, ) + self._block.shape[1:])
+            self._state = self._block = self._saved = None
+            self._n_row = self._row = 0
+        self._size = None
+
+    def get_state(self):
+        """
+        State of the wrapped stream just after the variates handed out. Within
+        a block, it is that of a copy of the stream advanced to the position
+        in the block, which is kept, and the position is stored with the state,
+        such that setting it again continues within the block.
+
+        """
+        if self._block is None:
+            return self.stream.get_state()
+        position = numpy.random.RandomState()
+        position.set_state(self._state)
+        if self._row:
+            position.normal(size=(self._row, ) + self._block.shape[1:])
+        state = position.get_state()
+        self._saved = state, self._row
+        return state
+
+    def set_state(self, state):
+        if self._saved is not None and _same_state(self._saved[0], state):
+            self._row = self._saved[1]
+            return
+        self.rewind()
+        self.stream.set_state(state)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        if size is not None and not isinstance(size, tuple):
+            size = tuple(numpy.atleast_1d(size))
+        if size is None or size != self._size:
+            self.rewind()
+            self._size = size
+            return self.stream.normal(loc, scale, size)
+        if self._row == self._n_row:
+            self._next_block()
+        # a copy, as callers scale the variates in place, and rows may be handed out again after set_state
+        variates = self._block[self._row].copy()
+        self._row += 1
+        if scale != 1.0:
+            variates *= scale
+        if loc != 0.0:
+            variates += loc
+        return variates
+
+
 class Noise(core.Type):
     """
     Defines a base class for noise. Specific noises are derived from this class
@@ -146,7 +392,47 @@ class Noise(core.Type):
         doc="""An instance of numpy's RandomState associated with this
         specific Noise object.""")
 
+    counter_based = basic.Bool(
+        label="Counter-based random stream",
+        default=False,
+        required=False,
+        doc="""Draw noise from a counter-based stream seeded with
+        ``counter_seed`` instead of ``random_stream``, such that the noise of
+        each block of nodes can be generated in parallel and does not depend
+        on how nodes are partitioned. See CounterStream.""")
+
+    counter_seed = basic.Integer(
+        label="Counter-based random seed",
+        default=42,
+        required=False,
+        doc="""Seed of the counter-based random stream.""")
+
+    counter_threads = basic.Integer(
+        label="Counter-based random threads",
+        default=1,
+        required=False,
+        doc="""Number of threads generating the node blocks of the
+        counter-based random stream.""")
+
+    block_steps = basic.Integer(
+        label="Noise block steps",
+        default=256,
+        required=False,
+        doc="""Number of time steps of noise drawn per call to
+        ``random_stream``, which are then used step by step. The noise is the
+        same as when drawn per step, see BlockStream. Set to 1 to draw noise
+        per step.""")
+
+    block_background = basic.Bool(
+        label="Background noise blocks",
+        default=False,
+        required=False,
+        doc="""Draw the next block of noise in a background thread while the
+        current one is used.""")
+
     dt = None
+    # floating point type of generated noise, set by the simulator
+    dtype = numpy.dtype(numpy.float64)
     # For use if coloured
     _E = None
     _sqrt_1_E2 = None
@@ -165,8 +451,22 @@ class Noise(core.Type):
     def __str__(self):
         return simple_gen_astr(self, 'dt ntau')
 
+    def _configure_stream(self):
+        "Start a counter-based random stream, or draw noise in blocks, if required."
+        stream = self.random_stream
+        if isinstance(stream, BlockStream):
+            stream.rewind()
+            stream = stream.stream
+        if self.counter_based:
+            stream = CounterStream(self.counter_seed, self.counter_threads)
+        elif self.block_steps > 1 and isinstance(stream, numpy.random.RandomState):
+            stream = BlockStream(stream, self.block_steps, self.block_background)
+        # bypass the trait's type check, the stream only stands in for a RandomState
+        type(self).random_stream._put_value_on_instance(self, stream)
+
     def configure_white(self, dt, shape=None):
         """Set the time step (dt) of noise or integration time"""
+        self._configure_stream()
         self.dt = dt
         LOG.info('White noise configured with dt=%g', self.dt)
 
@@ -205,10 +505,11 @@ class Noise(core.Type):
         #      below, ie, factoring out the explicit Box-Muller.
         #NOTE: The actual implementation factors out the explicit Box-Muller,
         #      using numpy's normal() instead.
+        self._configure_stream()
         self.dt = dt
         self._E = numpy.exp(-self.dt / self.ntau)
         self._sqrt_1_E2 = numpy.sqrt((1.0 - self._E ** 2))
-        self._eta = self.random_stream.normal(size=shape)
+        self._eta = self._normal(shape)
         self._dt_sqrt_lambda = self.dt * numpy.sqrt(1.0 / self.ntau)
         LOG.info('Colored noise configured with dt=%g E=%g sqrt_1_E2=%g eta=%g & dt_sqrt_lambda=%g',
                   self.dt, self._E, self._sqrt_1_E2, self._eta, self._dt_sqrt_lambda)
@@ -221,15 +522,20 @@ class Noise(core.Type):
             noise = self.white(shape)
         return noise
 
+    def _normal(self, shape):
+        "Draw standard normal variates in the noise's floating point type."
+        return self.random_stream.normal(size=shape).astype(self.dtype, copy=False)
+
     def coloured(self, shape):
         "Generate colored noise. [FoxVemuri_1988]_"
-        self._h = self._sqrt_1_E2 * self.random_stream.normal(size=shape)
+        self._h = self._sqrt_1_E2 * self._normal(shape)
         self._eta =  self._eta * self._E + self._h
         return self._dt_sqrt_lambda * self._eta
 
     def white(self, shape):
         "Generate white noise."
-        noise = numpy.sqrt(self.dt) * self.random_stream.normal(size=shape)
+        noise = self._normal(shape)
+        noise *= math.sqrt(self.dt)
         return noise
 
 
@@ -306,4 +612,4 @@ class Multiplicative(Noise):
         """
         self.b.pattern = state_variables
         g_x = numpy.sqrt(2.0 * self.nsig) * self.b.pattern
-        return g_x
+        return g_x.astype(self.dtype, copy=False)
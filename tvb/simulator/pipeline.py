@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Pipelined execution of monitors on a background thread.
+
+Observed states are copied into a bounded ring of preallocated buffers and
+handed to a worker thread which runs the monitors, such that integration of
+the next steps overlaps monitoring of the previous ones. The worker processes
+the buffers in order, so monitor outputs are collected in step order and are
+identical to those of synchronous monitoring.
+
+"""
+
+import threading
+import numpy
+from .common import get_logger
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+LOG = get_logger(__name__)
+
+
+class MonitorPipeline(object):
+    """
+    Runs a simulator's monitor output function on a worker thread, from a ring
+    of depth buffers. Submitting a state blocks only while all buffers are in
+    use, and returns the outputs of the steps completed so far.
+
+    """
+
+    def __init__(self, monitor_output, depth=4):
+        if depth < 1:
+            raise ValueError('Pipeline depth must be at least 1, got %d.' % (depth, ))
+        self.monitor_output = monitor_output
+        self.depth = depth
+        self._buffers = None
+        self._free = queue.Queue()
+        self._pending = queue.Queue()
+        self._done = queue.Queue()
+        self._n_submitted = 0
+        self._n_collected = 0
+        self._error = None
+        self._worker = threading.Thread(target=self._work, name='monitor pipeline')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _work(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            step, index = item
+            output = None
+            if self._error is None:
+                try:
+                    output = self.monitor_output(step, self._buffers[index])
+                except Exception as exc:
+                    self._error = exc
+            self._free.put(index)
+            self._done.put(output)
+
+    def _allocate(self, state):
+        self._buffers = numpy.empty((self.depth, ) + state.shape, state.dtype)
+        for index in range(self.depth):
+            self._free.put(index)
+        LOG.debug('monitor pipeline of %d buffers of shape %r', self.depth, state.shape)
+
+    def _collect(self, block):
+        "Collect outputs of completed steps, waiting for all if block."
+        outputs = []
+        while self._n_collected < self._n_submitted:
+            try:
+                outputs.append(self._done.get(block))
+            except queue.Empty:
+                break
+            self._n_collected += 1
+        if self._error is not None:
+            # outputs after a failed step are not reliable, raise the monitor's error instead
+            raise self._error
+        return outputs
+
+    def submit(self, step, state):
+        "Copy state of step into a free buffer for monitoring, returning completed outputs."
+        if self._buffers is None:
+            self._allocate(state)
+        index = self._free.get()
+        self._buffers[index][...] = state
+        self._pending.put((step, index))
+        self._n_submitted += 1
+        return self._collect(block=False)
+
+    def drain(self):
+        "Wait for all submitted steps to be monitored, returning their outputs."
+        return self._collect(block=True)
+
+    def close(self):
+        "Stop the worker once it has finished the submitted steps."
+        self._pending.put(None)
+        self._worker.join()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Per-phase timing of the simulator's integration loop.
+
+When a Simulator's ``profiling`` attribute is set, the phases of each step,
+i.e. coupling, stimulus, integration scheme, model dfun, history update and
+each monitor's record, are wrapped to accumulate their wall time, excluding
+time spent in nested phases, such as dfun evaluations within the scheme. If
+``tracemalloc`` is tracing, the peak memory allocated in each call of a phase
+is recorded as well. Without profiling, the loop is not wrapped at all.
+
+"""
+
+import time
+from .common import get_logger
+
+
+LOG = get_logger(__name__)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class PhaseProfiler(object):
+    "Accumulates wall time and allocations of named phases over a number of steps."
+
+    def __init__(self, n_step):
+        self.n_step = n_step
+        self.trace_memory = tracemalloc is not None and tracemalloc.is_tracing()
+        self.totals = {}
+        self.calls = {}
+        self.peak_bytes = {}
+        self._children = 0.0
+        self._start = self._stop = None
+
+    def start(self):
+        self._start = _clock()
+
+    def stop(self):
+        self._stop = _clock()
+
+    def _record(self, phase, elapsed, peak_bytes):
+        self.totals[phase] = self.totals.get(phase, 0.0) + elapsed
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if self.trace_memory:
+            self.peak_bytes[phase] = max(self.peak_bytes.get(phase, 0), peak_bytes)
+
+    def wrap(self, phase, fn):
+        "Wrap a function such that its calls are timed as given phase."
+        def timed(*args, **kwds):
+            outer_children, self._children = self._children, 0.0
+            if self.trace_memory:
+                # resets the peak, such that it measures allocations in this call
+                tracemalloc.clear_traces()
+            tic = _clock()
+            try:
+                return fn(*args, **kwds)
+            finally:
+                elapsed = _clock() - tic
+                peak_bytes = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+                self._record(phase, elapsed - self._children, peak_bytes)
+                self._children = outer_children + elapsed
+        return timed
+
+    def iterate(self, phase, iterable):
+        "Iterate, timing each step of the iteration as given phase."
+        next_item = self.wrap(phase, next)
+        iterator = iter(iterable)
+        while True:
+            try:
+                item = next_item(iterator)
+            except StopIteration:
+                return
+            yield item
+
+    @property
+    def wall_time(self):
+        return (self._stop if self._stop is not None else _clock()) - self._start
+
+    def report(self):
+        """
+        Return a dict with the wall time, number of steps and, for each phase,
+        the number of calls, total time, mean time per step and share of wall
+        time, and peak bytes allocated per call if memory is traced. Time not
+        spent in any phase, e.g. by the consumer of the simulator's output,
+        is reported as the ``other`` phase.
+
+        """
+        wall_time = self.wall_time
+        n_step = max(self.n_step, 1)
+        totals = dict(self.totals)
+        totals['other'] = wall_time - sum(self.totals.values())
+        phases = {}
+        for phase, total in totals.items():
+            phases[phase] = {'calls': self.calls.get(phase, 0),
+                             'total': total,
+                             'per_step': total / n_step,
+                             'share': total / wall_time if wall_time > 0 else 0.0}
+            if self.trace_memory:
+                phases[phase]['peak_bytes'] = self.peak_bytes.get(phase, 0)
+        return {'wall_time': wall_time, 'n_step': self.n_step, 'phases': phases}
+
+    def __str__(self):
+        report = self.report()
+        lines = ['%d steps in %.3f s' % (report['n_step'], report['wall_time']),
+                 '%-32s %10s %12s %12s %7s' % ('phase', 'calls', 'total (s)', 'per step (s)', 'share')]
+        for phase, stats in sorted(report['phases'].items(), key=lambda item: -item[1]['total']):
+            line = '%-32s %10d %12.4g %12.4g %6.1f%%' % (phase, stats['calls'], stats['total'],
+                                                       stats['per_step'], 100 * stats['share'])
+            if 'peak_bytes' in stats:
+                line += ' %10.3f MB' % (stats['peak_bytes'] * 2**-20, )
+            lines.append(line)
+        return '\n'.join(lines)
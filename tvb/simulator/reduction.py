@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+"""
+Reduction pipelines shared by the monitors of a simulation.
+
+Each monitor declares how it reduces the observed state as a pipeline of
+stages: selection of its variables of interest, a temporal window, a spatial
+operator, the result of which it transforms into its samples, e.g. by the
+lead field of a projection monitor or the HRF of the Bold monitor. The
+pipelines of a simulation's monitors are merged on their common prefixes into
+a graph, where stages of the same kind and parameters, following the same
+stages, are shared, such that each intermediate is computed once per time
+step however many monitors use it.
+
+"""
+
+import numpy
+from tvb.simulator.common import get_logger
+
+
+LOG = get_logger(__name__)
+
+
+class Stage(object):
+    """
+    Stage of a reduction pipeline, computing its value from the value of the
+    previous stage at most once per time step. The value is None at steps
+    where the stage has nothing to produce, e.g. within a temporal window, and
+    may be an array reused from step to step, which monitors copy if they
+    return it.
+
+    """
+
+    parent = None
+    shape = None
+    dtype = None
+    n_user = 0
+    _step = None
+    _observed = None
+    _value = None
+
+    @property
+    def key(self):
+        "Key identifying the stages which compute the same value following the same stage."
+        return type(self).__name__,
+
+    def output_shape(self, shape):
+        "Shape of the value of the stage for values of given shape from the previous stage."
+        return shape
+
+    def configure(self, parent):
+        "Configure the stage to follow given stage."
+        self.parent = parent
+        self.shape = self.output_shape(parent.shape)
+        self.dtype = parent.dtype
+        self.children = {}
+
+    def value(self, step, observed):
+        "Value of the stage at given step, for the observed state of that step."
+        if step != self._step or observed is not self._observed:
+            self._value = self.compute(step, observed)
+            self._step, self._observed = step, observed
+        return self._value
+
+    def compute(self, step, observed):
+        raise NotImplementedError
+
+    def __getstate__(self):
+        # the value of the last step is not part of a copy's state
+        state = self.__dict__.copy()
+        for name in ('_step', '_observed', '_value'):
+            state.pop(name, None)
+        return state
+
+    def __str__(self):
+        return '%s()' % (type(self).__name__, )
+
+
+class Observed(Stage):
+    "First stage of all pipelines, the state observed by the model."
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.children = {}
+
+    def value(self, step, observed):
+        return observed
+
+
+class Select(Stage):
+    "Selection of the monitor's variables of interest from the observed state."
+
+    def __init__(self, voi):
+        self.voi = numpy.asarray(voi, numpy.intp)
+
+    @property
+    def key(self):
+        return type(self).__name__, tuple(self.voi.tolist())
+
+    def output_shape(self, shape):
+        return (self.voi.size, ) + tuple(shape[1:])
+
+    def configure(self, parent):
+        super(Select, self).configure(parent)
+        # selecting all variables in order leaves the state as is
+        self._all = numpy.array_equal(self.voi, numpy.r_[:parent.shape[0]])
+        self._buffer = None
+
+    def compute(self, step, observed):
+        state = self.parent.value(step, observed)
+        if self._all and state.shape[0] == self.voi.size:
+            return state
+        buffer = self._buffer
+        if buffer is None or buffer.shape[1:] != state.shape[1:] or buffer.dtype != state.dtype:
+            buffer = self._buffer = numpy.empty((self.voi.size, ) + state.shape[1:], state.dtype)
+        return numpy.take(state, self.voi, axis=0, out=buffer)
+
+    def __str__(self):
+        return 'Select(voi=%s)' % (self.voi.tolist(), )
+
+
+class WindowSum(Stage):
+    """
+    Sum of the state over windows of n_step time steps, ending at multiples of
+    n_step, which is the value of the stage at those steps. The running sum,
+    ``total``, the number of steps summed, ``count``, and the last step summed,
+    ``last_step``, are the state of the monitors using it, e.g. for
+    checkpoints, and take the memory of a single state, whatever the window.
+
+    If compensated, the sum is compensated for rounding (Kahan summation),
+    with the running compensation in ``compensation``, for long windows where
+    the rounding of each addition accumulates.
+
+    """
+
+    def __init__(self, n_step, compensated=False):
+        self.n_step = int(n_step)
+        self.compensated = bool(compensated)
+
+    @property
+    def key(self):
+        return type(self).__name__, self.n_step, self.compensated
+
+    def configure(self, parent):
+        super(WindowSum, self).configure(parent)
+        self.total = numpy.zeros(self.shape, self.dtype)
+        self.count = numpy.zeros((1, ), numpy.int64)
+        self.last_step = numpy.zeros((1, ), numpy.int64)
+        self.compensation = None
+        if self.compensated:
+            self.compensation = numpy.zeros(self.shape, self.dtype)
+            self._work = numpy.empty(self.shape, self.dtype), numpy.empty(self.shape, self.dtype)
+
+    @property
+    def n_summed(self):
+        "Number of steps summed in the current window."
+        return int(self.count[0])
+
+    def _add(self, state):
+        if not self.compensated:
+            self.total += state
+            return
+        # y = state - c, t = total + y, c = (t - total) - y, total = t
+        y, t = self._work
+        numpy.subtract(state, self.compensation, out=y)
+        numpy.add(self.total, y, out=t)
+        numpy.subtract(t, self.total, out=self.compensation)
+        self.compensation -= y
+        self.total[...] = t
+
+    def compute(self, step, observed):
+        # the state of a step is added once, even if observed again
+        if step != self.last_step[0]:
+            self.last_step[0] = step
+            state = self.parent.value(step, observed)
+            if (step - 1) % self.n_step == 0:
+                # first step of a window, the previous sum has been taken
+                self.total[...] = state
+                self.count[0] = 1
+                if self.compensated:
+                    self.compensation.fill(0.0)
+            else:
+                self._add(state)
+                self.count[0] += 1
+        if step % self.n_step == 0:
+            return self.total
+
+    def __str__(self):
+        return 'WindowSum(n_step=%d%s)' % (self.n_step, ', compensated' * self.compensated)
+
+
+class Subsample(Stage):
+    "The state at multiples of n_step time steps."
+
+    def __init__(self, n_step):
+        self.n_step = int(n_step)
+
+    @property
+    def key(self):
+        return type(self).__name__, self.n_step
+
+    def compute(self, step, observed):
+        if step % self.n_step == 0:
+            return self.parent.value(step, observed)
+
+    def __str__(self):
+        return 'Subsample(n_step=%d)' % (self.n_step, )
+
+
+class ModeSum(Stage):
+    "Sum of the state over modes."
+
+    def output_shape(self, shape):
+        return tuple(shape[:-1])
+
+    def compute(self, step, observed):
+        state = self.parent.value(step, observed)
+        if state is not None:
+            return state[..., 0] if state.shape[-1] == 1 else state.sum(axis=-1)
+
+
+class NodeAverage(Stage):
+    """
+    Average of the state over groups of nodes, by the sparse average of the
+    nodes' group indices, see common.sparse_average, in time and memory
+    linear in the number of nodes.
+
+    """
+
+    def __init__(self, operator):
+        self.operator = operator
+
+    @property
+    def key(self):
+        # the sparse averages of equal mappings are the same, see common.sparse_average
+        return type(self).__name__, id(self.operator)
+
+    def output_shape(self, shape):
+        return (shape[0], self.operator.n_group) + tuple(shape[2:])
+
+    def average(self, state):
+        "Average state of shape (variables, nodes, modes) over groups of nodes, into a new array."
+        dtype = state.dtype if state.dtype.kind == 'f' else numpy.float64
+        out = numpy.empty((state.shape[0], self.operator.n_group) + state.shape[2:], dtype)
+        # the nodes of each variable are reduced in place, without transposing the state
+        for i in range(state.shape[0]):
+            self.operator.average(state[i], out=out[i])
+        return out
+
+    def compute(self, step, observed):
+        state = self.parent.value(step, observed)
+        if state is not None:
+            return self.average(state)
+
+    def __str__(self):
+        return 'NodeAverage(n_group=%d)' % (self.operator.n_group, )
+
+
+class ReductionGraph(object):
+    """
+    Reduction pipelines of the monitors of a simulation, merged on their common
+    prefixes, with the observed state of shape (variables of interest, nodes,
+    modes) and given dtype at its root.
+
+    """
+
+    def __init__(self, shape, dtype):
+        self.root = Observed(shape, dtype)
+
+    @classmethod
+    def observing(cls, simulator):
+        "Graph for the observed state of given simulator."
+        model = simulator.model
+        shape = len(model.variables_of_interest), simulator.number_of_nodes, model.number_of_modes
+        return cls(shape, simulator.dtype)
+
+    @classmethod
+    def shared(cls, simulator):
+        "Graph shared by the monitors of given simulator, or a new one if they do not share one."
+        graph = getattr(simulator, '_reduction_graph', None)
+        if graph is None:
+            graph = cls.observing(simulator)
+        return graph
+
+    def pipeline(self, *stages):
+        """
+        Merge a pipeline of stages into the graph, returning the stages of the
+        graph which compute it, which are those given where they are not
+        already in the graph following the same stages.
+
+        """
+        parent, merged = self.root, []
+        for stage in stages:
+            key = stage.key
+            if key not in parent.children:
+                stage.configure(parent)
+                parent.children[key] = stage
+            parent = parent.children[key]
+            parent.n_user += 1
+            merged.append(parent)
+        return merged
+
+    def stages(self):
+        "Generate the stages of the graph with their depth, depth first."
+        pending = [(stage, 1) for stage in reversed(list(self.root.children.values()))]
+        while pending:
+            stage, depth = pending.pop()
+            yield stage, depth
+            pending.extend((child, depth + 1) for child in reversed(list(stage.children.values())))
+
+    def __str__(self):
+        lines = ['Observed(shape=%s)' % (self.root.shape, )]
+        for stage, depth in self.stages():
+            lines.append('%s%s, %d user%s' % ('  ' * depth, stage, stage.n_user, 's' * (stage.n_user > 1)))
+        return '\n'.join(lines)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Measured memory and runtime estimates for configured simulators.
+
+The memory census sums the sizes of the arrays a configured simulator
+actually holds, i.e. history, connectivity, monitor stocks and projection
+matrices, surface and local connectivity, and stimulus patterns. Runtime is
+estimated by timing short bursts of integration steps, after which the
+simulator's state is restored, and extrapolating to the requested
+simulation length, with a band given by the variation between bursts. If
+psutil is available, the resident set size measured during the bursts,
+plus the output that will be returned, gives an estimate of the peak RSS.
+
+"""
+
+import math
+import time
+import numpy
+import scipy.sparse
+from .common import psutil, get_logger
+
+
+LOG = get_logger(__name__)
+
+
+def nbytes(obj):
+    "Size in bytes of an array or sparse matrix, or zero for other objects."
+    if isinstance(obj, numpy.ndarray):
+        return obj.nbytes
+    if scipy.sparse.issparse(obj):
+        if obj.format not in ('csr', 'csc', 'coo', 'bsr'):
+            obj = obj.tocsr()
+        return sum(getattr(obj, name).nbytes for name in ('data', 'indices', 'indptr', 'row', 'col')
+                   if hasattr(obj, name))
+    return 0
+
+
+def attribute_nbytes(obj):
+    "Total size of the arrays and sparse matrices held as attributes of obj."
+    return sum(nbytes(value) for value in getattr(obj, '__dict__', {}).values())
+
+
+def memory_census(sim):
+    "Measure bytes held by each component of a configured simulator."
+    census = {'history': sim.history.nbytes,
+              'state': nbytes(sim.current_state),
+              'connectivity': attribute_nbytes(sim.connectivity)}
+    for i, monitor in enumerate(sim.monitors):
+        census['monitor %d %s' % (i, type(monitor).__name__)] = attribute_nbytes(monitor)
+    if sim.surface is not None:
+        census['surface'] = attribute_nbytes(sim.surface) + nbytes(getattr(sim, '_regmap', None))
+        if sim._region_average is not None:
+            census['surface'] += nbytes(sim._region_average.matrix) + nbytes(sim._region_average.sum_matrix)
+        local_connectivity = sim.surface.local_connectivity
+        if local_connectivity is not None and local_connectivity.matrix is not None:
+            # the matrix and its copy scaled by coupling strength for each run
+            census['local connectivity'] = 2 * nbytes(local_connectivity.matrix)
+    if sim.stimulus is not None:
+        census['stimulus'] = attribute_nbytes(sim.stimulus)
+    return census
+
+
+class ResourceEstimator(object):
+    """
+    Calibrated estimates of memory and runtime for a configured simulator.
+
+    Calibration runs ``n_burst`` bursts of ``n_step`` steps, of which the first
+    only warms up, e.g. compiles the fused loop, and then restores the state of
+    the simulator, so a subsequent simulation is unaffected.
+
+    """
+
+    def __init__(self, sim, n_step=100, n_burst=5):
+        if sim.history is None:
+            raise ValueError('Resource estimates require a configured simulator.')
+        self.sim = sim
+        self.n_step = n_step
+        self.n_burst = max(n_burst, 2)
+        self.step_times = None
+        self.sample_nbytes = None
+        self.rss = None
+
+    def _rss(self):
+        return psutil.Process().memory_info().rss if psutil else None
+
+    def calibrate(self):
+        "Time bursts of integration steps, restoring the simulator's state afterwards."
+        sim = self.sim
+        saved = dict((name, numpy.array(value, copy=True))
+                     for name, value in sim._checkpoint_arrays(sim.current_step, sim.current_state).items())
+        saved_attrs = sim.simulation_length, sim.calls, sim.checkpoint_path
+        sim.checkpoint_path = ''
+        step_times, rss, sample_nbytes = [], [], [0] * len(sim.monitors)
+        try:
+            for _ in range(self.n_burst):
+                tic = time.time()
+                for output in sim(simulation_length=self.n_step * sim.integrator.dt):
+                    for i, t_x in enumerate(output):
+                        if t_x is not None:
+                            sample_nbytes[i] = numpy.asarray(t_x[1]).nbytes + 8
+                step_times.append((time.time() - tic) / self.n_step)
+                rss.append(self._rss())
+        finally:
+            sim._restore_checkpoint_arrays(saved)
+            sim.simulation_length, sim.calls, sim.checkpoint_path = saved_attrs
+        # first burst is a warm up
+        self.step_times = numpy.array(step_times[1:])
+        self.sample_nbytes = sample_nbytes
+        self.rss = None if rss[0] is None else numpy.array(rss)
+        LOG.info('calibrated %.3g +/- %.2g s per step over %d bursts of %d steps',
+                 self.step_times.mean(), self.step_times.std(), self.step_times.size, self.n_step)
+        return self
+
+    def estimate(self, simulation_length):
+        """
+        Estimate resources for a simulation of given length in ms, calibrating
+        first if needed. Returns a dict with memory in bytes (census of the
+        simulator's arrays, output of array sinks and, if psutil is available,
+        peak RSS and its lower bound) and runtime in seconds (estimate with
+        low & high bounds at two standard deviations of the burst timings).
+
+        """
+        if self.step_times is None:
+            self.calibrate()
+        sim = self.sim
+        n_steps = int(math.ceil(simulation_length / sim.integrator.dt))
+        census = memory_census(sim)
+        output = sum(sim._n_monitor_samples(monitor, n_steps) * sample_nbytes
+                     for monitor, sample_nbytes in zip(sim.monitors, self.sample_nbytes))
+        memory = {'census': census, 'total': sum(census.values()), 'output': output}
+        if self.rss is not None:
+            memory['peak_rss'] = int(self.rss.max()) + output
+            memory['peak_rss_low'] = int(self.rss.min()) + output
+        mean, std = self.step_times.mean(), self.step_times.std()
+        runtime = {'per_step': mean,
+                   'estimate': mean * n_steps,
+                   'low': max(mean - 2 * std, 0.0) * n_steps,
+                   'high': (mean + 2 * std) * n_steps}
+        return {'n_steps': n_steps, 'memory': memory, 'runtime': runtime}
@@ -39,6 +39,8 @@ simulation and the method for running the simulation.
 
 """
 
+import os
+import copy
 import time
 import math
 import numpy
@@ -48,11 +50,20 @@ import tvb.basic.traits.core as core
 import tvb.basic.traits.types_basic as basic
 from tvb.basic.filters.chain import UIFilter, FilterChain
 
-from tvb.datatypes import cortex, connectivity, arrays, patterns
+from tvb.datatypes import cortex, connectivity, arrays, patterns, local_connectivity
 from tvb.simulator import models, integrators, monitors, coupling
 
-from .common import psutil, get_logger, numpy_add_at
-from .history import SparseHistory, DenseHistory
+from .common import psutil, get_logger, sparse_average, cast_float_arrays
+from .history import SparseHistory, DenseHistory, RaggedHistory, CompiledHistory, DelayBuckets
+from ._numba.cpu import FusedRegionLoop
+from .checkpoint import CheckpointFile
+from .pipeline import MonitorPipeline
+from .decomposition import DomainDecomposition
+from .cache import ArtifactCache, artifact_key, fetch_artifacts
+from .sinks import ArraySink
+from .profiler import PhaseProfiler
+from .reduction import ReductionGraph
+from .resources import ResourceEstimator, memory_census
 
 
 LOG = get_logger(__name__)
@@ -199,6 +210,121 @@ class Simulator(core.Type):
         order=9,
         doc="""The length of a simulation in milliseconds (ms).""")
 
+    backend = basic.String(
+        label="Integration backend",
+        default="numpy",
+        required=False,
+        order=-1,
+        doc="""Implementation of the integration loop: 'numpy' evaluates each
+        component of a time step with NumPy, while 'numba' compiles the history
+        update, coupling, model and integration scheme of region simulations
+        into a single loop parallelized over nodes, see
+        tvb.simulator._numba.cpu.FusedRegionLoop for supported components.""")
+
+    dtype = basic.String(
+        label="Floating point type",
+        default="float64",
+        required=False,
+        order=-1,
+        doc="""Floating point type of the simulation, 'float64' or 'float32':
+        model, coupling and noise parameters, state, noise, stimulus, local
+        coupling and monitor stocks are cast to this type on configuration,
+        such that integration proceeds without upcasts. The history buffer
+        stores float32 values in either case.""")
+
+    checkpoint_path = basic.String(
+        label="Checkpoint file",
+        default="",
+        required=False,
+        order=-1,
+        doc="""File to which the simulation state is written every
+        ``checkpoint_interval`` integration steps, see Simulator.checkpoint.""")
+
+    checkpoint_interval = basic.Integer(
+        label="Checkpoint interval (steps)",
+        default=0,
+        required=False,
+        order=-1,
+        doc="""Number of integration steps between checkpoints written to
+        ``checkpoint_path``, or 0 to disable periodic checkpoints.""")
+
+    profiling = basic.Bool(
+        label="Profile integration loop",
+        default=False,
+        required=False,
+        order=-1,
+        doc="""Whether to time the phases of the integration loop and each
+        monitor, see tvb.simulator.profiler. After a run, the ``profiler``
+        attribute provides the report.""")
+
+    pipeline_depth = basic.Integer(
+        label="Monitor pipeline depth",
+        default=0,
+        required=False,
+        order=-1,
+        doc="""Number of observed states buffered for monitors running on a
+        background thread, such that integration overlaps monitoring, see
+        tvb.simulator.pipeline. Outputs are identical to those of 0, the
+        default, which runs monitors synchronously after each step.""")
+
+    n_workers = basic.Integer(
+        label="Number of worker processes",
+        default=1,
+        required=False,
+        order=-1,
+        doc="""Number of local processes over which regions, and in surface
+        simulations their vertices, are partitioned for integration, see
+        tvb.simulator.decomposition. The default of 1 integrates all nodes in
+        the simulator's process.""")
+
+    coupling_engine = basic.String(
+        label="Coupling engine",
+        default="auto",
+        required=False,
+        order=-1,
+        doc="""How the delayed coupling is summed over connections: 'gather'
+        queries the delayed state of each connection from the sparse history,
+        'buckets' groups connections by delay and sums products of each
+        delay's weight matrix with the state at that delay, see
+        tvb.simulator.history.DelayBuckets, for couplings which do not depend
+        on the current state. 'auto', the default, uses buckets if the delays
+        are few compared to the connections per node, e.g. for dense
+        connectomes of many regions.""")
+
+    history_layout = basic.String(
+        label="History layout",
+        default="full",
+        required=False,
+        order=-1,
+        doc="""Layout of the history buffer: 'full' keeps, for every node, as
+        many past states as the longest delay requires, updated and queried
+        by compiled kernels if the tvb._speedups extension is built, see
+        tvb.simulator.history.CompiledHistory, while 'ragged' keeps for each
+        node only as many as its longest efferent delay requires, see
+        tvb.simulator.history.RaggedHistory, which saves memory when few long
+        delays set the history length, but is not supported by the numba
+        backend nor domain decomposition.""")
+
+    cache_path = basic.String(
+        label="Artifact cache directory",
+        default="",
+        required=False,
+        order=-1,
+        doc="""Directory in which arrays derived on configuration, i.e. delays
+        in integration steps, sparse history indices, the local connectivity
+        matrix and region lead fields, are cached under a hash of their
+        inputs, such that configuring a simulator with the same inputs loads
+        them instead of computing them, see tvb.simulator.cache. Empty, the
+        default, disables the cache.""")
+
+    cache_size = basic.Integer(
+        label="Artifact cache size (MB)",
+        default=1024,
+        required=False,
+        order=-1,
+        doc="""Size beyond which the least recently used entries of the
+        artifact cache are removed, or 0 for no limit.""")
+
     history = None # type: SparseHistory
 
     @property
@@ -215,6 +341,14 @@ class Simulator(core.Type):
     _memory_requirement_census = None
     _storage_requirement = None
     _runtime = None
+    _checkpoint_file = None
+    _region_average = None
+    _region_state = None
+    profiler = None
+    _resource_estimator = None
+    _artifact_cache = None
+    _history_key = None
+    _reduction_graph = None
 
     # methods consist of
     # 1) generic configure
@@ -226,8 +360,11 @@ class Simulator(core.Type):
     def preconfigure(self):
         "Configure just the basic fields, so that memory can be estimated."
         self.connectivity.configure()
+        self._artifact_cache = None
+        if self.cache_path:
+            self._artifact_cache = ArtifactCache(self.cache_path, self.cache_size * 2**20)
         if self.surface:
-            self.surface.configure()
+            self._configure_surface()
         if self.stimulus:
             self.stimulus.configure()
         self.coupling.configure()
@@ -248,6 +385,7 @@ class Simulator(core.Type):
             unmapped = self.connectivity.unmapped_indices(rm)
             self._regmap = numpy.r_[rm, unmapped]
             self.number_of_nodes = self._regmap.shape[0]
+            self._region_average = sparse_average(self._regmap, self.connectivity.number_of_regions)
             LOG.info('Surface simulation with %d vertices + %d non-cortical, %d total nodes',
                      rm.size, unmapped.size, self.number_of_nodes)
         self._guesstimate_memory_requirement()
@@ -274,6 +412,10 @@ class Simulator(core.Type):
         if full_configure:
             # When run from GUI, preconfigure is run separately, and we want to avoid running that part twice
             self.preconfigure()
+        if self.backend not in ('numpy', 'numba'):
+            raise ValueError("Unknown backend %r, expected 'numpy' or 'numba'." % (self.backend, ))
+        if self.dtype not in ('float64', 'float32'):
+            raise ValueError("Unknown dtype %r, expected 'float64' or 'float32'." % (self.dtype, ))
         # Make sure spatialised model parameters have the right shape (number_of_nodes, 1)
         excluded_params = ("state_variable_range", "variables_of_interest", "noise", "psi_table", "nerf_table")
         spatial_reshape = self.model.spatial_param_reshape
@@ -290,16 +432,19 @@ class Simulator(core.Type):
             if region_parameters.size == self.number_of_nodes:
                 new_parameters = region_parameters.reshape(spatial_reshape)
                 setattr(self.model, param, new_parameters)
+        self._configure_dtype()
         # Configure spatial component of any stimuli
         self._configure_stimuli()
         # Set delays, provided in physical units, in integration steps.
-        self.connectivity.set_idelays(self.integrator.dt)
+        self._configure_delays()
         self.horizon = self.connectivity.idelays.max() + 1
         # Reshape integrator.noise.nsig, if necessary.
         if isinstance(self.integrator, integrators.IntegratorStochastic):
             self._configure_integrator_noise()
         # Setup history
         self._configure_history(self.initial_conditions)
+        # Preallocate the integration scheme's arrays, for steps without allocation
+        self.integrator.configure_workspace(self.current_state.shape, self.dtype, self.model._dfun_takes_out())
         # Configure Monitors to work with selected Model, etc...
         self._configure_monitors()
         # Estimate of memory usage.
@@ -307,12 +452,47 @@ class Simulator(core.Type):
         # Allow user to chain configure to another call or assignment.
         return self
 
+    def clone(self, **overrides):
+        """
+        Copy the simulator, e.g. for each point of a parameter sweep, sharing
+        its structural data rather than copying it: connectivity, surface and
+        stimulus, the read-only arrays of the history, such as its indices,
+        and the monitors' arrays other than their stocks. The model, coupling,
+        integrator and monitors are copied, and of a configured simulator, the
+        history buffer, current state, random stream and monitor stocks, such
+        that the clone of a configured simulator continues independently from
+        the same state without being configured.
+
+        Traits given as keywords replace those of the clone, which is then
+        configured if this simulator was, reusing the shared history indices
+        when connectivity and delays are unchanged.
+
+        :return: The cloned Simulator instance.
+        """
+        memo = {id(self._checkpoint_file): None, id(self.profiler): None}
+        for shared in (self.connectivity, self.surface, self.stimulus, self._artifact_cache,
+                       self._region_average, getattr(self, '_regmap', None)):
+            if shared is not None:
+                memo[id(shared)] = shared
+        for monitor in self.monitors:
+            for name, value in vars(monitor).items():
+                if isinstance(value, numpy.ndarray) and name not in self._monitor_state_attrs:
+                    memo[id(value)] = value
+        other = copy.deepcopy(self, memo)
+        for name, value in overrides.items():
+            if name not in self.trait:
+                raise AttributeError('%s has no trait %r.' % (type(self).__name__, name))
+            setattr(other, name, value)
+        if overrides and self.history is not None:
+            other.configure()
+        return other
+
     def _handle_random_state(self, random_state):
         if random_state is not None:
             if isinstance(self.integrator, integrators.IntegratorStochastic):
                 self.integrator.noise.random_stream.set_state(random_state)
                 msg = "random_state supplied with seed %s"
-                LOG.info(msg, self.integrator.noise.random_stream.get_state()[1][0])
+                LOG.info(msg, numpy.ravel(self.integrator.noise.random_stream.get_state()[1])[0])
             else:
                 LOG.warn("random_state supplied for non-stochastic integration")
 
@@ -330,15 +510,17 @@ class Simulator(core.Type):
                 sp_cs = scipy.sparse.csc_matrix((vec_cs, (ind, ind)),
                                                 shape=(self.number_of_nodes, self.number_of_nodes))
                 local_coupling = sp_cs * self.surface.local_connectivity.matrix
+            local_coupling = local_coupling.astype(self.dtype)
         return local_coupling
 
     def _prepare_stimulus(self):
         if self.stimulus is None:
             stimulus = 0.0
         else:
-            time = numpy.r_[0.0 : self.simulation_length : self.integrator.dt]
-            self.stimulus.configure_time(time.reshape((1, -1)))
-            stimulus = numpy.zeros((self.model.nvar, self.number_of_nodes, 1))
+            # evaluated in chunks as the simulation advances, rather than for the whole length
+            n_time = int(math.ceil(self.simulation_length / self.integrator.dt))
+            self.stimulus.configure_time_chunked(self.integrator.dt, n_time)
+            stimulus = numpy.zeros((self.model.nvar, self.number_of_nodes, 1), self.dtype)
             LOG.debug("stimulus shape is: %s", stimulus.shape)
         return stimulus
 
@@ -359,9 +541,7 @@ class Simulator(core.Type):
     def _loop_update_history(self, step, n_reg, state):
         "Update history."
         if self.surface is not None and state.shape[1] > self.connectivity.number_of_regions:
-            region_state = numpy.zeros((n_reg, state.shape[0], state.shape[2]))         # temp (node, cvar, mode)
-            numpy_add_at(region_state, self._regmap, state.transpose((1, 0, 2)))        # sum within region
-            region_state /= numpy.bincount(self._regmap).reshape((-1, 1, 1))            # div by n node in region
+            region_state = self._region_average.average(state.transpose((1, 0, 2)), out=self._region_state)
             state = region_state.transpose((1, 0, 2))                                   # (cvar, node, mode)
         self.history.update(step, state)
 
@@ -395,21 +575,89 @@ class Simulator(core.Type):
         stimulus = self._prepare_stimulus()
         state = self.current_state
 
+        checkpoint_interval = self.checkpoint_interval if self.checkpoint_path else 0
+
         # integration loop
         n_steps = int(math.ceil(self.simulation_length / self.integrator.dt))
-        for step in range(self.current_step + 1, self.current_step + n_steps +1):
-            # needs implementing by hsitory + coupling?
-            node_coupling = self._loop_compute_node_coupling(step)
-            self._loop_update_stimulus(step, stimulus)
-            state = self.integrator.scheme(state, self.model.dfun, node_coupling, local_coupling, stimulus)
-            self._loop_update_history(step, n_reg, state)
-            output = self._loop_monitor_output(step, state)
-            if output is not None:
-                yield output
+        profiler = self.profiler = PhaseProfiler(n_steps) if self.profiling else None
+        if self.n_workers > 1:
+            steps = DomainDecomposition(self, self.n_workers)(self.current_step + 1, n_steps, state)
+            if profiler is not None:
+                steps = profiler.iterate('decomposed loop', steps)
+        elif self.backend == 'numba':
+            fused_loop = FusedRegionLoop(self)
+            steps = fused_loop(self.current_step + 1, n_steps, state, checkpoint_interval)
+            if profiler is not None:
+                steps = profiler.iterate('fused loop', steps)
+        else:
+            steps = self._loop_integrate(n_steps, state, n_reg, local_coupling, stimulus, profiler)
+        pipeline = MonitorPipeline(self._loop_monitor_output, self.pipeline_depth) if self.pipeline_depth else None
+        monitor_output = self._loop_monitor_output
+        write_checkpoint = self._write_checkpoint
+        if pipeline is not None:
+            submit, drain = pipeline.submit, pipeline.drain
+        if profiler is not None:
+            write_checkpoint = profiler.wrap('checkpoint', write_checkpoint)
+            if pipeline is not None:
+                # monitors run on the worker, time spent waiting for them is attributed to monitors
+                submit, drain = profiler.wrap('monitors', submit), profiler.wrap('monitors', drain)
+            else:
+                monitor_output = profiler.wrap('monitors', monitor_output)
+                for i, monitor in enumerate(self.monitors):
+                    monitor.record = profiler.wrap('monitor %d %s' % (i, type(monitor).__name__), monitor.record)
+            profiler.start()
+        try:
+            for step, state in steps:
+                if pipeline is None:
+                    outputs = (monitor_output(step, state), )
+                else:
+                    outputs = submit(step, state)
+                if checkpoint_interval and step % checkpoint_interval == 0:
+                    if pipeline is not None:
+                        # monitor stocks must be up to date with the checkpointed step
+                        outputs += drain()
+                    write_checkpoint(self.checkpoint_path, step, state)
+                for output in outputs:
+                    if output is not None:
+                        yield output
+            if pipeline is not None:
+                for output in drain():
+                    if output is not None:
+                        yield output
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+            if profiler is not None:
+                profiler.stop()
+                if pipeline is None:
+                    for monitor in self.monitors:
+                        del monitor.record
+                LOG.info('simulation profile\n%s', profiler)
 
         self.current_state = state
         self.current_step = self.current_step + n_steps - 1  # -1 : don't repeat last point
 
+    def _loop_integrate(self, n_steps, state, n_reg, local_coupling, stimulus, profiler=None):
+        "Generate the step and state of each of n_steps integration steps."
+        compute_node_coupling = self._loop_compute_node_coupling
+        update_stimulus = self._loop_update_stimulus
+        scheme = self.integrator.scheme
+        dfun = self.model.dfun
+        update_history = self._loop_update_history
+        if profiler is not None:
+            compute_node_coupling = profiler.wrap('coupling', compute_node_coupling)
+            update_stimulus = profiler.wrap('stimulus', update_stimulus)
+            scheme = profiler.wrap('scheme', scheme)
+            dfun = profiler.wrap('dfun', dfun)
+            update_history = profiler.wrap('history', update_history)
+        for step in range(self.current_step + 1, self.current_step + n_steps +1):
+            # needs implementing by hsitory + coupling?
+            node_coupling = compute_node_coupling(step)
+            update_stimulus(step, stimulus)
+            state = scheme(state, dfun, node_coupling, local_coupling, stimulus)
+            update_history(step, n_reg, state)
+            yield step, state
+
     def _configure_history(self, initial_conditions):
         """
         Set initial conditions for the simulation using either the provided
@@ -459,24 +707,104 @@ class Simulator(core.Type):
                 self.current_step += ic_shape[0] - 1
         LOG.info('Final initial history shape is %r', history.shape)
         # create initial state from history
-        self.current_state = history[self.current_step % self.horizon].copy()
+        self.current_state = history[self.current_step % self.horizon].astype(self.dtype)
         LOG.debug('initial state has shape %r' % (self.current_state.shape, ))
         if self.surface is not None and history.shape[2] > self.connectivity.number_of_regions:
-            n_reg = self.connectivity.number_of_regions
-            (nt, ns, _, nm), ax = history.shape, (2, 0, 1, 3)
-            region_history = numpy.zeros((nt, ns, n_reg, nm))
-            numpy_add_at(region_history.transpose(ax), self._regmap, history.transpose(ax))
-            region_history /= numpy.bincount(self._regmap).reshape((-1, 1))
-            history = region_history
+            # (node, time, svar, mode) averaged within regions, and buffer for each step's update
+            history = self._region_average.average(history.transpose((2, 0, 1, 3))).transpose((1, 2, 0, 3))
+            self._region_state = numpy.empty((history.shape[2], history.shape[1], history.shape[3]))
         # create history query implementation
-        self.history = SparseHistory(
-            self.connectivity.weights,
-            self.connectivity.idelays,
-            self.model.cvar,
-            self.model.number_of_modes
-        )
+        self.history = self._sparse_history()
         # initialize its buffer
-        self.history.initialize(history)
+        self.history.initialize(history, self.current_step)
+
+    def _configure_surface(self):
+        "Configure the cortex, with its local connectivity matrix via the artifact cache."
+        local_conn = self.surface.local_connectivity
+        if self._artifact_cache is None or (local_conn is not None and local_conn.matrix.size > 0):
+            self.surface.configure()
+            return
+        if local_conn is None:
+            # the cortex's default local connectivity
+            local_conn = local_connectivity.LocalConnectivity(cutoff=40.0, use_storage=False, surface=self.surface)
+            self.surface.local_connectivity = local_conn
+        equation = local_conn.equation
+        parts = (self.surface.vertices, self.surface.triangles, self.surface.region_mapping.size, local_conn.cutoff,
+                 type(equation).__name__, sorted(equation.parameters.items()) if equation is not None else None)
+        key = artifact_key('local_connectivity', *parts)
+        arrays = self._artifact_cache.get(key)
+        if arrays is not None:
+            shape = tuple(arrays['shape'])
+            local_conn.matrix = scipy.sparse.csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape)
+        self.surface.configure()
+        if arrays is None:
+            matrix = scipy.sparse.csc_matrix(local_conn.matrix)
+            self._artifact_cache.put(key, {'data': matrix.data, 'indices': matrix.indices,
+                                           'indptr': matrix.indptr, 'shape': numpy.array(matrix.shape)})
+
+    def _configure_delays(self):
+        "Set delays in integration steps, via the artifact cache."
+        conn, dt = self.connectivity, self.integrator.dt
+
+        def compute():
+            conn.set_idelays(dt)
+            return {'idelays': conn.idelays}
+
+        conn.idelays = fetch_artifacts(self._artifact_cache, 'idelays', (conn.delays, dt), compute)['idelays']
+
+    def _sparse_history(self, n_batch=1):
+        "Create the sparse history, with its index arrays and the coupling's row indices via the artifact cache."
+        conn, cvar, n_mode = self.connectivity, numpy.asarray(self.model.cvar), self.model.number_of_modes
+        # the full layout uses the compiled history kernels, if built
+        layouts = {'full': CompiledHistory if CompiledHistory.available else SparseHistory, 'ragged': RaggedHistory}
+        if self.history_layout not in layouts:
+            raise ValueError("Unknown history layout %r, expected 'full' or 'ragged'." % (self.history_layout, ))
+
+        def compute():
+            arrays = SparseHistory.compute_indices(conn.weights, conn.idelays, cvar, n_mode, n_batch)
+            arrays['lri'], arrays['nzr'] = coupling.Coupling.row_indices(arrays['nnz_row_el_idx'])
+            return arrays
+
+        key = artifact_key('sparse_history', conn.weights, conn.idelays, cvar, n_mode, n_batch)
+        history_key = key, self.history_layout
+        if self.history is not None and history_key == self._history_key:
+            # same structure, e.g. reconfiguring a clone: share the read-only arrays of the history
+            history = copy.deepcopy(self.history)
+            lri_nzr = coupling.Coupling.row_indices(history.nnz_row_el_idx)
+        else:
+            arrays = compute() if self._artifact_cache is None else self._artifact_cache.fetch(key, compute)
+            history_class = layouts[self.history_layout]
+            history = history_class(conn.weights, conn.idelays, cvar, n_mode, n_batch=n_batch, indices=arrays)
+            lri_nzr = arrays['lri'], arrays['nzr']
+        self.coupling._cached_lri, self.coupling._cached_nzr = lri_nzr
+        self._history_key = history_key
+        history.buckets = self._delay_buckets(history)
+        return history
+
+    def _delay_buckets(self, history):
+        "Group the history's connections by delay if the coupling engine is, or is chosen to be, buckets."
+        engine = self.coupling_engine
+        if engine not in ('auto', 'gather', 'buckets'):
+            raise ValueError("Unknown coupling engine %r, expected 'auto', 'gather' or 'buckets'." % (engine, ))
+        if engine == 'gather':
+            return None
+        if self.coupling.uses_current_state(history.n_cvar, history.n_mode):
+            if engine == 'buckets':
+                raise ValueError('The %s coupling depends on the current state, which delay buckets '
+                                 'do not support.' % (type(self.coupling).__name__, ))
+            return None
+        if engine == 'auto' and not DelayBuckets.suitable(history):
+            return None
+        # a history shared with a clone keeps its buckets
+        return history.buckets or DelayBuckets(history)
+
+    def _configure_dtype(self):
+        "Cast floating point parameters of model, coupling and integrator to the simulator's dtype."
+        for component in (self.model, self.coupling, self.integrator):
+            cast_float_arrays(component, self.dtype)
+        if isinstance(self.integrator, integrators.IntegratorStochastic):
+            cast_float_arrays(self.integrator.noise, self.dtype)
+            self.integrator.noise.dtype = numpy.dtype(self.dtype)
 
     def _configure_integrator_noise(self):
         """
@@ -533,9 +861,11 @@ class Simulator(core.Type):
         # Coerce to list if required
         if not isinstance(self.monitors, (list, tuple)):
             self.monitors = [self.monitors]
-        # Configure monitors
+        # Configure monitors, merging their reduction pipelines into a graph of shared stages
+        self._reduction_graph = ReductionGraph.observing(self)
         for monitor in self.monitors:
             monitor.config_for_sim(self)
+        LOG.debug('monitor reduction graph\n%s', self._reduction_graph)
 
     def _configure_stimuli(self):
         """ Configure the defined Stimuli for this Simulator """
@@ -549,8 +879,11 @@ class Simulator(core.Type):
     def memory_requirement(self):
         """
         Return an estimated of the memory requirements (Bytes) for this
-        simulator's current configuration.
+        simulator's current configuration, measured if it is configured.
         """
+        if self.history is not None:
+            self._census_memory_requirement()
+            return self._memory_requirement_census
         self._guesstimate_memory_requirement()
         return self._memory_requirement_guess
 
@@ -620,8 +953,8 @@ class Simulator(core.Type):
 
         for monitor in self.monitors:
             if not isinstance(monitor, monitors.Bold):
-                stock_shape = (monitor.period / self.integrator.dt, 
-                               self.model.variables_of_interest.shape[0], 
+                # temporal averages keep a running sum, whatever the period
+                stock_shape = (self.model.variables_of_interest.shape[0],
                                number_of_nodes,
                                self.model.number_of_modes)
                 memreq += numpy.prod(stock_shape) * bits_64
@@ -637,8 +970,7 @@ class Simulator(core.Type):
                                self.model.variables_of_interest.shape[0],
                                number_of_nodes,
                                self.model.number_of_modes)
-                interim_stock_shape = (1.0 / (2.0 ** -2 * self.integrator.dt),
-                                       self.model.variables_of_interest.shape[0],
+                interim_stock_shape = (self.model.variables_of_interest.shape[0],
                                        number_of_nodes,
                                        self.model.number_of_modes)
                 memreq += numpy.prod(stock_shape) * bits_64
@@ -655,8 +987,8 @@ class Simulator(core.Type):
         """
         Guesstimate the memory required for this simulator. 
 
-        Guesstimate is based on a census of the dominant arrays after the
-        simulator has been configured.
+        The census measures the arrays held by the simulator after it has
+        been configured, see tvb.simulator.resources.memory_census.
 
         NOTE: Assumes returned/yeilded data is in some sense "taken care of" in
             the world outside the simulator, and so doesn't consider it, making
@@ -664,27 +996,14 @@ class Simulator(core.Type):
             memory pigs...
 
         """
-        magic_number = 2.42  # Current guesstimate is low by about a factor of 2, seems safer to over estimate...
-        memreq = self.history.nbytes
-        try:
-            memreq += self.surface.triangles.nbytes * 2
-            memreq += self.surface.vertices.nbytes * 2
-            memreq += self.surface.region_mapping.nbytes * self.number_of_nodes * 8. * 4  # region_average, region_sum
-            memreq += self.surface.eeg_projection.nbytes
-            memreq += self.surface.local_connectivity.matrix.nnz * 8
-        except AttributeError:
-            pass
-
-        for monitor in self.monitors:
-            memreq += monitor._stock.nbytes
-            if isinstance(monitor, monitors.Bold):
-                memreq += monitor._interim_stock.nbytes
+        census = memory_census(self)
+        memreq = sum(census.values())
+        LOG.debug('Memory census by component: %r', census)
 
         if psutil and memreq > psutil.virtual_memory().total:
             LOG.warning("Memory estimate exceeds total available RAM.")
 
-        self._memory_requirement_census = magic_number * memreq
-        #import pdb; pdb.set_trace()
+        self._memory_requirement_census = memreq
         msg = "Memory requirement census: simulation will need about %.1f MB"
         LOG.info(msg % (self._memory_requirement_census / 1048576.0))
 
@@ -692,18 +1011,42 @@ class Simulator(core.Type):
         """
         Estimate the runtime for this simulator.
 
-        Spread in parallel executions of larger arrays means this will be an over-estimation,
-        or rather a single threaded estimation...
-        Different choice of integrators and monitors has an additional effect,
-        on the magic number though relatively minor
+        If estimate_resources has calibrated the runtime per step, this is
+        extrapolated, otherwise the number of nodes, state variables and steps
+        are scaled by a rough per-element constant.
 
         """
-        magic_number = 6.57e-06  # seconds
-        self._runtime = (magic_number * self.number_of_nodes * self.model.nvar * self.model.number_of_modes *
-                         self.simulation_length / self.integrator.dt)
+        if self._resource_estimator is not None and self._resource_estimator.step_times is not None:
+            self._runtime = self._resource_estimator.estimate(self.simulation_length)['runtime']['estimate']
+        else:
+            magic_number = 6.57e-06  # seconds
+            self._runtime = (magic_number * self.number_of_nodes * self.model.nvar * self.model.number_of_modes *
+                             self.simulation_length / self.integrator.dt)
         msg = "Simulation runtime should be about %0.3f seconds"
         LOG.info(msg, self._runtime)
 
+    def estimate_resources(self, simulation_length=None, n_step=100, n_burst=5):
+        """
+        Estimate memory and runtime of a simulation of the configured simulator,
+        from the sizes of its arrays and the timing of a few short bursts of
+        integration steps, after which the simulator's state is restored.
+        Later runtime estimates use the same calibration.
+
+        :param simulation_length: Length of the simulation in ms, by default the
+                                  simulator's simulation_length.
+        :param n_step: Number of steps in each calibration burst.
+        :param n_burst: Number of calibration bursts, the first warms up.
+        :return: dict of estimates, see tvb.simulator.resources.ResourceEstimator.estimate
+        """
+        estimator = self._resource_estimator
+        if estimator is None or (estimator.n_step, estimator.n_burst) != (n_step, max(n_burst, 2)):
+            estimator = self._resource_estimator = ResourceEstimator(self, n_step, n_burst)
+        estimate = estimator.estimate(simulation_length or self.simulation_length)
+        LOG.info('Estimated runtime %.3f s (%.3f - %.3f s), memory %.1f MB + %.1f MB output',
+                 estimate['runtime']['estimate'], estimate['runtime']['low'], estimate['runtime']['high'],
+                 estimate['memory']['total'] * 2**-20, estimate['memory']['output'] * 2**-20)
+        return estimate
+
     def _calculate_storage_requirement(self):
         """
         Calculate the storage requirement for the simulator, configured with
@@ -723,23 +1066,144 @@ class Simulator(core.Type):
         LOG.info("Calculated storage requirement for simulation: %d " % int(strgreq))
         self._storage_requirement = int(strgreq)
 
-    def run(self, **kwds):
-        "Convenience method to call the simulator with **kwds and collect output data."
-        ts, xs = [], []
-        for _ in self.monitors:
-            ts.append([])
-            xs.append([])
+    def _n_monitor_samples(self, monitor, n_steps):
+        "Number of samples monitor produces in the next n_steps integration steps."
+        first, last = self.current_step + 1, self.current_step + n_steps
+        return last // monitor.istep - (first - 1) // monitor.istep
+
+    def run(self, sinks=None, **kwds):
+        """
+        Convenience method to call the simulator with **kwds and collect output data.
+
+        :param sinks: Optional list of one sink per monitor, into which samples are
+                      written as they are generated, see tvb.simulator.sinks. By
+                      default, samples are written into preallocated arrays.
+        :return: List of the times and data returned by each monitor's sink.
+        """
+        if sinks is None:
+            sinks = [ArraySink() for _ in self.monitors]
+        if len(sinks) != len(self.monitors):
+            raise ValueError('Expected %d sinks, one per monitor, got %d.' % (len(self.monitors), len(sinks)))
+        simulation_length = kwds.get('simulation_length') or self.simulation_length
+        n_steps = int(math.ceil(simulation_length / self.integrator.dt))
+        for sink, monitor in zip(sinks, self.monitors):
+            sink.open(monitor, self._n_monitor_samples(monitor, n_steps))
         wall_time_start = time.time()
         for data in self(**kwds):
-            for tl, xl, t_x in zip(ts, xs, data):
+            for sink, t_x in zip(sinks, data):
                 if t_x is not None:
-                    t, x = t_x
-                    tl.append(t)
-                    xl.append(x)
+                    sink.write(*t_x)
         elapsed_wall_time = time.time() - wall_time_start
         LOG.info("%.3f s elapsed, %.3fx real time", elapsed_wall_time,
                  elapsed_wall_time * 1e3 / self.simulation_length)
-        for i in range(len(ts)):
-            ts[i] = numpy.array(ts[i])
-            xs[i] = numpy.array(xs[i])
-        return list(zip(ts, xs))
+        return [sink.close() for sink in sinks]
+
+    _monitor_state_attrs = ('_stock', '_interim_stock', '_state', '_node_sum',
+                            '_window_count', '_window_step', '_window_compensation')
+
+    def _checkpoint_arrays(self, step, state):
+        "Collect the arrays which determine how the simulation continues after given step."
+        arrays = {'current_step': numpy.array([step]),
+                  'current_state': state,
+                  'history': self.history.buffer}
+        if isinstance(self.integrator, integrators.IntegratorStochastic):
+            noise = self.integrator.noise
+            random_states = noise.random_stream.get_state()
+            if not isinstance(random_states, list):
+                random_states = [random_states]
+            if random_states[0][0] == 'Philox':
+                # counter-based streams are determined by seed and draw index
+                arrays['random_state_counter'] = numpy.array([state[1:] for state in random_states])
+            else:
+                _, keys, pos, has_gauss, gauss = zip(*random_states)
+                arrays['random_state_keys'] = numpy.array(keys)
+                arrays['random_state_pos'] = numpy.array(pos)
+                arrays['random_state_has_gauss'] = numpy.array(has_gauss)
+                arrays['random_state_gauss'] = numpy.array(gauss)
+            if noise.ntau > 0.0:
+                arrays['noise_eta'] = noise._eta
+        for i, monitor in enumerate(self.monitors):
+            for attr in self._monitor_state_attrs:
+                value = monitor.__dict__.get(attr)
+                if isinstance(value, numpy.ndarray):
+                    arrays['monitor_%d%s' % (i, attr)] = value
+        return arrays
+
+    def _write_checkpoint(self, path, step, state):
+        arrays = self._checkpoint_arrays(step, state)
+        cf = self._checkpoint_file
+        if (cf is None or cf.path != path) and os.path.exists(path):
+            # write to the free slot of an existing file, e.g. the one resumed from, keeping its checkpoint
+            try:
+                cf = CheckpointFile(path)
+            except ValueError:
+                cf = None
+        if cf is None or cf.path != path or not cf.matches(arrays):
+            cf = CheckpointFile(path, arrays)
+        self._checkpoint_file = cf
+        cf.write(arrays)
+        LOG.debug('checkpoint %d written at step %d', cf.generation, step)
+
+    def checkpoint(self, path):
+        """
+        Write the current state of the simulation to a memory-mapped file.
+
+        Besides the current state and step, this includes the history buffer,
+        the state of the noise's random stream, coloured noise and the stocks
+        of the monitors. The file is mapped once and later checkpoints to the
+        same path only copy the arrays, so checkpoints can be written often,
+        e.g. with the ``checkpoint_interval`` attribute during a run.
+
+        :param path: Name of the checkpoint file.
+        """
+        self._write_checkpoint(path, self.current_step, self.current_state)
+
+    def resume(self, path):
+        """
+        Restore the state of a simulation from a checkpoint file, such that
+        further simulation gives the same output as the simulation which wrote
+        the checkpoint. The simulator must be configured as that simulation
+        was, and the remaining simulation length passed to the next run.
+
+        :param path: Name of the checkpoint file.
+        """
+        cf = CheckpointFile(path)
+        stored = cf.read()
+        arrays = self._checkpoint_arrays(self.current_step, self.current_state)
+        mismatched = set(stored) ^ set(arrays)
+        mismatched.update(name for name in set(stored) & set(arrays)
+                          if stored[name].shape != numpy.shape(arrays[name]))
+        if mismatched:
+            raise ValueError("Checkpoint %s does not match the simulator's configuration for %s."
+                             % (path, ', '.join(sorted(mismatched))))
+        self._restore_checkpoint_arrays(stored)
+        # later checkpoints to the same path go to the slot not holding this one
+        self._checkpoint_file = cf
+        LOG.info('resumed from checkpoint %s at step %d', path, self.current_step)
+
+    def _restore_checkpoint_arrays(self, stored):
+        "Restore the arrays collected by _checkpoint_arrays."
+        self.current_step = int(stored['current_step'][0])
+        self.current_state = stored['current_state']
+        self.history.buffer[:] = stored['history']
+        if 'random_state_keys' in stored or 'random_state_counter' in stored:
+            noise = self.integrator.noise
+            if 'random_state_counter' in stored:
+                random_states = [('Philox', int(seed), int(draw)) for seed, draw in stored['random_state_counter']]
+            else:
+                random_states = [('MT19937', keys, int(pos), int(has_gauss), float(gauss))
+                                 for keys, pos, has_gauss, gauss in zip(stored['random_state_keys'],
+                                                                         stored['random_state_pos'],
+                                                                         stored['random_state_has_gauss'],
+                                                                         stored['random_state_gauss'])]
+            if isinstance(noise.random_stream.get_state(), list):
+                noise.random_stream.set_state(random_states)
+            else:
+                noise.random_stream.set_state(random_states[0])
+            if 'noise_eta' in stored:
+                noise._eta = stored['noise_eta']
+        for i, monitor in enumerate(self.monitors):
+            for attr in self._monitor_state_attrs:
+                name = 'monitor_%d%s' % (i, attr)
+                if name in stored:
+                    getattr(monitor, attr)[:] = stored[name]
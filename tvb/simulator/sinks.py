@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Output sinks, into which Simulator.run writes the samples of each monitor
+as they are generated.
+
+A sink is opened with the monitor and the number of samples it will
+produce, receives each sample in turn, and on closing returns the times and
+data which Simulator.run returns for that monitor. The array sink
+preallocates memory for all samples, while the memory-mapped and HDF5 sinks
+hold at most a chunk of samples in memory and return mapped arrays or
+dataset handles, so long simulations can be written to disk.
+
+"""
+
+import numpy
+from .common import get_logger
+
+
+LOG = get_logger(__name__)
+
+# loose couple h5py so it's an optional dependency
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class Sink(object):
+    "Base class of sinks receiving the samples of one monitor."
+
+    def open(self, monitor, n_sample):
+        "Prepare to receive n_sample samples of monitor."
+        self.monitor = monitor
+        self.n_sample = n_sample
+        self.count = 0
+
+    def write(self, time, data):
+        "Write one sample."
+        raise NotImplementedError
+
+    def close(self):
+        "Finish writing and return the times and data, as arrays or array-like handles."
+        raise NotImplementedError
+
+
+class ArraySink(Sink):
+    """
+    Write samples into preallocated arrays, grown if a monitor produces more
+    samples than expected.
+
+    """
+
+    def open(self, monitor, n_sample):
+        super(ArraySink, self).open(monitor, n_sample)
+        self.times = numpy.empty((n_sample, ))
+        self.data = None
+
+    def write(self, time, data):
+        if self.data is None:
+            self.data = numpy.empty((self.times.size, ) + data.shape, data.dtype)
+        if self.count == self.times.size:
+            LOG.debug('%r produced more than %d samples, growing arrays', self.monitor, self.count)
+            self.times = numpy.concatenate((self.times, numpy.empty_like(self.times[:self.count + 1])))
+            self.data = numpy.concatenate((self.data, numpy.empty_like(self.data[:self.count + 1])))
+        self.times[self.count] = time
+        self.data[self.count] = data
+        self.count += 1
+
+    def close(self):
+        if self.data is None:
+            return numpy.array([]), numpy.array([])
+        return self.times[:self.count], self.data[:self.count]
+
+
+class MemmapSink(Sink):
+    """
+    Write samples into a ``.npy`` file mapped to memory, which can be read back
+    with ``numpy.load(path, mmap_mode='r')``. The times are kept in memory.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, monitor, n_sample):
+        super(MemmapSink, self).open(monitor, n_sample)
+        self.times = numpy.empty((n_sample, ))
+        self.data = None
+
+    def write(self, time, data):
+        if self.data is None:
+            self.data = numpy.lib.format.open_memmap(
+                self.path, mode='w+', dtype=data.dtype, shape=(self.n_sample, ) + data.shape)
+        if self.count == self.n_sample:
+            raise ValueError('%r produced more than the expected %d samples.' % (self.monitor, self.n_sample))
+        self.times[self.count] = time
+        self.data[self.count] = data
+        self.count += 1
+
+    def close(self):
+        if self.data is None:
+            return numpy.array([]), numpy.array([])
+        self.data.flush()
+        return self.times[:self.count], self.data[:self.count]
+
+
+class HDF5Dataset(object):
+    """
+    Handle of a dataset in an HDF5 file, which opens the file only to read the
+    part of the dataset selected by indexing, e.g. ``dataset[:100]``. The whole
+    dataset is read by ``dataset[()]`` or ``numpy.asarray(dataset)``.
+
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        with h5py.File(path, 'r') as h5file:
+            dataset = h5file[name]
+            self.shape, self.dtype = dataset.shape, dataset.dtype
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (type(self).__name__, self.path, self.name)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        with h5py.File(self.path, 'r') as h5file:
+            return h5file[self.name][index]
+
+    def __array__(self, dtype=None):
+        data = self[()]
+        return data if dtype is None else data.astype(dtype)
+
+
+class HDF5Sink(Sink):
+    """
+    Write samples into chunked ``time`` and ``data`` datasets of an HDF5 file,
+    buffering one chunk of samples in memory. Closing closes the file and
+    returns HDF5Dataset handles of the datasets, which read from the file only
+    when indexed. Requires h5py.
+
+    """
+
+    def __init__(self, path, group='/', chunk_size=256, **dataset_kwds):
+        if h5py is None:
+            raise ImportError('h5py is required to write simulation output to HDF5 files.')
+        self.path = path
+        self.group = group
+        self.chunk_size = chunk_size
+        self.dataset_kwds = dataset_kwds
+
+    def open(self, monitor, n_sample):
+        super(HDF5Sink, self).open(monitor, n_sample)
+        self.file = h5py.File(self.path, 'a')
+        self.h5group = self.file.require_group(self.group)
+        self.buffer_times = numpy.empty((self.chunk_size, ))
+        self.buffer_data = None
+        self.n_buffered = 0
+
+    def _create_datasets(self, data):
+        for name in ('time', 'data'):
+            if name in self.h5group:
+                del self.h5group[name]
+        self.h5group.create_dataset('time', shape=(self.n_sample, ), maxshape=(None, ), dtype=numpy.float64,
+                                    chunks=(self.chunk_size, ))
+        self.h5group.create_dataset('data', shape=(self.n_sample, ) + data.shape, maxshape=(None, ) + data.shape,
+                                    dtype=data.dtype, chunks=(self.chunk_size, ) + data.shape, **self.dataset_kwds)
+        self.buffer_data = numpy.empty((self.chunk_size, ) + data.shape, data.dtype)
+
+    def _flush(self):
+        start, stop = self.count - self.n_buffered, self.count
+        times, data = self.h5group['time'], self.h5group['data']
+        if stop > times.shape[0]:
+            times.resize((stop, ))
+            data.resize((stop, ) + data.shape[1:])
+        times[start:stop] = self.buffer_times[:self.n_buffered]
+        data[start:stop] = self.buffer_data[:self.n_buffered]
+        self.n_buffered = 0
+
+    def write(self, time, data):
+        if self.buffer_data is None:
+            self._create_datasets(data)
+        self.buffer_times[self.n_buffered] = time
+        self.buffer_data[self.n_buffered] = data
+        self.n_buffered += 1
+        self.count += 1
+        if self.n_buffered == self.chunk_size:
+            self._flush()
+
+    def close(self):
+        if self.buffer_data is None:
+            self.file.close()
+            return numpy.array([]), numpy.array([])
+        self._flush()
+        times, data = self.h5group['time'], self.h5group['data']
+        if times.shape[0] > self.count:
+            times.resize((self.count, ))
+            data.resize((self.count, ) + data.shape[1:])
+        names = [self.h5group[name].name for name in ('time', 'data')]
+        self.file.close()
+        return tuple(HDF5Dataset(self.path, name) for name in names)
@@ -31,8 +31,12 @@
 """
 .. moduleauthor:: Bogdan Neacsa <bogdan.neacsa@codemart.ro>
 """
+import numpy
 import unittest
 from tvb.basic.profile import TvbProfile
+from tvb.datatypes.connectivity import Connectivity
+from tvb.simulator import coupling, integrators, models, monitors, noise
+from tvb.simulator.simulator import Simulator
 
 
 
@@ -50,4 +54,52 @@ class BaseTestCase(unittest.TestCase):
         super(BaseTestCase, self).assertEqual(expected, actual,
                                               message + " Expected %s but got %s." % (expected, actual))
         
-        
\ No newline at end of file
+        
+
+
+class SimulatorTestCase(BaseTestCase):
+    """
+    Base class for tests comparing the output of region simulations of the default connectivity.
+    """
+
+
+    def _connectivity(self):
+        conn = Connectivity(load_default=True)
+        conn.speed = numpy.array([4.0])
+        return conn
+
+
+    def _noise(self, seed=42, **kwds):
+        "Additive noise with its own random stream, further traits given as keywords."
+        return noise.Additive(nsig=numpy.array([0.001]), random_stream=numpy.random.RandomState(seed), **kwds)
+
+
+    def _simulator(self, stochastic=False, configure=True, **kwds):
+        """
+        Simulator of linearly coupled Generic2dOscillator models, integrated with Heun's method,
+        with additive noise if stochastic, and recorded by Raw and TemporalAverage monitors
+        for 20 ms. Keywords replace these or set further traits of the simulator.
+        """
+        if stochastic:
+            integrator = integrators.HeunStochastic(dt=0.1, noise=self._noise())
+        else:
+            integrator = integrators.HeunDeterministic(dt=0.1)
+        traits = dict(connectivity=self._connectivity(),
+                      model=models.Generic2dOscillator(),
+                      coupling=coupling.Linear(a=0.01),
+                      integrator=integrator,
+                      monitors=(monitors.Raw(), monitors.TemporalAverage(period=1.0)),
+                      simulation_length=20.0)
+        traits.update(kwds)
+        sim = Simulator(**traits)
+        # same random initial conditions for each simulator
+        numpy.random.seed(42)
+        return sim.configure() if configure else sim
+
+
+    def _assert_outputs_equal(self, expected, actual):
+        "Assert that the outputs of two simulations are identical."
+        self.assertEqual(len(expected), len(actual))
+        for (t, x), (t_a, x_a) in zip(expected, actual):
+            numpy.testing.assert_array_equal(t, t_a)
+            numpy.testing.assert_array_equal(x, x_a)
@@ -47,6 +47,7 @@ from tvb.tests.library.datatypes import mode_decompositions_test
 from tvb.tests.library.datatypes import patterns_test
 from tvb.tests.library.datatypes import projections_test
 from tvb.tests.library.datatypes import sensors_test
+from tvb.tests.library.datatypes import simulation_state_test
 from tvb.tests.library.datatypes import spectral_test
 from tvb.tests.library.datatypes import surfaces_test
 from tvb.tests.library.datatypes import temporal_correlations_test
@@ -68,6 +69,7 @@ def suite():
     test_suite.addTest(patterns_test.suite())
     test_suite.addTest(projections_test.suite())
     test_suite.addTest(sensors_test.suite())
+    test_suite.addTest(simulation_state_test.suite())
     test_suite.addTest(spectral_test.suite())
     test_suite.addTest(surfaces_test.suite())
     test_suite.addTest(temporal_correlations_test.suite())
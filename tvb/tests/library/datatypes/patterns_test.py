@@ -76,6 +76,23 @@ class PatternsTest(BaseTestCase):
         self.assertTrue(dt.time is None)
         
         
+    def test_chunked_temporal_pattern(self):
+        dt, n_time = 0.1, 2500
+        time = numpy.r_[0.0:n_time * dt:dt].reshape((1, -1))
+        for temporal in (equations.Gaussian(), equations.Sinusoid(), equations.Linear(),
+                         equations.PulseTrain(), equations.PulseTrain(parameters={'onset': 0.0, 'T': 4.2,
+                                                                                   'tau': 1.3, 'amp': 2.0})):
+            pattern = patterns.SpatioTemporalPattern(temporal=temporal)
+            pattern.configure_time(time)
+            expected = pattern.temporal_pattern.copy()
+            pattern.configure_time_chunked(dt, n_time, chunk_size=300)
+            chunked = pattern.temporal_pattern
+            actual = numpy.array([chunked[0, t] for t in range(n_time)])
+            numpy.testing.assert_array_equal(expected[0], actual)
+            numpy.testing.assert_array_equal(expected, numpy.asarray(chunked))
+            self.assertLessEqual(len(chunked._chunks), chunked.cache_size)
+            self.assertRaises(IndexError, chunked.__getitem__, (0, n_time))
+
     def test_stimuliregion(self):
         conn = connectivity.Connectivity(load_default=True)
         conn.configure()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under 
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General 
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+"""
+Test storing and restoring the state of a simulator.
+
+"""
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import numpy
+import unittest
+from tvb.datatypes.simulation_state import SimulationState
+from tvb.simulator import monitors
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+class SimulationStateTest(SimulatorTestCase):
+
+    def _simulator(self, sim_monitors):
+        return super(SimulationStateTest, self)._simulator(monitors=sim_monitors)
+
+    def _monitors(self):
+        return (monitors.TemporalAverage(period=1.0, compensated_sum=True),
+                monitors.EEG.from_file(period=1.0, project_once=True),
+                monitors.MEG.from_file(period=1.0),
+                monitors.Bold(period=10.0))
+
+    def test_resume_within_period(self):
+        sim = self._simulator(self._monitors())
+        sim.run(simulation_length=20.5)
+        state = SimulationState()
+        state.populate_from(sim)
+        other = self._simulator(self._monitors())
+        state.fill_into(other)
+        for expected, actual in zip(sim.run(simulation_length=29.5), other.run(simulation_length=29.5)):
+            numpy.testing.assert_array_equal(expected[0], actual[0])
+            numpy.testing.assert_array_equal(expected[1], actual[1])
+
+    def test_convert_stored_temporal_average(self):
+        sim = self._simulator((monitors.TemporalAverage(period=1.0), ))
+        sim.run(simulation_length=20.5)
+        state = SimulationState()
+        state.populate_from(sim)
+        # stock of a temporal average stored before it kept a running sum, a row per step
+        temporal, = sim.monitors
+        old_stock = numpy.random.RandomState(42).randn(10, *temporal._stock.shape)
+        state.monitor_stock_1 = old_stock
+        state.monitor_window_count_1 = state.monitor_window_step_1 = numpy.array([], numpy.int32)
+        other = self._simulator((monitors.TemporalAverage(period=1.0), ))
+        state.fill_into(other)
+        # the step following current_step is the next one to be observed
+        n_seen = state.current_step % temporal.istep
+        numpy.testing.assert_allclose(old_stock[:n_seen].sum(axis=0), other.monitors[0]._stock)
+        self.assertEqual(n_seen, other.monitors[0]._window_count[0])
+
+    def test_mismatched_stock(self):
+        sim = self._simulator((monitors.Bold(period=500.0), ))
+        state = SimulationState()
+        state.populate_from(sim)
+        # stock of the direct convolution, one row per stock step of the HRF
+        state.monitor_stock_1 = numpy.zeros((sim.monitors[0]._stock_steps, ) + sim.monitors[0]._stock.shape[1:])
+        self.assertRaises(ValueError, state.fill_into, self._simulator((monitors.Bold(period=500.0), )))
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(SimulationStateTest))
+    return test_suite
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
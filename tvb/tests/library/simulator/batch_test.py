@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test batched parameter sweeps against independent simulations.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import numpy
+import unittest
+from tvb.simulator import coupling, integrators, models, monitors
+from tvb.simulator.batch import BatchSimulator
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class BatchSimulatorTest(SimulatorTestCase):
+
+    coupling_a = [0.0, 0.005, 0.02]
+    model_I = [0.0, 0.1, 0.5]
+    seeds = [42, 7, 1234]
+
+    def _monitors(self):
+        return monitors.Raw(), monitors.TemporalAverage(period=1.0), monitors.GlobalAverage(period=1.0)
+
+    def _integrator(self, seed=42, counter_based=False):
+        nsig = self._noise(seed, counter_based=counter_based, counter_seed=seed)
+        return integrators.HeunStochastic(dt=0.1, noise=nsig)
+
+    def _independent_runs(self, counter_based=False):
+        results = []
+        for a, I, seed in zip(self.coupling_a, self.model_I, self.seeds):
+            sim = self._simulator(coupling=coupling.Linear(a=a),
+                                  model=models.Generic2dOscillator(I=I),
+                                  integrator=self._integrator(seed, counter_based),
+                                  monitors=self._monitors(),
+                                  simulation_length=10.0)
+            results.append(sim.run())
+        return results
+
+    def _batch_simulator(self, counter_based=False, **kwds):
+        if counter_based:
+            seeds = {'integrator.noise.counter_seed': self.seeds}
+        else:
+            seeds = {'integrator.noise.random_stream': [numpy.random.RandomState(seed) for seed in self.seeds]}
+        batch_parameters = {'coupling.a': self.coupling_a, 'model.I': self.model_I}
+        batch_parameters.update(seeds)
+        sim = BatchSimulator(
+            connectivity=self._connectivity(),
+            coupling=coupling.Linear(),
+            model=models.Generic2dOscillator(),
+            integrator=self._integrator(counter_based=counter_based),
+            monitors=self._monitors(),
+            simulation_length=10.0,
+            batch_parameters=batch_parameters,
+            **kwds)
+        return sim.configure()
+
+    def _batch_run(self, counter_based=False, **kwds):
+        return self._batch_simulator(counter_based, **kwds).run()
+
+    def test_matches_independent_runs(self):
+        self._assert_matches(self._independent_runs(), self._batch_run())
+
+    def test_counter_based_matches_independent_runs(self):
+        self._assert_matches(self._independent_runs(counter_based=True), self._batch_run(counter_based=True))
+
+    def test_ragged_history(self):
+        self._assert_matches(self._independent_runs(), self._batch_run(history_layout='ragged'))
+
+    def _assert_matches(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for member_expected, member_actual in zip(expected, actual):
+            self.assertEqual(len(member_expected), len(member_actual))
+            for (t, x), (bt, bx) in zip(member_expected, member_actual):
+                self.assertTrue(numpy.allclose(t, bt))
+                self.assertEqual(x.shape, bx.shape)
+                self.assertTrue(numpy.allclose(x, bx))
+
+    def test_members_differ(self):
+        results = self._batch_run()
+        (_, x0), _, _ = results[0]
+        (_, x1), _, _ = results[1]
+        self.assertFalse(numpy.allclose(x0, x1))
+
+    def test_float32(self):
+        sim = self._batch_simulator(dtype='float32')
+        self.assertEqual(numpy.float32, sim.current_state.dtype)
+        self.assertEqual(numpy.float32, sim.model.a.dtype)
+        self.assertEqual(numpy.float32, sim.integrator.noise.nsig.dtype)
+        for member_expected, member_actual in zip(self._batch_run(), sim.run()):
+            for (t, x), (t32, x32) in zip(member_expected, member_actual):
+                self.assertEqual(numpy.float32, x32.dtype)
+                numpy.testing.assert_allclose(x, x32, rtol=1e-4, atol=1e-4)
+
+    def test_unsupported_backend(self):
+        self.assertRaises(ValueError, self._batch_simulator, backend='numba')
+
+    def test_integrator_workspace(self):
+        sim = self._batch_simulator()
+        workspace = sim.integrator._workspace
+        self.assertTrue(workspace.fits(sim.current_state))
+        self.assertTrue(sim.integrator._dfun_out)
+        sim.run()
+        # integration used the workspace of the stacked state without reallocating it
+        self.assertIs(workspace, sim.integrator._workspace)
+
+    def test_mismatched_parameters(self):
+        sim = BatchSimulator(connectivity=self._connectivity(),
+                             batch_parameters={'coupling.a': [0.0, 0.1], 'model.I': [0.0]})
+        self.assertRaises(ValueError, sim.configure)
+
+    def test_structural_parameter_rejected(self):
+        sim = BatchSimulator(connectivity=self._connectivity(),
+                             batch_parameters={'integrator.dt': [0.1, 0.05]})
+        self.assertRaises(ValueError, sim.configure)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(BatchSimulatorTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
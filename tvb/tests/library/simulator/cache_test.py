@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test the on-disk cache of configured simulator artifacts.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import os
+import shutil
+import tempfile
+import numpy
+import unittest
+from tvb.datatypes.region_mapping import RegionMapping
+from tvb.simulator import monitors
+from tvb.simulator.cache import ArtifactCache, artifact_key
+from tvb.tests.library.base_testcase import BaseTestCase, SimulatorTestCase
+
+
+
+class ArtifactCacheTest(BaseTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_key(self):
+        x = numpy.r_[:10.0]
+        self.assertEqual(artifact_key('a', x, 0.1), artifact_key('a', x.copy(), 0.1))
+        self.assertNotEqual(artifact_key('a', x, 0.1), artifact_key('a', x, 0.05))
+        self.assertNotEqual(artifact_key('a', x, 0.1), artifact_key('a', x.astype('f'), 0.1))
+        self.assertNotEqual(artifact_key('a', x, 0.1), artifact_key('a', x.reshape((2, 5)), 0.1))
+        self.assertNotEqual(artifact_key('a', x, 0.1), artifact_key('b', x, 0.1))
+        self.assertTrue(artifact_key('a', x).startswith('a-'))
+
+    def test_round_trip(self):
+        cache = ArtifactCache(self.path)
+        self.assertIsNone(cache.get('a-0'))
+        x = numpy.random.randn(3, 4)
+        cache.put('a-0', {'x': x, 'i': numpy.r_[:5]})
+        arrays = cache.get('a-0')
+        self.assertIsInstance(arrays['x'], numpy.memmap)
+        self.assertFalse(arrays['x'].flags.writeable)
+        numpy.testing.assert_array_equal(x, arrays['x'])
+        numpy.testing.assert_array_equal(numpy.r_[:5], arrays['i'])
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_fetch(self):
+        cache = ArtifactCache(self.path)
+        calls = []
+
+        def compute():
+            calls.append(None)
+            return {'x': numpy.ones(3)}
+
+        cache.fetch('a-0', compute)
+        numpy.testing.assert_array_equal(numpy.ones(3), cache.fetch('a-0', compute)['x'])
+        self.assertEqual(1, len(calls))
+
+    def test_least_recently_used(self):
+        x = numpy.zeros(1000)
+        cache = ArtifactCache(self.path)
+        cache.put('a-0', {'x': x})
+        cache.max_bytes = 2.5 * cache.nbytes
+        cache.put('a-1', {'x': x})
+        os.utime(cache._entry('a-0'), (0, 0))
+        os.utime(cache._entry('a-1'), (1, 1))
+        cache.get('a-0')
+        cache.put('a-2', {'x': x})
+        self.assertEqual(['a-0', 'a-2'], cache.keys())
+
+    def test_invalidate(self):
+        cache = ArtifactCache(self.path)
+        for key in ('a-0', 'a-1', 'a-2'):
+            cache.put(key, {'x': numpy.zeros(3)})
+        cache.invalidate('a-1')
+        self.assertEqual(['a-0', 'a-2'], cache.keys())
+        cache.invalidate()
+        self.assertEqual([], cache.keys())
+
+    def test_unreadable_entry(self):
+        cache = ArtifactCache(self.path)
+        cache.put('a-0', {'x': numpy.zeros(3)})
+        with open(os.path.join(cache._entry('a-0'), 'x.npy'), 'wb') as fd:
+            fd.write(b'garbage')
+        self.assertIsNone(cache.get('a-0'))
+        self.assertEqual([], cache.keys())
+
+
+
+class SimulatorCacheTest(SimulatorTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _simulator(self, speed=4.0, **kwds):
+        conn = self._connectivity()
+        conn.speed = numpy.array([speed])
+        eeg = monitors.EEG.from_file('eeg_brainstorm_65.txt', 'projection_eeg_65_surface_16k.npy', period=1.0,
+                                     region_mapping=RegionMapping.from_file('regionMapping_16k_76.txt'))
+        return super(SimulatorCacheTest, self)._simulator(connectivity=conn, monitors=(monitors.Raw(), eeg),
+                                                 simulation_length=10.0, **kwds)
+
+    def test_configure_from_cache(self):
+        expected = self._simulator()
+        self._simulator(cache_path=self.path)
+        sim = self._simulator(cache_path=self.path)
+        cache = sim._artifact_cache
+        self.assertEqual((3, 0), (cache.hits, cache.misses))
+        numpy.testing.assert_array_equal(expected.connectivity.idelays, sim.connectivity.idelays)
+        for name in sim.history.index_names:
+            numpy.testing.assert_array_equal(getattr(expected.history, name), getattr(sim.history, name))
+        numpy.testing.assert_array_equal(expected.monitors[1].gain, sim.monitors[1].gain)
+        for (t, x), (t_c, x_c) in zip(expected.run(), sim.run()):
+            numpy.testing.assert_array_equal(t, t_c)
+            numpy.testing.assert_array_equal(x, x_c)
+
+    def test_changed_inputs(self):
+        self._simulator(cache_path=self.path)
+        sim = self._simulator(speed=2.0, cache_path=self.path)
+        # new delays and history, same lead field
+        self.assertEqual((1, 2), (sim._artifact_cache.hits, sim._artifact_cache.misses))
+        self.assertEqual(5, len(sim._artifact_cache.keys()))
+
+    def test_coupling_row_indices(self):
+        sim = self._simulator(cache_path=self.path)
+        lri, nzr = sim.coupling.row_indices(sim.history.nnz_row_el_idx)
+        numpy.testing.assert_array_equal(lri, sim.coupling._cached_lri)
+        numpy.testing.assert_array_equal(nzr, sim.coupling._cached_nzr)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(ArtifactCacheTest))
+    test_suite.addTest(unittest.makeSuite(SimulatorCacheTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
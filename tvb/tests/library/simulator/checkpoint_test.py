@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test checkpointing and resuming simulations.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import os
+import shutil
+import tempfile
+import numpy
+import unittest
+from tvb.simulator import integrators, models, monitors
+from tvb.simulator.checkpoint import CheckpointFile
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class CheckpointTest(SimulatorTestCase):
+
+    def setUp(self):
+        super(CheckpointTest, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sim.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _simulator(self, counter_based=False, **kwds):
+        # coloured noise, such that both random stream and noise state matter
+        nsig = self._noise(ntau=1.0, counter_based=counter_based)
+        return super(CheckpointTest, self)._simulator(integrator=integrators.HeunStochastic(dt=0.1, noise=nsig),
+                                                      **kwds)
+
+    def test_resume_bit_identical(self):
+        # uninterrupted run, which checkpoints at step 200 of 300
+        sim = self._simulator(checkpoint_path=self.path, checkpoint_interval=200)
+        (t_raw, raw), (t_tavg, tavg) = sim.run(simulation_length=30.0)
+        # a fresh simulator picks up from the checkpoint
+        sim = self._simulator()
+        sim.resume(self.path)
+        self.assertEqual(200, sim.current_step)
+        (t_raw_r, raw_r), (t_tavg_r, tavg_r) = sim.run(simulation_length=10.0)
+        numpy.testing.assert_array_equal(t_raw_r, t_raw[200:])
+        numpy.testing.assert_array_equal(raw_r, raw[200:])
+        numpy.testing.assert_array_equal(t_tavg_r, t_tavg[20:])
+        numpy.testing.assert_array_equal(tavg_r, tavg[20:])
+
+    def test_resume_fused_loop(self):
+        sim = self._simulator(checkpoint_path=self.path, checkpoint_interval=200, backend='numba')
+        (_, raw), _ = sim.run(simulation_length=30.0)
+        sim = self._simulator(backend='numba')
+        sim.resume(self.path)
+        (_, raw_r), _ = sim.run(simulation_length=10.0)
+        numpy.testing.assert_array_equal(raw_r, raw[200:])
+
+    def test_resume_ragged_history(self):
+        sim = self._simulator(checkpoint_path=self.path, checkpoint_interval=200, history_layout='ragged')
+        (_, raw), _ = sim.run(simulation_length=30.0)
+        sim = self._simulator(history_layout='ragged')
+        sim.resume(self.path)
+        (_, raw_r), _ = sim.run(simulation_length=10.0)
+        numpy.testing.assert_array_equal(raw_r, raw[200:])
+
+    def test_resume_projection_within_period(self):
+        def projections():
+            eeg, meg = monitors.EEG.from_file(), monitors.MEG.from_file()
+            eeg.period = meg.period = 1.0
+            return eeg, meg
+        # checkpoint half way through a period of the shared sum of the projections
+        sim = self._simulator(monitors=projections(), checkpoint_path=self.path, checkpoint_interval=205)
+        (_, eeg), (_, meg) = sim.run(simulation_length=30.0)
+        sim = self._simulator(monitors=projections())
+        sim.resume(self.path)
+        (_, eeg_r), (_, meg_r) = sim.run(simulation_length=9.5)
+        numpy.testing.assert_array_equal(eeg_r, eeg[20:])
+        numpy.testing.assert_array_equal(meg_r, meg[20:])
+
+    def test_resume_compensated_average_within_period(self):
+        def temporal_average():
+            return monitors.TemporalAverage(period=1.0, compensated_sum=True),
+        sim = self._simulator(monitors=temporal_average(), checkpoint_path=self.path, checkpoint_interval=205)
+        (_, tavg), = sim.run(simulation_length=30.0)
+        sim = self._simulator(monitors=temporal_average())
+        sim.resume(self.path)
+        (_, tavg_r), = sim.run(simulation_length=9.5)
+        numpy.testing.assert_array_equal(tavg_r, tavg[20:])
+
+    def test_resume_counter_based(self):
+        sim = self._simulator(counter_based=True, checkpoint_path=self.path, checkpoint_interval=200)
+        (_, raw), _ = sim.run(simulation_length=30.0)
+        self.assertIn('random_state_counter', CheckpointFile(self.path).read())
+        sim = self._simulator(counter_based=True)
+        sim.resume(self.path)
+        (_, raw_r), _ = sim.run(simulation_length=10.0)
+        numpy.testing.assert_array_equal(raw_r, raw[200:])
+        # random state of the other kind of stream does not match
+        sim = self._simulator()
+        self.assertRaises(ValueError, sim.resume, self.path)
+
+    def test_checkpoint_file_reused(self):
+        sim = self._simulator(checkpoint_path=self.path, checkpoint_interval=50)
+        sim.run(simulation_length=20.0)
+        self.assertEqual(4, sim._checkpoint_file.generation)
+        self.assertEqual(200, int(CheckpointFile(self.path).read()['current_step'][0]))
+
+    def test_resumed_file_kept(self):
+        sim = self._simulator(checkpoint_path=self.path, checkpoint_interval=200)
+        sim.run(simulation_length=30.0)
+        # a fresh simulator, as in a new process, checkpoints to the file it resumed from
+        sim = self._simulator(checkpoint_path=self.path, checkpoint_interval=50)
+        sim.resume(self.path)
+        sim.run(simulation_length=5.0)
+        checkpoint_file = CheckpointFile(self.path)
+        self.assertEqual(2, checkpoint_file.generation)
+        self.assertEqual(250, int(checkpoint_file.read()['current_step'][0]))
+        # the checkpoint resumed from stays in the other slot until the next one is written
+        active = int(checkpoint_file._control[0])
+        self.assertEqual(200, int(checkpoint_file._slot_arrays(1 - active)['current_step'][0]))
+
+    def test_mismatched_configuration(self):
+        self._simulator().checkpoint(self.path)
+        sim = self._simulator(model=models.ReducedWongWang())
+        self.assertRaises(ValueError, sim.resume, self.path)
+
+    def test_empty_checkpoint_file(self):
+        CheckpointFile(self.path, {'x': numpy.zeros(3)})
+        self.assertRaises(ValueError, CheckpointFile(self.path).read)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(CheckpointTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test cloning of simulators.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import numpy
+import unittest
+from tvb.simulator import coupling, monitors
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class CloneTest(SimulatorTestCase):
+
+    def _simulator(self, configure=True):
+        sim_monitors = monitors.Raw(), monitors.TemporalAverage(period=1.0), monitors.SpatialAverage(period=1.0)
+        return super(CloneTest, self)._simulator(stochastic=True, configure=configure, monitors=sim_monitors,
+                                                 simulation_length=10.0)
+
+    def test_shares_structure(self):
+        sim = self._simulator()
+        clone = sim.clone()
+        self.assertIs(sim.connectivity, clone.connectivity)
+        for name in sim.history.index_names + ('weights', 'delays'):
+            self.assertIs(getattr(sim.history, name), getattr(clone.history, name))
+        self.assertIs(sim.monitors[2].spatial_mask, clone.monitors[2].spatial_mask)
+
+    def test_copies_state(self):
+        sim = self._simulator()
+        clone = sim.clone()
+        self.assertIsNot(sim.history.buffer, clone.history.buffer)
+        self.assertIsNot(sim.current_state, clone.current_state)
+        self.assertIsNot(sim.integrator.noise.random_stream, clone.integrator.noise.random_stream)
+        self.assertIsNot(sim.monitors[1]._stock, clone.monitors[1]._stock)
+        self.assertIsNot(sim.model, clone.model)
+        self.assertIsNot(sim.coupling, clone.coupling)
+
+    def test_no_dense_delayed_state(self):
+        sim = self._simulator()
+        sim.history.query(sim.current_step + 1)
+        clone = sim.clone()
+        self.assertFalse(type(clone.history).delayed_state.allocated(clone.history))
+
+    def test_continues_independently(self):
+        sim = self._simulator()
+        clone = sim.clone()
+        expected = self._simulator().run()
+        self._assert_outputs_equal(expected, sim.run())
+        self._assert_outputs_equal(expected, clone.run())
+        # a clone of a simulator which has run continues from its state
+        clone = sim.clone()
+        self._assert_outputs_equal(sim.run(), clone.run())
+
+    def test_overrides(self):
+        sim = self._simulator()
+        clone = sim.clone(coupling=coupling.Linear(a=0.02))
+        self.assertEqual(0.02, clone.coupling.a[0])
+        self.assertEqual(0.01, sim.coupling.a[0])
+        self.assertIs(sim.history.nnz_idelays, clone.history.nnz_idelays)
+        lri, nzr = clone.coupling.row_indices(clone.history.nnz_row_el_idx)
+        numpy.testing.assert_array_equal(lri, clone.coupling._cached_lri)
+        self.assertRaises(AttributeError, sim.clone, not_a_trait=1)
+
+    def test_unconfigured(self):
+        sim = self._simulator(configure=False)
+        clone = sim.clone(simulation_length=5.0)
+        self.assertIsNone(clone.history)
+        self.assertIs(sim.connectivity, clone.connectivity)
+        numpy.random.seed(42)
+        self.assertEqual(50, len(clone.configure().run()[0][0]))
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(CloneTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
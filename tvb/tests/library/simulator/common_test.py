@@ -97,6 +97,28 @@ class CommonTest(BaseTestCase):
             common._add_at(actual, map, source)
             self.assertTrue(numpy.allclose(expected, actual))
 
+    def test_sparse_average(self):
+        ri = numpy.random.randint
+        for shape in [(), (3, ), (4, 2)]:
+            m, n = ri(3, 20), ri(30, 100)
+            source = numpy.random.randn(*((n, ) + shape))
+            map = numpy.r_[:m, ri(0, m, n - m)]
+            expected = numpy.zeros((m, ) + shape)
+            numpy.add.at(expected, map, source)
+            op = common.SparseAverage(map)
+            numpy.testing.assert_allclose(expected, op.sum(source))
+            expected /= numpy.bincount(map).reshape((-1, ) + (1, ) * len(shape))
+            numpy.testing.assert_allclose(expected, op.average(source))
+            # non-contiguous input into preallocated output
+            out = numpy.empty((m, ) + shape)
+            self.assertIs(out, op.average(source.T.copy().T, out=out))
+            numpy.testing.assert_allclose(expected, out)
+
+    def test_sparse_average_shared(self):
+        map = numpy.r_[:5, :5]
+        self.assertIs(common.sparse_average(map, 5), common.sparse_average(map.copy(), 5))
+        self.assertIsNot(common.sparse_average(map, 5), common.sparse_average(map[::-1], 5))
+
     def setUp(self):
         pass
         
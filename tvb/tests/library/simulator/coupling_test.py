@@ -144,6 +144,109 @@ class CouplingTest(BaseTestCase):
         self._apply_coupling_2sv(k)
 
 
+class SparseEvaluationTest(BaseTestCase):
+    "Compare the sparse evaluation of each coupling with the dense sum over all node pairs."
+
+    n_node, n_mode = 7, 2
+
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        n = self.n_node
+        self.weights = rng.rand(n, n) * (rng.rand(n, n) > 0.4)
+        self.weights[0] = 0.0 # a node without afferents
+        self.idelays = rng.randint(0, 5, (n, n))
+        self.rng = rng
+
+    def _history(self, n_cvar):
+        history = SparseHistory(self.weights, self.idelays, numpy.r_[:n_cvar], self.n_mode)
+        history.initialize(self.rng.randn(history.n_time, n_cvar, self.n_node, self.n_mode))
+        return history
+
+    def _dense(self, history, step):
+        "Current state (n_cvar, to, 1, n_mode) and delayed state (n_cvar, to, from, n_mode) of all pairs."
+        buf, n = history.buffer.astype('d'), self.n_node
+        t = (step - 1 - self.idelays) % history.n_time
+        x_j = buf[t, :, numpy.r_[:n]].transpose((2, 0, 1, 3))
+        x_i = buf[(step - 1) % history.n_time][:, :, numpy.newaxis]
+        return x_i, x_j
+
+    def _assert_matches(self, k, n_cvar, dense_pre, dense_post):
+        k.configure()
+        history = self._history(n_cvar)
+        x_i, x_j = self._dense(history, 9)
+        w = self.weights[:, :, numpy.newaxis]
+        expected = dense_post((w * dense_pre(x_i, x_j)).sum(axis=2))
+        numpy.testing.assert_allclose(k(9, history), expected, rtol=1e-5, atol=1e-6)
+
+    def test_linear(self):
+        k = coupling.Linear(a=numpy.r_[0.3], b=numpy.r_[0.1])
+        self._assert_matches(k, 2, lambda x_i, x_j: x_j, lambda gx: 0.3 * gx + 0.1)
+
+    def test_scaling(self):
+        k = coupling.Scaling(a=0.3)
+        self._assert_matches(k, 1, lambda x_i, x_j: x_j, lambda gx: 0.3 * gx)
+
+    def test_hyperbolic_tangent(self):
+        k = coupling.HyperbolicTangent(b=numpy.r_[2.0], midpoint=numpy.r_[0.5])
+        self._assert_matches(k, 1, lambda x_i, x_j: 1 + numpy.tanh(2.0 * x_j - 0.5), lambda gx: gx)
+
+    def test_sigmoidal(self):
+        k = coupling.Sigmoidal(sigma=numpy.r_[2.0])
+        post = lambda gx: -1.0 + 2.0 / (1.0 + numpy.exp(-gx / 2.0))
+        self._assert_matches(k, 2, lambda x_i, x_j: x_j, post)
+
+    def test_sigmoidal_jansen_rit(self):
+        k = coupling.SigmoidalJansenRit(midpoint=numpy.r_[0.0])
+        pre = lambda x_i, x_j: 0.005 / (1.0 + numpy.exp(-(x_j[:1] - x_j[1:2])))
+        self._assert_matches(k, 2, pre, lambda gx: 0.56 * gx)
+
+    def test_difference(self):
+        k = coupling.Difference(a=numpy.r_[0.3])
+        self._assert_matches(k, 2, lambda x_i, x_j: x_j - x_i, lambda gx: 0.3 * gx)
+
+    def test_kuramoto(self):
+        k = coupling.Kuramoto(a=numpy.r_[0.7])
+        post = lambda gx: 0.7 / self.n_node * gx
+        self._assert_matches(k, 1, lambda x_i, x_j: numpy.sin(x_j - x_i), post)
+
+    def _pre_sigmoidal(self, x, theta):
+        return 0.5 * (1.0 + numpy.tanh(60.0 * (x - theta)))
+
+    def test_pre_sigmoidal_static(self):
+        k = coupling.PreSigmoidal(dynamic=False)
+        self._assert_matches(k, 2, lambda x_i, x_j: self._pre_sigmoidal(x_j, 0.5), lambda gx: gx)
+
+    def test_pre_sigmoidal_dynamic(self):
+        k = coupling.PreSigmoidal(dynamic=True)
+        k.configure()
+        history = self._history(2)
+        x_i, x_j = self._dense(history, 9)
+        w = self.weights[:, :, numpy.newaxis]
+        c_0 = (w * self._pre_sigmoidal(x_j[0], x_j[1])).sum(axis=1)
+        c_1 = self._pre_sigmoidal(x_i[0, :, 0], x_i[1, :, 0])
+        numpy.testing.assert_allclose(k(9, history), numpy.array([c_0, c_1]), rtol=1e-5, atol=1e-6)
+
+    def test_pre_sigmoidal_dynamic_global(self):
+        k = coupling.PreSigmoidal(dynamic=True, globalT=True)
+        k.configure()
+        self.idelays[numpy.diag_indices(self.n_node)] = 0
+        history = self._history(2)
+        _, x_j = self._dense(history, 9)
+        # dense computation of the threshold, the first node's as delayed to the source
+        x_j = x_j.transpose((1, 0, 2, 3)) # (to, n_cvar, from, n_mode)
+        a_j = self._pre_sigmoidal(x_j[:, 0], x_j[:, 1, 0])
+        c_0 = (self.weights[:, :, numpy.newaxis] * a_j).sum(axis=1)
+        c_1 = numpy.zeros_like(c_0) + a_j[numpy.r_[:self.n_node], numpy.r_[:self.n_node]].mean()
+        numpy.testing.assert_allclose(k(9, history), numpy.array([c_0, c_1]), rtol=1e-5, atol=1e-6)
+
+    def test_no_dense_delayed_state(self):
+        history = self._history(1)
+        coupling.Linear()(9, history)
+        for name in history.dense_names:
+            self.assertFalse(getattr(SparseHistory, name).allocated(history))
+
+
+
 class CouplingShapeTest(BaseTestCase):
 
     def test_shape(self):
@@ -183,6 +286,7 @@ def suite():
     """
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(CouplingTest))
+    test_suite.addTest(unittest.makeSuite(SparseEvaluationTest))
     test_suite.addTest(unittest.makeSuite(CouplingShapeTest))
     return test_suite
 
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test domain decomposition of simulations over worker processes.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import threading
+import numpy
+import scipy.sparse
+import unittest
+from tvb.simulator import coupling, integrators
+from tvb.simulator.decomposition import DomainDecomposition, HaloLocalCoupling, partition_regions
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class DecompositionTest(SimulatorTestCase):
+
+    def _simulator(self, n_workers=1, cfun=None, stochastic=False, counter_based=False):
+        kwds = {'coupling': cfun} if cfun else {}
+        if stochastic:
+            # coloured noise, such that both random stream and noise state matter
+            nsig = self._noise(ntau=1.0, counter_based=counter_based)
+            kwds['integrator'] = integrators.HeunStochastic(dt=0.1, noise=nsig)
+        return super(DecompositionTest, self)._simulator(n_workers=n_workers, **kwds)
+
+    def _assert_matches_single_process(self, **kwds):
+        single = self._simulator(**kwds)
+        expected = single.run()
+        for n_workers in (2, 3):
+            sim = self._simulator(n_workers=n_workers, **kwds)
+            self._assert_outputs_equal(expected, sim.run())
+            numpy.testing.assert_array_equal(single.current_state, sim.current_state)
+            numpy.testing.assert_array_equal(single.history.buffer, sim.history.buffer)
+            # history and noise state carry over to the next run
+            (_, x_next), _ = sim.run(simulation_length=5.0)
+            continued = self._simulator(**kwds)
+            continued.run()
+            (_, x_expected), _ = continued.run(simulation_length=5.0)
+            numpy.testing.assert_array_equal(x_expected, x_next)
+
+    def test_deterministic(self):
+        self._assert_matches_single_process()
+
+    def test_stochastic(self):
+        self._assert_matches_single_process(stochastic=True)
+
+    def test_counter_based_noise(self):
+        self._assert_matches_single_process(stochastic=True, counter_based=True)
+
+    def test_current_state_coupling(self):
+        sim = self._simulator(cfun=coupling.Difference(a=0.01))
+        self.assertEqual(1, DomainDecomposition(sim, 2).window)
+        self._assert_matches_single_process(cfun=coupling.Difference(a=0.01))
+
+    def test_window(self):
+        sim = self._simulator()
+        decomposition = DomainDecomposition(sim, 2)
+        history = sim.history
+        cross = decomposition.owner[history.nnz_row_el_idx] != decomposition.owner[history.nnz_col_el_idx]
+        expected = min(history.nnz_idelays[cross].min() + 1, DomainDecomposition.max_window)
+        self.assertEqual(expected, decomposition.window)
+        self.assertEqual(list(range(76)), sorted(numpy.concatenate(decomposition.nodes)))
+
+    def test_worker_history(self):
+        sim = self._simulator()
+        decomposition = DomainDecomposition(sim, 3)
+        step = sim.current_step + 1
+        expected = sim.coupling(step, sim.history)
+        for rank, regions in enumerate(decomposition.regions):
+            history = decomposition._worker_history(rank)
+            self.assertIs(sim.history.buffer, history.buffer)
+            self.assertTrue((decomposition.owner[history.nnz_row_el_idx] == rank).all())
+            cfun = coupling.Linear(a=0.01)
+            numpy.testing.assert_allclose(expected[:, regions], cfun(step, history)[:, regions])
+
+    def test_partition_regions(self):
+        parts = partition_regions(numpy.ones(10), 3)
+        self.assertEqual([4, 3, 3], [len(part) for part in parts])
+        # balanced by node counts, with at least one region per part
+        parts = partition_regions([1, 1, 1, 1, 8], 2)
+        self.assertEqual([[0, 1, 2, 3], [4]], [list(part) for part in parts])
+        parts = partition_regions([100, 1, 1, 1, 1], 3)
+        self.assertEqual([0], list(parts[0]))
+        self.assertTrue(all(len(part) for part in parts))
+        self.assertRaises(ValueError, partition_regions, numpy.ones(2), 3)
+
+    def test_halo_local_coupling(self):
+        n_node, n_part = 50, 3
+        matrix = scipy.sparse.random(n_node, n_node, density=0.2, format='csr', random_state=42)
+        x = numpy.random.RandomState(42).randn(n_node)
+        halo = numpy.zeros((2, n_node, 1))
+        barrier = threading.Barrier(n_part)
+        results = {}
+
+        def apply(nodes):
+            local_coupling = HaloLocalCoupling(matrix[nodes], nodes, halo, barrier)
+            # twice, alternating halo buffers
+            results[nodes[0]] = [local_coupling * x[nodes], local_coupling * (2 * x[nodes])]
+
+        threads = [threading.Thread(target=apply, args=(nodes, ))
+                   for nodes in numpy.array_split(numpy.r_[:n_node], n_part)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for scale in range(2):
+            actual = numpy.concatenate([results[key][scale] for key in sorted(results)])
+            numpy.testing.assert_allclose(matrix.dot((scale + 1) * x), actual)
+
+    def test_unsupported(self):
+        sim = self._simulator(n_workers=2)
+        sim.checkpoint_path, sim.checkpoint_interval = 'unused.ckpt', 10
+        self.assertRaises(NotImplementedError, sim.run)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(DecompositionTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
@@ -34,6 +34,7 @@ Tests for data descriptors for declaring workspace for algorithms and checking u
 
 """
 
+import copy
 import unittest
 import numpy
 from tvb.simulator.descriptors import StaticAttr, NDArray, ImmutableAttrError, Final, Dim
@@ -110,6 +111,37 @@ class TestNDArray(unittest.TestCase):
     def test_incorrect_shape(self):
         self.assertRaises(ValueError, self._set_incorrect_shape)
 
+    def _lazy(self):
+        class Lazy(StaticAttr):
+            n = Dim()
+            values = NDArray(('n', ), 'f', init='init_values')
+            scratch = NDArray(('n', ), 'f', read_only=False, workspace=True)
+            def __init__(self):
+                self.n = 4
+            def init_values(self):
+                self.values = numpy.r_[:self.n]
+        return Lazy()
+
+    def test_init_on_first_access(self):
+        lazy = self._lazy()
+        self.assertFalse(type(lazy).values.allocated(lazy))
+        numpy.testing.assert_array_equal(numpy.r_[:4], lazy.values)
+        self.assertTrue(type(lazy).values.allocated(lazy))
+
+    def test_workspace_not_copied(self):
+        lazy = self._lazy()
+        lazy.scratch = lazy.values
+        other = copy.deepcopy(lazy)
+        self.assertIs(lazy.values, other.values)
+        self.assertFalse(type(other).scratch.allocated(other))
+
+    def test_share(self):
+        lazy = self._lazy()
+        other = type(lazy)()
+        lazy.scratch = numpy.ones(4)
+        type(lazy).scratch.share(lazy, other)
+        self.assertIs(lazy.scratch, other.scratch)
+
 
 class TestFinal(unittest.TestCase):
 
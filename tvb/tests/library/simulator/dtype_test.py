@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test simulations in single precision.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import numpy
+import unittest
+from tvb.simulator import integrators, models, noise
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class DtypeTest(SimulatorTestCase):
+
+    def _simulator(self, dtype, backend='numpy', integrator=None):
+        kwds = {'integrator': integrator} if integrator else {}
+        return super(DtypeTest, self)._simulator(backend=backend, dtype=dtype, **kwds)
+
+    def _compare(self, backend='numpy', integrator=None):
+        sim = self._simulator('float32', backend, integrator and integrator())
+        self.assertEqual(numpy.float32, sim.current_state.dtype)
+        self.assertEqual(numpy.float32, sim.model.a.dtype)
+        outputs = sim.run()
+        self.assertEqual(numpy.float32, sim.current_state.dtype)
+        outputs64 = self._simulator('float64', backend, integrator and integrator()).run()
+        for (t, data), (t64, data64) in zip(outputs, outputs64):
+            self.assertEqual(numpy.float32, data.dtype)
+            self.assertEqual(numpy.float64, data64.dtype)
+            numpy.testing.assert_allclose(t, t64)
+            numpy.testing.assert_allclose(data, data64, rtol=1e-4, atol=1e-4)
+
+    def test_numpy(self):
+        self._compare()
+
+    def test_numpy_stochastic(self):
+        self._compare(integrator=lambda: integrators.HeunStochastic(
+            dt=0.1, noise=noise.Additive(nsig=numpy.array([1e-4]))))
+
+    def test_numba(self):
+        self._compare('numba')
+
+    def test_model_dfun(self):
+        # models with numba and numexpr dfuns, and parameters with integer defaults
+        for model_class in (models.Epileptor, models.Generic2dOscillator, models.JansenRit, models.Kuramoto,
+                            models.LarterBreakspear, models.ReducedWongWang, models.WilsonCowan,
+                            models.ZetterbergJansen):
+            for dtype in ('float32', 'float64'):
+                sim = super(DtypeTest, self)._simulator(model=model_class(), dtype=dtype)
+                coupling = numpy.zeros((sim.model.cvar.size, ) + sim.current_state.shape[1:], dtype)
+                derivative = sim.model.dfun(sim.current_state, coupling)
+                self.assertEqual(numpy.dtype(dtype), derivative.dtype, model_class.__name__)
+
+    def test_unknown_dtype(self):
+        self.assertRaises(ValueError, self._simulator, 'float16')
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(DtypeTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
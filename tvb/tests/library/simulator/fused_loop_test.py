@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test the fused compiled loop against the NumPy integration loop.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import numpy
+import unittest
+from tvb.simulator import coupling, integrators, models
+from tvb.simulator.models.base import ModelNumbaDfun
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class FusedLoopTest(SimulatorTestCase):
+
+    def _simulator(self, backend, model=None, cfun=None, integrator=None):
+        model = model or models.Generic2dOscillator()
+        sim = super(FusedLoopTest, self)._simulator(configure=False, backend=backend, model=model,
+                                                    coupling=cfun or coupling.Linear(a=0.01),
+                                                    integrator=integrator or integrators.HeunDeterministic(dt=0.1))
+        sim.preconfigure()
+        conn = sim.connectivity
+        n_time = int(conn.tract_lengths.max() / conn.speed[0] / sim.integrator.dt) + 2
+        sim.initial_conditions = model.initial(
+            sim.integrator.dt, (n_time, model.nvar, conn.number_of_regions, 1), numpy.random.RandomState(42))
+        return sim.configure()
+
+    def _assert_same(self, make_sim):
+        (_, raw_np), (_, tavg_np) = make_sim('numpy').run()
+        (_, raw_nb), (_, tavg_nb) = make_sim('numba').run()
+        self.assertEqual(raw_np.shape, raw_nb.shape)
+        self.assertTrue(numpy.isfinite(raw_np).all())
+        numpy.testing.assert_allclose(raw_nb, raw_np, rtol=1e-6, atol=1e-8)
+        numpy.testing.assert_allclose(tavg_nb, tavg_np, rtol=1e-6, atol=1e-8)
+
+    def test_couplings(self):
+        for cfun in (coupling.Linear(a=0.01, b=0.1), coupling.Scaling(a=0.01),
+                     coupling.HyperbolicTangent(a=0.01), coupling.Difference(a=0.01)):
+            self._assert_same(lambda backend: self._simulator(backend, cfun=cfun))
+
+    def test_schemes(self):
+        for integrator in (integrators.EulerDeterministic, integrators.HeunDeterministic,
+                           integrators.RungeKutta4thOrderDeterministic):
+            self._assert_same(lambda backend: self._simulator(backend, integrator=integrator(dt=0.1)))
+
+    def test_stochastic_schemes(self):
+        for integrator in (integrators.EulerStochastic, integrators.HeunStochastic):
+            def make_sim(backend):
+                return self._simulator(backend, integrator=integrator(dt=0.1, noise=self._noise()))
+            self._assert_same(make_sim)
+
+    def test_models(self):
+        for model in (models.ReducedWongWang, models.JansenRit, models.Epileptor):
+            self._assert_same(lambda backend: self._simulator(backend, model=model(), cfun=coupling.Linear(a=0.0)))
+
+    def test_unsupported(self):
+        sim = self._simulator('numba', cfun=coupling.Kuramoto())
+        self.assertRaises(NotImplementedError, sim.run)
+
+    def test_model_without_kernel(self):
+        class KernelFreeOscillator(models.Generic2dOscillator):
+            _numba_kernel = ModelNumbaDfun._numba_kernel
+            _numba_kernel_parameters = ModelNumbaDfun._numba_kernel_parameters
+        sim = self._simulator('numba', model=KernelFreeOscillator())
+        self.assertIsNone(sim.model._numba_kernel_parameters())
+        self.assertRaises(NotImplementedError, sim.run)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(FusedLoopTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
@@ -43,7 +43,9 @@ import numpy
 import unittest
 import tvb.basic.traits.types_basic as basic
 from tvb.datatypes.connectivity import Connectivity
+from tvb.simulator import coupling, integrators
 from tvb.simulator.coupling import Coupling
+from tvb.simulator.history import SparseHistory, RaggedHistory, CompiledHistory, DelayBuckets
 from tvb.simulator.integrators import Identity
 from tvb.simulator.models import Model
 from tvb.simulator.monitors import Raw
@@ -121,12 +123,233 @@ class ExactPropagationTests(BaseTestCase):
 
 
 
+class DelayBucketsTests(BaseTestCase):
+
+    def _history(self, n=30, n_delay=4, n_cvar=2, n_mode=2, dense=False):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(n, n) * (rng.rand(n, n) < (0.9 if dense else 0.2))
+        idelays = rng.randint(0, n_delay, (n, n))
+        history = SparseHistory(weights, idelays, numpy.r_[:n_cvar], n_mode)
+        history.initialize(rng.randn(history.n_time, n_cvar, n, n_mode))
+        return history
+
+    def _assert_same_coupling(self, k, history):
+        k.configure()
+        gathered = [k(step, history) for step in range(1, 6)]
+        history.buckets = DelayBuckets(history)
+        for step, expected in zip(range(1, 6), gathered):
+            numpy.testing.assert_allclose(k(step, history), expected, rtol=1e-5, atol=1e-6)
+
+    def test_couplings(self):
+        for k in (coupling.Linear(), coupling.Scaling(), coupling.HyperbolicTangent(), coupling.Sigmoidal(),
+                  coupling.SigmoidalJansenRit()):
+            self._assert_same_coupling(k, self._history())
+
+    def test_dense_blocks(self):
+        history = self._history(n_delay=2, dense=True)
+        buckets = DelayBuckets(history)
+        self.assertTrue(all(isinstance(block, numpy.ndarray) for block in buckets.blocks))
+        self._assert_same_coupling(coupling.Linear(), history)
+
+    def test_uses_current_state(self):
+        self.assertFalse(coupling.Linear().uses_current_state())
+        self.assertFalse(coupling.SigmoidalJansenRit().uses_current_state(2))
+        self.assertTrue(coupling.Difference().uses_current_state())
+        self.assertTrue(coupling.Kuramoto().uses_current_state())
+        self.assertTrue(coupling.PreSigmoidal().uses_current_state(2))
+
+    def test_suitable(self):
+        self.assertTrue(DelayBuckets.suitable(self._history(n=200, n_delay=2, dense=True)))
+        self.assertFalse(DelayBuckets.suitable(self._history(n=200, n_delay=100, dense=True)))
+
+    def _simulator(self, **kwds):
+        sim = Simulator(connectivity=Connectivity(load_default=True),
+                        coupling=kwds.pop('coupling', coupling.Linear(a=0.1)),
+                        integrator=integrators.HeunDeterministic(dt=0.1),
+                        monitors=(Raw(), ), simulation_length=5.0, **kwds)
+        numpy.random.seed(42)
+        return sim.configure()
+
+    def test_simulator_engine(self):
+        self.assertIsNone(self._simulator().history.buckets)
+        sim = self._simulator(coupling_engine='buckets')
+        self.assertIsInstance(sim.history.buckets, DelayBuckets)
+        (_, expected), = self._simulator(coupling_engine='gather').run()
+        (_, actual), = sim.run()
+        numpy.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-8)
+        self.assertIs(sim.history.buckets, sim.clone().history.buckets)
+        self.assertRaises(ValueError, self._simulator, coupling_engine='buckets', coupling=coupling.Difference())
+        self.assertRaises(ValueError, self._simulator, coupling_engine='dense')
+
+
+
+class RaggedHistoryTests(BaseTestCase):
+
+    def _histories(self, n=20, n_cvar=2, n_mode=3, step=7):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(n, n) * (rng.rand(n, n) < 0.3)
+        idelays = rng.randint(0, 5, (n, n))
+        # a single long tract sets the length of the full history
+        idelays[0, 1] = 40
+        weights[0, 1] = 1.0
+        init = rng.randn(41, n_cvar, n, n_mode)
+        histories = []
+        for history_class in (SparseHistory, RaggedHistory):
+            history = history_class(weights, idelays, numpy.r_[:n_cvar], n_mode)
+            history.initialize(init, step)
+            histories.append(history)
+        return histories
+
+    def test_matches_sparse_history(self):
+        step = 7
+        full, ragged = self._histories(step=step)
+        rng = numpy.random.RandomState(0)
+        for step in range(step + 1, step + 60):
+            for expected, actual in zip(full.query_sparse(step), ragged.query_sparse(step)):
+                numpy.testing.assert_array_equal(actual, expected)
+            new_state = rng.randn(full.n_cvar, full.n_node, full.n_mode)
+            full.update(step, new_state)
+            ragged.update(step, new_state)
+
+    def test_depth(self):
+        _, ragged = self._histories()
+        self.assertEqual(41, ragged.depth[1])
+        self.assertTrue((ragged.depth[2:] <= 5).all())
+        self.assertEqual(ragged.depth.sum(), ragged.buffer.shape[1])
+
+    def test_nbytes(self):
+        full, ragged = self._histories()
+        self.assertLess(ragged.buffer.nbytes, full.buffer.nbytes / 4)
+        self.assertLess(ragged.nbytes, full.nbytes)
+
+    def test_delayed_node_state(self):
+        full, ragged = self._histories()
+        idelays = full.delays.astype('i')
+        expected = full.buffer[(9 - 1 - idelays[:, 1]) % full.n_time, 1, 1]
+        numpy.testing.assert_array_equal(expected, full.delayed_node_state(9, 1, 1))
+        numpy.testing.assert_array_equal(expected, ragged.delayed_node_state(9, 1, 1))
+        # a node not keeping the samples at its delays to nodes it is not connected to
+        short = numpy.nonzero((idelays >= ragged.depth).any(axis=0))[0][0]
+        self.assertRaises(ValueError, ragged.delayed_node_state, 9, 1, short)
+
+    def test_dense_arrays_on_query(self):
+        for history in self._histories():
+            allocated = lambda name: getattr(type(history), name).allocated(history)
+            self.assertFalse(any(allocated(name) for name in history.dense_names))
+            _, delayed_state = history.query(9)
+            self.assertTrue(allocated('delayed_state'))
+            self.assertFalse(any(allocated(name) for name in history.dense_names if name.startswith('es_')))
+            expected = numpy.zeros(delayed_state.shape)
+            expected.transpose((1, 0, 2, 3))[:, history.nnz_mask] = history.query_sparse(9)[1]
+            numpy.testing.assert_array_equal(expected, delayed_state)
+
+    def _simulator(self, **kwds):
+        conn = Connectivity(load_default=True)
+        conn.speed = numpy.array([3.0])
+        sim = Simulator(connectivity=conn, coupling=coupling.Sigmoidal(),
+                        integrator=integrators.HeunDeterministic(dt=0.1),
+                        monitors=(Raw(), ), simulation_length=5.0, **kwds)
+        numpy.random.seed(42)
+        return sim.configure()
+
+    def test_simulator_layout(self):
+        sim = self._simulator(history_layout='ragged')
+        self.assertIsInstance(sim.history, RaggedHistory)
+        (_, expected), = self._simulator().run()
+        (_, actual), = sim.run()
+        # the full layout may sum afferents in a compiled kernel, in double precision
+        numpy.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-8)
+        self.assertRaises(ValueError, self._simulator, history_layout='jagged')
+
+
+
+@unittest.skipUnless(CompiledHistory.available, 'compiled history not built')
+class CompiledHistoryTests(BaseTestCase):
+
+    def _histories(self, n=20, n_cvar=2, n_mode=2, n_batch=2):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(n, n) * (rng.rand(n, n) < 0.3)
+        weights[3] = 0.0 # a node without afferents
+        idelays = rng.randint(0, 10, (n, n))
+        init = rng.randn(10, n_cvar, n * n_batch, n_mode)
+        histories = []
+        for history_class in (SparseHistory, CompiledHistory):
+            history = history_class(weights, idelays, numpy.r_[:n_cvar], n_mode, n_batch=n_batch)
+            history.initialize(init)
+            histories.append(history)
+        return histories
+
+    def _steps(self, histories, n_step=25):
+        rng = numpy.random.RandomState(0)
+        for step in range(1, n_step):
+            yield step
+            # update from a state with more variables than coupling variables
+            new_state = rng.randn(3, histories[0].n_batch_node, histories[0].n_mode)
+            for history in histories:
+                history.update(step, new_state)
+
+    def test_query_matches_sparse_history(self):
+        histories = self._histories()
+        for step in self._steps(histories):
+            for expected, actual in zip(*[history.query_sparse(step) for history in histories]):
+                numpy.testing.assert_array_equal(actual, expected)
+        numpy.testing.assert_array_equal(histories[1].buffer, histories[0].buffer)
+
+    def test_weighted_sum_matches_coupling(self):
+        histories = self._histories()
+        k = coupling.Coupling()
+        for step in self._steps(histories):
+            sparse, compiled = histories
+            _, x_j = sparse.query_sparse(step)
+            expected = k._sum_afferents(sparse, x_j, x_j.dtype)
+            numpy.testing.assert_allclose(compiled.weighted_sum(step), expected, rtol=1e-5, atol=1e-5)
+
+    def test_couplings(self):
+        for k in (coupling.Linear(a=0.1), coupling.HyperbolicTangent(), coupling.Difference(), coupling.Kuramoto()):
+            k.configure()
+            histories = self._histories(n_cvar=1, n_mode=1, n_batch=1)
+            for step in self._steps(histories):
+                expected, actual = [k(step, history) for history in histories]
+                numpy.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
+
+    def test_out_of_range_delays(self):
+        sparse, _ = self._histories(n_batch=1)
+        indices = {name: getattr(sparse, name) for name in SparseHistory.index_names}
+        indices['nnz_idelays'] = indices['nnz_idelays'] + sparse.n_time
+        self.assertRaises(IndexError, CompiledHistory, sparse.weights, sparse.delays.astype('i'), sparse.cvars,
+                          sparse.n_mode, indices=indices)
+
+    def _simulator(self):
+        sim = Simulator(connectivity=Connectivity(load_default=True), coupling=coupling.Linear(a=0.1),
+                        integrator=integrators.HeunDeterministic(dt=0.1),
+                        monitors=(Raw(), ), simulation_length=5.0)
+        numpy.random.seed(42)
+        return sim.configure()
+
+    def test_simulator_fallback(self):
+        sim = self._simulator()
+        self.assertIsInstance(sim.history, CompiledHistory)
+        (_, compiled), = sim.run()
+        CompiledHistory.available = False
+        try:
+            sim = self._simulator()
+        finally:
+            CompiledHistory.available = True
+        self.assertNotIsInstance(sim.history, CompiledHistory)
+        (_, expected), = sim.run()
+        numpy.testing.assert_allclose(compiled, expected, rtol=1e-5, atol=1e-8)
+
+
+
 def suite():
     """
     Gather all the tests in a test suite.
     """
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(ExactPropagationTests))
+    test_suite.addTest(unittest.makeSuite(DelayBucketsTests))
+    test_suite.addTest(unittest.makeSuite(RaggedHistoryTests))
+    test_suite.addTest(unittest.makeSuite(CompiledHistoryTests))
     return test_suite
 
 
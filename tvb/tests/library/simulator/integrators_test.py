@@ -47,8 +47,14 @@ import numpy
 
 from tvb.tests.library.base_testcase import BaseTestCase
 from tvb.simulator import integrators
+from tvb.simulator import models
 from tvb.simulator import noise
 
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
 # For the moment all integrators inherit dt from the base class
 dt = integrators.Integrator.dt.interface['default']
 
@@ -146,12 +152,93 @@ class IntegratorsTest(BaseTestCase):
             self.assertTrue(numpy.allclose(x[idx], val))
 
 
+class WorkspaceTest(BaseTestCase):
+    "Integration steps with preallocated workspaces."
+
+    shape = 2, 20000, 1
+    schemes = (integrators.HeunDeterministic, integrators.EulerDeterministic,
+               integrators.RungeKutta4thOrderDeterministic)
+
+    def _dfun(self, X, coupling, local_coupling, out=None):
+        return numpy.multiply(X, -0.5, out=out)
+
+    def _peak_bytes(self, integrator, X):
+        tracemalloc.start()
+        try:
+            integrator.scheme(X, self._dfun, 0.0, 0.0, 0.0)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_step_does_not_allocate(self):
+        X = numpy.random.randn(*self.shape)
+        for scheme in self.schemes:
+            integrator = scheme(dt=0.1)
+            self.assertGreater(self._peak_bytes(integrator, X), X.nbytes)
+            integrator.configure_workspace(self.shape, numpy.float64, dfun_out=True)
+            self.assertLess(self._peak_bytes(integrator, X), X.nbytes / 10)
+
+    def test_matches_allocating_step(self):
+        X = numpy.random.randn(*self.shape)
+        stimulus = numpy.random.randn(*self.shape)
+        for scheme in self.schemes:
+            expected = scheme(dt=0.1).scheme(X, self._dfun, 0.0, 0.0, stimulus)
+            for dfun_out in (False, True):
+                integrator = scheme(dt=0.1)
+                integrator.configure_workspace(self.shape, numpy.float64, dfun_out)
+                numpy.testing.assert_array_equal(integrator.scheme(X, self._dfun, 0.0, 0.0, stimulus), expected)
+
+    def test_next_state_alternates(self):
+        integrator = integrators.HeunStochastic(dt=0.1)
+        integrator.noise.configure_white(0.1, self.shape)
+        integrator.configure_workspace(self.shape)
+        X0 = numpy.random.randn(*self.shape)
+        X1 = integrator.scheme(X0, self._dfun, 0.0, 0.0, 0.0)
+        X2 = integrator.scheme(X1, self._dfun, 0.0, 0.0, 0.0)
+        X3 = integrator.scheme(X2, self._dfun, 0.0, 0.0, 0.0)
+        self.assertIsNot(X1, X0)
+        self.assertIsNot(X2, X1)
+        self.assertIs(X3, X1)
+
+    def test_reallocates_for_other_shape(self):
+        integrator = integrators.HeunDeterministic(dt=0.1)
+        integrator.configure_workspace(self.shape)
+        X = numpy.random.randn(2, 10, 1)
+        self.assertEqual(X.shape, integrator.scheme(X, self._dfun, 0.0, 0.0, 0.0).shape)
+
+    def test_model_dfun_out(self):
+        for model_class in (models.Generic2dOscillator, models.ReducedWongWang, models.JansenRit,
+                            models.Epileptor, models.Linear):
+            model = model_class()
+            model.configure()
+            self.assertTrue(model.dfun_out)
+            X = model.initial(0.1, (1, model.nvar, 10, 1))[0]
+            c = numpy.random.randn(len(model.cvar), 10, 1)
+            out = numpy.empty_like(X)
+            self.assertTrue(numpy.shares_memory(model.dfun(X, c, out=out), out))
+            numpy.testing.assert_allclose(out, model.dfun(X, c))
+
+    def test_overridden_dfun_without_out(self):
+        class Model(models.Linear):
+            def dfun(self, state, coupling, local_coupling=0.0):
+                return super(Model, self).dfun(state, coupling, local_coupling)
+        class ModelOut(models.Linear):
+            dfun_out = True
+            def dfun(self, state, coupling, local_coupling=0.0, out=None):
+                return super(ModelOut, self).dfun(state, coupling, local_coupling, out)
+        self.assertTrue(models.Linear()._dfun_takes_out())
+        self.assertFalse(Model()._dfun_takes_out())
+        self.assertTrue(ModelOut()._dfun_takes_out())
+
+
 def suite():
     """
     Gather all the tests in a test suite.
     """
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(IntegratorsTest))
+    test_suite.addTest(unittest.makeSuite(WorkspaceTest))
     return test_suite
 
 
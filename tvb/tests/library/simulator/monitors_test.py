@@ -44,7 +44,7 @@ if __name__ == "__main__":
     from tvb.tests.library import setup_test_console_env
     setup_test_console_env()
 
-from tvb.datatypes import sensors
+from tvb.datatypes import equations, sensors
 from tvb.simulator import monitors, models, coupling, integrators, noise, simulator
 from tvb.basic.logger.builder import get_logger
 from tvb.tests.library.base_testcase import BaseTestCase
@@ -222,6 +222,128 @@ class NoSubCorticalProjection(SubcorticalProjectionTest):
     n_regions = 76
 
 
+class BoldConvolutionTest(BaseTestCase):
+    "Incremental and direct convolution of the Bold monitor's stock with the HRF."
+
+    def _monitor(self, hrf_convolution, dt=1.0, **kwds):
+        bold = monitors.Bold(period=1000.0, hrf_length=4000.0, hrf_convolution=hrf_convolution, **kwds)
+        sim = simulator.Simulator(connectivity=connectivity.Connectivity(load_default=True),
+                                  integrator=integrators.HeunDeterministic(dt=dt),
+                                  monitors=(bold, )).configure()
+        return sim.monitors[0]
+
+    def _samples(self, monitor, n_step=7000):
+        rng = numpy.random.RandomState(42)
+        samples = [monitor.sample(step, rng.randn(2, 76, 1)) for step in range(1, n_step + 1)]
+        return [sample for sample in samples if sample is not None]
+
+    def test_matches_direct(self):
+        for kernel in (equations.FirstOrderVolterra(), equations.Gamma(), equations.DoubleExponential(),
+                       equations.MixtureOfGammas()):
+            expected = self._samples(self._monitor('direct', hrf_kernel=kernel))
+            actual = self._samples(self._monitor('incremental', hrf_kernel=kernel))
+            self.assertEqual(7, len(actual))
+            self._assert_samples_close(expected, actual)
+
+    def test_matches_direct_unaligned(self):
+        # sample and stock sample steps share no factor, 13 and 3333 steps
+        expected = self._samples(self._monitor('direct', dt=0.3), n_step=20000)
+        actual = self._samples(self._monitor('incremental', dt=0.3), n_step=20000)
+        self.assertEqual(6, len(actual))
+        self._assert_samples_close(expected, actual)
+
+    def _assert_samples_close(self, expected, actual):
+        for (t, bold), (t_inc, bold_inc) in zip(expected, actual):
+            self.assertEqual(t, t_inc)
+            numpy.testing.assert_allclose(bold, bold_inc, rtol=1e-10, atol=1e-12 * abs(bold).max())
+
+    def test_stock_size(self):
+        direct, incremental = self._monitor('direct'), self._monitor('incremental')
+        self.assertEqual(1000, direct._stock.shape[0])
+        # a stock sample contributes to the 4 samples within the HRF duration, or 5 when one is due
+        self.assertEqual(5, incremental._stock.shape[0])
+
+    def test_unknown_convolution(self):
+        self.assertRaises(ValueError, self._monitor, 'fft')
+
+
+class ProjectOnceTest(BaseTestCase):
+    "Projection monitors summing the state over a period and projecting it once per sample."
+
+    def _simulator(self, project_once, period=1.0, **kwds):
+        eeg = monitors.EEG.from_file(reference='average', project_once=project_once)
+        meg = monitors.MEG.from_file(project_once=project_once)
+        eeg.period, meg.period = 1.0, period
+        return simulator.Simulator(
+            connectivity=connectivity.Connectivity(load_default=True),
+            coupling=coupling.Linear(a=1e-3),
+            integrator=integrators.HeunStochastic(
+                dt=0.1, noise=noise.Additive(nsig=numpy.array([1e-4]), random_stream=numpy.random.RandomState(42))),
+            monitors=(eeg, meg), simulation_length=20.0, **kwds).configure()
+
+    def test_matches_per_step(self):
+        expected = self._simulator(project_once=False).run()
+        actual = self._simulator(project_once=True).run()
+        for (t, x), (t_once, x_once) in zip(expected, actual):
+            numpy.testing.assert_array_equal(t, t_once)
+            numpy.testing.assert_allclose(x, x_once, rtol=1e-10, atol=1e-12 * abs(x).max())
+
+    def test_shared_sum(self):
+        eeg, meg = self._simulator(project_once=True).monitors
+        self.assertIs(eeg._window, meg._window)
+        self.assertEqual(2, eeg._window.n_user)
+        eeg, meg = self._simulator(project_once=True, period=2.0).monitors
+        self.assertIsNot(eeg._window, meg._window)
+
+    def test_clone_within_period(self):
+        sim = self._simulator(project_once=True)
+        sim.run(simulation_length=5.5)
+        clone = sim.clone()
+        self.assertIs(clone.monitors[0]._window, clone.monitors[1]._window)
+        for (t, x), (t_c, x_c) in zip(sim.run(), clone.run()):
+            numpy.testing.assert_array_equal(x, x_c)
+
+
+class RegionAverageTest(BaseTestCase):
+    "Sparse averaging of surface nodes within regions by SpatialAverage and BoldRegionROI."
+
+    def setUp(self):
+        super(RegionAverageTest, self).setUp()
+        cortex = Cortex(region_mapping_data=RegionMapping.from_file('regionMapping_16k_76.txt'), load_default=True)
+        self.sim = simulator.Simulator(
+            connectivity=connectivity.Connectivity(load_default=True), surface=cortex,
+            integrator=integrators.HeunDeterministic(dt=1.0),
+            monitors=(monitors.SpatialAverage(period=1.0), monitors.Bold(period=500.0, hrf_length=1000.0),
+                      monitors.BoldRegionROI(period=500.0, hrf_length=1000.0))).configure()
+        self.regmap = self.sim._regmap
+        self.shape = len(self.sim.model.variables_of_interest), self.sim.number_of_nodes, 1
+
+    def _region_mean(self, x):
+        counts = numpy.bincount(self.regmap)
+        return numpy.array([[numpy.bincount(self.regmap, weights=row) / counts for row in x[..., 0]]]).transpose((1, 2, 0))
+
+    def test_spatial_average(self):
+        spatial = self.sim.monitors[0]
+        state = numpy.random.RandomState(42).randn(*self.shape)
+        _, sample = spatial.sample(1, state)
+        self.assertEqual((self.shape[0], 76, 1), sample.shape)
+        numpy.testing.assert_allclose(self._region_mean(state), sample, rtol=1e-10)
+        numpy.testing.assert_allclose(spatial.spatial_mean.dot(state[0]), sample[0], rtol=1e-10)
+
+    def test_bold_region_roi(self):
+        _, bold, roi = self.sim.monitors
+        rng = numpy.random.RandomState(42)
+        n_sample = 0
+        for step in range(1, 1001):
+            state = rng.randn(*self.shape)
+            bold_sample, roi_sample = bold.sample(step, state), roi.sample(step, state)
+            if bold_sample is not None:
+                self.assertEqual((self.shape[0], 76, 1), roi_sample[1].shape)
+                numpy.testing.assert_allclose(self._region_mean(bold_sample[1]), roi_sample[1], rtol=1e-10)
+                n_sample += 1
+        self.assertEqual(2, n_sample)
+
+
 def suite():
     """
     Gather all the tests in a test suite.
@@ -39,6 +39,9 @@ if __name__ == "__main__":
     from tvb.tests.library import setup_test_console_env
     setup_test_console_env()
     
+import copy
+import numpy
+import threading
 import unittest
 
 from tvb.tests.library.base_testcase import BaseTestCase
@@ -60,13 +63,139 @@ class NoiseTest(BaseTestCase):
         noise_multiplicative = noise.Multiplicative()
         self.assertEqual(noise_multiplicative.ntau,  0.0)
         self.assertTrue(isinstance(noise_multiplicative.b, equations.Linear))
-    
+
+    def test_counter_stream_partitioning(self):
+        shape = 2, 300, 1
+        serial = noise.CounterStream(7).normal(size=shape)
+        threaded = noise.CounterStream(7, n_thread=4).normal(size=shape)
+        numpy.testing.assert_array_equal(serial, threaded)
+        # a node's variates do not depend on the number of nodes
+        fewer = noise.CounterStream(7).normal(size=(2, 100, 1))
+        numpy.testing.assert_array_equal(serial[:, :100], fewer)
+        self.assertAlmostEqual(0.0, serial.mean(), delta=0.1)
+        self.assertAlmostEqual(1.0, serial.std(), delta=0.1)
+
+    def test_counter_stream_state(self):
+        stream = noise.CounterStream(7)
+        first = stream.normal(size=(2, 10, 1))
+        second = stream.normal(size=(2, 10, 1))
+        self.assertFalse(numpy.allclose(first, second))
+        self.assertEqual(('Philox', 7, 2), stream.get_state())
+        stream.set_state(('Philox', 7, 1))
+        numpy.testing.assert_array_equal(second, stream.normal(size=(2, 10, 1)))
+        other = noise.CounterStream(8).normal(size=(2, 10, 1))
+        self.assertFalse(numpy.allclose(first, other))
+
+    def test_counter_stream_threads(self):
+        noise.CounterStream(7, n_thread=4).normal(size=(2, 300, 1))
+        n_thread = threading.active_count()
+        for seed in range(5):
+            noise.CounterStream(seed, n_thread=4).normal(size=(2, 300, 1))
+        # the streams share a pool of threads rather than each starting its own
+        self.assertEqual(n_thread, threading.active_count())
+
+    def test_counter_based_noise(self):
+        noise_additive = noise.Additive(counter_based=True, counter_seed=3)
+        noise_additive.configure_white(0.1)
+        self.assertTrue(isinstance(noise_additive.random_stream, noise.CounterStream))
+        self.assertEqual(('Philox', 3, 0), noise_additive.random_stream.get_state())
+        draw = noise_additive.generate((2, 10, 1))
+        expected = numpy.sqrt(0.1) * noise.CounterStream(3).normal(size=(2, 10, 1))
+        numpy.testing.assert_allclose(draw, expected)
+
+class BlockStreamTest(BaseTestCase):
+    "Noise drawn in blocks of many time steps."
+
+    shape = 2, 7, 1
+
+    def _assert_same_draws(self, background):
+        expected = numpy.random.RandomState(3)
+        stream = noise.BlockStream(numpy.random.RandomState(3), n_step=5, background=background)
+        for i in range(40):
+            size = (3, ) if i % 13 == 0 else self.shape
+            numpy.testing.assert_array_equal(expected.normal(size=size), stream.normal(size=size))
+            if i == 17:
+                numpy.testing.assert_array_equal(expected.uniform(size=4), stream.uniform(size=4))
+        self.assertEqual(expected.get_state()[2:], stream.get_state()[2:])
+        numpy.testing.assert_array_equal(expected.get_state()[1], stream.get_state()[1])
+
+    def test_same_draws(self):
+        self._assert_same_draws(background=False)
+
+    def test_same_draws_background(self):
+        self._assert_same_draws(background=True)
+
+    def test_set_state_within_block(self):
+        stream = noise.BlockStream(numpy.random.RandomState(3), n_step=5)
+        for _ in range(7):
+            stream.normal(size=self.shape)
+        block = stream._block
+        state = stream.get_state()
+        expected = numpy.random.RandomState(3)
+        expected.normal(size=(7, ) + self.shape)
+        numpy.testing.assert_array_equal(expected.get_state()[1], state[1])
+        draws = [stream.normal(size=self.shape) for _ in range(2)]
+        stream.set_state(state)
+        # the block is kept, and its draws handed out again from the stored position
+        self.assertIs(block, stream._block)
+        for draw in draws:
+            numpy.testing.assert_array_equal(draw, stream.normal(size=self.shape))
+        draws += [stream.normal(size=self.shape) for _ in range(4)]
+        # once past the block, the stream is rewound to the state
+        stream.set_state(state)
+        for draw in draws:
+            numpy.testing.assert_array_equal(draw, stream.normal(size=self.shape))
+        # a state not given within the block rewinds the stream to it
+        stream.set_state(expected.get_state())
+        numpy.testing.assert_array_equal(expected.normal(size=self.shape), stream.normal(size=self.shape))
+
+    def test_replay_within_block(self):
+        noise_additive = noise.Additive(nsig=numpy.array([0.01]), block_steps=5)
+        noise_additive.configure_white(0.1, self.shape)
+        for _ in range(7):
+            noise_additive.generate(self.shape)
+        state = noise_additive.random_stream.get_state()
+        draws = [noise_additive.generate(self.shape).copy() for _ in range(2)]
+        noise_additive.random_stream.set_state(state)
+        # variates scaled in place by the noise are not handed out again scaled
+        for draw in draws:
+            numpy.testing.assert_array_equal(draw, noise_additive.generate(self.shape))
+
+    def test_copy_within_block(self):
+        stream = noise.BlockStream(numpy.random.RandomState(3), n_step=5, background=True)
+        for _ in range(7):
+            stream.normal(size=self.shape)
+        # also when another reference to the wrapped stream is copied first
+        _, other = copy.deepcopy((stream.stream, stream))
+        numpy.testing.assert_array_equal(stream.normal(size=self.shape), other.normal(size=self.shape))
+
+    def test_configure(self):
+        noise_additive = noise.Additive()
+        noise_additive.configure_white(0.1)
+        self.assertTrue(isinstance(noise_additive.random_stream, noise.BlockStream))
+        # configuring again does not wrap the stream twice
+        noise_additive.configure_white(0.1)
+        self.assertTrue(isinstance(noise_additive.random_stream.stream, numpy.random.RandomState))
+        noise_additive.block_steps = 1
+        noise_additive.configure_white(0.1)
+        self.assertTrue(isinstance(noise_additive.random_stream, numpy.random.RandomState))
+
+    def test_noise_matches_per_step(self):
+        draws = []
+        for block_steps in (1, 256):
+            noise_additive = noise.Additive(block_steps=block_steps, ntau=1.0)
+            noise_additive.configure_coloured(0.1, self.shape)
+            draws.append([noise_additive.generate(self.shape) for _ in range(300)])
+        numpy.testing.assert_array_equal(*draws)
+
+
 def suite():
     """
     Gather all the tests in a test suite.
     """
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(NoiseTest))
+    test_suite.addTest(unittest.makeSuite(BlockStreamTest))
     return test_suite
 
 
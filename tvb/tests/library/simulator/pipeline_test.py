@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test pipelined execution of monitors.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import os
+import shutil
+import tempfile
+import threading
+import numpy
+import unittest
+from tvb.simulator import monitors
+from tvb.simulator.pipeline import MonitorPipeline
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class PipelineTest(SimulatorTestCase):
+
+    def _simulator(self, **kwds):
+        sim_monitors = monitors.Raw(), monitors.TemporalAverage(period=1.0), monitors.GlobalAverage(period=2.0)
+        return super(PipelineTest, self)._simulator(stochastic=True, monitors=sim_monitors, **kwds)
+
+    def test_identical_to_synchronous(self):
+        expected = self._simulator().run()
+        for depth in (1, 4):
+            self._assert_outputs_equal(expected, self._simulator(pipeline_depth=depth).run())
+
+    def test_step_order(self):
+        sim = self._simulator(pipeline_depth=4)
+        times = [output[0][0] for output in sim() if output[0] is not None]
+        self.assertEqual(200, len(times))
+        self.assertTrue(numpy.all(numpy.diff(times) > 0))
+
+    def test_fused_loop(self):
+        expected = self._simulator(backend='numba').run()
+        self._assert_outputs_equal(expected, self._simulator(backend='numba', pipeline_depth=4).run())
+
+    def test_checkpoint(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'sim.ckpt')
+            self._simulator(pipeline_depth=4, checkpoint_path=path, checkpoint_interval=150).run()
+            # monitor stocks in the checkpoint are those of the checkpointed step
+            sim = self._simulator()
+            sim.resume(path)
+            resumed = sim.run(simulation_length=5.0)
+            expected = self._simulator().run()
+            self.assertEqual(50, len(resumed[0][0]))
+            numpy.testing.assert_array_equal(expected[0][1][150:], resumed[0][1])
+            numpy.testing.assert_array_equal(expected[1][1][15:], resumed[1][1])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_profiling(self):
+        sim = self._simulator(pipeline_depth=4, profiling=True)
+        sim.run()
+        self.assertIn('monitors', sim.profiler.report()['phases'])
+        self.assertNotIn('record', sim.monitors[0].__dict__)
+
+    def test_bounded(self):
+        release = threading.Event()
+        seen = []
+
+        def monitor_output(step, state):
+            release.wait()
+            seen.append((step, state.copy()))
+            return step
+
+        pipeline = MonitorPipeline(monitor_output, depth=2)
+        try:
+            self.assertEqual([], pipeline.submit(1, numpy.ones(3)))
+            self.assertEqual([], pipeline.submit(2, numpy.ones(3) * 2))
+            self.assertEqual(0, pipeline._free.qsize())
+            release.set()
+            outputs = pipeline.submit(3, numpy.ones(3) * 3) + pipeline.drain()
+        finally:
+            pipeline.close()
+        self.assertEqual([1, 2, 3], outputs)
+        self.assertEqual([1.0, 2.0, 3.0], [state[0] for _, state in seen])
+
+    def test_monitor_error(self):
+        def monitor_output(step, state):
+            if step == 2:
+                raise RuntimeError('monitor failed')
+            return step
+
+        def run(pipeline):
+            for step in range(1, 4):
+                pipeline.submit(step, numpy.zeros(3))
+            pipeline.drain()
+
+        pipeline = MonitorPipeline(monitor_output, depth=2)
+        try:
+            self.assertRaises(RuntimeError, run, pipeline)
+        finally:
+            pipeline.close()
+
+    def test_worker_stopped(self):
+        sim = self._simulator(pipeline_depth=4)
+        steps = sim()
+        next(steps)
+        steps.close()
+        self.assertFalse(any(thread.name == 'monitor pipeline' for thread in threading.enumerate()))
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(PipelineTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
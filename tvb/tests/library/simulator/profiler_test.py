@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test profiling of the simulator's integration loop.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import time
+import numpy
+import unittest
+from tvb.simulator.profiler import PhaseProfiler
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class ProfilerTest(SimulatorTestCase):
+
+    def _simulator(self, **kwds):
+        return super(ProfilerTest, self)._simulator(simulation_length=10.0, **kwds)
+
+    def test_report(self):
+        sim = self._simulator(profiling=True)
+        sim.run()
+        report = sim.profiler.report()
+        self.assertEqual(100, report['n_step'])
+        phases = report['phases']
+        for phase in ('coupling', 'stimulus', 'scheme', 'dfun', 'history', 'monitors',
+                      'monitor 0 Raw', 'monitor 1 TemporalAverage', 'other'):
+            self.assertIn(phase, phases)
+        self.assertEqual(100, phases['coupling']['calls'])
+        self.assertEqual(200, phases['dfun']['calls'])
+        self.assertAlmostEqual(1.0, sum(stats['share'] for stats in phases.values()))
+        # monitors are unwrapped after the run
+        self.assertNotIn('record', sim.monitors[0].__dict__)
+
+    def test_output_unchanged(self):
+        (_, raw), (_, tavg) = self._simulator().run()
+        (_, raw_p), (_, tavg_p) = self._simulator(profiling=True).run()
+        numpy.testing.assert_array_equal(raw, raw_p)
+        numpy.testing.assert_array_equal(tavg, tavg_p)
+
+    def test_disabled(self):
+        sim = self._simulator()
+        sim.run()
+        self.assertIsNone(sim.profiler)
+
+    def test_nested_phases_exclusive(self):
+        profiler = PhaseProfiler(1)
+        inner = profiler.wrap('inner', time.sleep)
+        outer = profiler.wrap('outer', lambda: inner(0.05))
+        profiler.start()
+        outer()
+        profiler.stop()
+        self.assertGreater(profiler.totals['inner'], 0.04)
+        self.assertLess(profiler.totals['outer'], 0.01)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(ProfilerTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+"""
+Test the reduction graph shared by the monitors of a simulation.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import math
+import numpy
+import unittest
+from tvb.datatypes.connectivity import Connectivity
+from tvb.simulator import coupling, integrators, models, monitors
+from tvb.simulator.reduction import ReductionGraph, Select, WindowSum
+from tvb.simulator.simulator import Simulator
+from tvb.tests.library.base_testcase import BaseTestCase
+
+
+
+class ReductionGraphTest(BaseTestCase):
+
+    def _monitors(self):
+        eeg = monitors.EEG.from_file()
+        eeg.period = 1.0
+        return [monitors.TemporalAverage(period=1.0), monitors.SpatialAverage(period=1.0),
+                monitors.Bold(period=500.0), eeg]
+
+    def _simulator(self, monitors, simulation_length=1000.0):
+        sim = Simulator(connectivity=Connectivity(load_default=True),
+                        model=models.Generic2dOscillator(),
+                        coupling=coupling.Linear(a=1e-3),
+                        integrator=integrators.HeunDeterministic(dt=0.5),
+                        monitors=monitors, simulation_length=simulation_length)
+        numpy.random.seed(42)
+        return sim.configure()
+
+    def test_merged_pipelines(self):
+        sim = self._simulator(self._monitors())
+        temporal, spatial, bold, eeg = sim.monitors
+        select, = sim._reduction_graph.root.children.values()
+        self.assertEqual(4, select.n_user)
+        self.assertEqual(3, len(select.children))
+        self.assertIs(temporal._window, eeg._window)
+        self.assertEqual(2, temporal._window.n_user)
+        self.assertIs(temporal._stock, eeg._node_sum)
+        self.assertIsNot(temporal._window, bold._interim_window)
+        self.assertIn('WindowSum(n_step=2), 2 users', str(sim._reduction_graph))
+
+    def test_outputs_match_separate_simulations(self):
+        shared = self._simulator(self._monitors()).run()
+        for i in range(4):
+            (t, x), = self._simulator([self._monitors()[i]]).run()
+            numpy.testing.assert_array_equal(t, shared[i][0])
+            numpy.testing.assert_array_equal(x, shared[i][1])
+
+    def test_temporal_average_of_raw(self):
+        (_, raw), (t, average) = self._simulator([monitors.Raw(), monitors.TemporalAverage(period=2.0)],
+                                                 simulation_length=50.0).run()
+        windows = raw.reshape((-1, 4) + raw.shape[1:])
+        numpy.testing.assert_array_equal(windows.mean(axis=1), average)
+
+    def test_raw_copies_observed_view(self):
+        sim = self._simulator([monitors.Raw()])
+        state = sim.current_state
+        self.assertTrue(numpy.shares_memory(sim.model.observe(state), state))
+        (_, first), (_, second) = [output for output, in sim(simulation_length=1.0)]
+        self.assertFalse(numpy.shares_memory(first, second))
+        self.assertFalse(numpy.array_equal(first, second))
+
+    def test_window_sum(self):
+        graph = ReductionGraph((2, 3, 1), numpy.float64)
+        select, window = graph.pipeline(Select([1]), WindowSum(2))
+        self.assertEqual((1, 3, 1), window.total.shape)
+        state = numpy.ones((2, 3, 1))
+        self.assertIsNone(window.value(1, state))
+        # a step is added once, however often it is observed
+        self.assertIsNone(window.value(1, state.copy()))
+        numpy.testing.assert_array_equal(2.0, window.value(2, state))
+        # the next window starts from the state of its first step
+        self.assertIsNone(window.value(3, 3 * state))
+        numpy.testing.assert_array_equal(3.0, window.total)
+        self.assertIs(window, graph.pipeline(Select([1]), WindowSum(2))[1])
+        self.assertIsNot(window, graph.pipeline(Select([0]), WindowSum(2))[1])
+
+    def test_partial_window_count(self):
+        sim = self._simulator([monitors.TemporalAverage(period=2.0)])
+        temporal, = sim.monitors
+        state = numpy.ones((1, sim.number_of_nodes, 1))
+        # starting half way through a period, the average is over the steps summed
+        self.assertIsNone(temporal.sample(3, state))
+        _, average = temporal.sample(4, 3 * state)
+        self.assertEqual(2, temporal._window_count[0])
+        numpy.testing.assert_array_equal(2.0, average)
+
+    def test_compensated_window(self):
+        graph = ReductionGraph((1, 10, 1), numpy.float64)
+        plain, = graph.pipeline(WindowSum(20000))
+        compensated, = graph.pipeline(WindowSum(20000, compensated=True))
+        self.assertIsNot(plain, compensated)
+        states = numpy.random.RandomState(42).rand(20000, 1, 10, 1) * 0.1 + 1 / 3.0
+        for step, state in enumerate(states, 1):
+            plain.value(step, state)
+            compensated.value(step, state)
+        exact = numpy.array([math.fsum(states[:, 0, i, 0]) for i in range(10)])
+        plain_error = abs(plain.total[0, :, 0] - exact).max()
+        compensated_error = abs(compensated.total[0, :, 0] - exact).max()
+        self.assertLessEqual(compensated_error, 2 * numpy.spacing(exact.max()))
+        self.assertLess(compensated_error, plain_error)
+
+    def test_compensated_temporal_average(self):
+        plain, compensated = [self._simulator([monitors.TemporalAverage(period=2.0, compensated_sum=flag)],
+                                              simulation_length=50.0) for flag in (False, True)]
+        self.assertIsNone(plain.monitors[0]._window_compensation)
+        self.assertEqual(plain.monitors[0]._stock.shape, compensated.monitors[0]._window_compensation.shape)
+        (t, x), = plain.run()
+        (t_c, x_c), = compensated.run()
+        numpy.testing.assert_array_equal(t, t_c)
+        numpy.testing.assert_allclose(x, x_c, rtol=1e-12, atol=1e-14)
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(ReductionGraphTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test measured memory and runtime estimates.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import numpy
+import unittest
+import scipy.sparse
+from tvb.simulator import resources
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class ResourcesTest(SimulatorTestCase):
+
+    def _simulator(self):
+        return super(ResourcesTest, self)._simulator(stochastic=True)
+
+    def test_nbytes(self):
+        self.assertEqual(80, resources.nbytes(numpy.zeros(10)))
+        matrix = scipy.sparse.eye(10, format='csr')
+        self.assertEqual(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes,
+                         resources.nbytes(matrix))
+        self.assertEqual(0, resources.nbytes(1.0))
+
+    def test_census(self):
+        sim = self._simulator()
+        census = resources.memory_census(sim)
+        self.assertEqual(sim.history.nbytes, census['history'])
+        self.assertGreaterEqual(census['monitor 1 TemporalAverage'], sim.monitors[1]._stock.nbytes)
+        self.assertEqual(sum(census.values()), sim.memory_requirement())
+
+    def test_estimate(self):
+        sim = self._simulator()
+        estimate = sim.estimate_resources(n_step=20, n_burst=3)
+        self.assertEqual(200, estimate['n_steps'])
+        runtime = estimate['runtime']
+        self.assertTrue(0 <= runtime['low'] <= runtime['estimate'] <= runtime['high'])
+        # samples of 1 x 76 x 1 doubles and their times
+        raw_nbytes = 200 * (76 * 8 + 8)
+        tavg_nbytes = 20 * (76 * 8 + 8)
+        self.assertEqual(raw_nbytes + tavg_nbytes, estimate['memory']['output'])
+        self.assertAlmostEqual(runtime['estimate'] * 2, sim.runtime(40.0))
+
+    def test_calibration_restores_state(self):
+        (_, raw), (_, tavg) = self._simulator().run()
+        sim = self._simulator()
+        sim.estimate_resources(n_step=15, n_burst=2)
+        self.assertEqual(0, sim.current_step)
+        (_, raw_e), (_, tavg_e) = sim.run()
+        numpy.testing.assert_array_equal(raw, raw_e)
+        numpy.testing.assert_array_equal(tavg, tavg_e)
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(ResourcesTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)
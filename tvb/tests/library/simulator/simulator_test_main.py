@@ -52,6 +52,18 @@ from tvb.tests.library.simulator import noise_test
 from tvb.tests.library.simulator import simulator_test
 from tvb.tests.library.simulator import region_boundaries_test
 from tvb.tests.library.simulator import history_test
+from tvb.tests.library.simulator import batch_test
+from tvb.tests.library.simulator import fused_loop_test
+from tvb.tests.library.simulator import checkpoint_test
+from tvb.tests.library.simulator import sinks_test
+from tvb.tests.library.simulator import profiler_test
+from tvb.tests.library.simulator import resources_test
+from tvb.tests.library.simulator import dtype_test
+from tvb.tests.library.simulator import pipeline_test
+from tvb.tests.library.simulator import decomposition_test
+from tvb.tests.library.simulator import cache_test
+from tvb.tests.library.simulator import clone_test
+from tvb.tests.library.simulator import reduction_test
 
 
 def suite():
@@ -68,6 +80,18 @@ def suite():
     test_suite.addTest(noise_test.suite())
     test_suite.addTest(region_boundaries_test.suite())
     test_suite.addTest(simulator_test.suite())
+    test_suite.addTest(batch_test.suite())
+    test_suite.addTest(fused_loop_test.suite())
+    test_suite.addTest(checkpoint_test.suite())
+    test_suite.addTest(sinks_test.suite())
+    test_suite.addTest(profiler_test.suite())
+    test_suite.addTest(resources_test.suite())
+    test_suite.addTest(dtype_test.suite())
+    test_suite.addTest(pipeline_test.suite())
+    test_suite.addTest(decomposition_test.suite())
+    test_suite.addTest(cache_test.suite())
+    test_suite.addTest(clone_test.suite())
+    test_suite.addTest(reduction_test.suite())
 
     return test_suite
 
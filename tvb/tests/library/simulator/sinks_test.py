@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+#
+# TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2013, Baycrest Centre for Geriatric Care ("Baycrest")
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2 as published by the Free
+# Software Foundation. This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details. You should have received a copy of the GNU General
+# Public License along with this program; if not, you can download it here
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0
+#
+#
+# CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test output sinks of Simulator.run.
+
+"""
+
+if __name__ == "__main__":
+    from tvb.tests.library import setup_test_console_env
+    setup_test_console_env()
+
+import os
+import shutil
+import tempfile
+import numpy
+import unittest
+from tvb.simulator import monitors, sinks
+from tvb.tests.library.base_testcase import SimulatorTestCase
+
+
+
+class SinksTest(SimulatorTestCase):
+
+    def setUp(self):
+        super(SinksTest, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _collect(self, sim):
+        "Collect output into lists as the simulator used to."
+        ts, xs = [[], []], [[], []]
+        for data in sim():
+            for tl, xl, t_x in zip(ts, xs, data):
+                if t_x is not None:
+                    tl.append(t_x[0])
+                    xl.append(t_x[1])
+        return [(numpy.array(t), numpy.array(x)) for t, x in zip(ts, xs)]
+
+    def test_array_sink(self):
+        expected = self._collect(self._simulator())
+        sim = self._simulator()
+        output = sim.run()
+        self.assertEqual((200, 1, 76, 1), output[0][1].shape)
+        self.assertEqual((20, 1, 76, 1), output[1][1].shape)
+        self._assert_outputs_equal(expected, output)
+        # continued run starting between samples of the temporal average
+        sim.run(simulation_length=0.55)
+        (_, raw), (_, tavg) = sim.run(simulation_length=2.0)
+        self.assertEqual(20, raw.shape[0])
+        self.assertEqual(2, tavg.shape[0])
+
+    def test_array_sink_grows(self):
+        sink = sinks.ArraySink()
+        sink.open(monitors.Raw(), 1)
+        for i in range(5):
+            sink.write(float(i), numpy.ones(3) * i)
+        times, data = sink.close()
+        numpy.testing.assert_array_equal(numpy.r_[:5], times)
+        numpy.testing.assert_array_equal(numpy.r_[:5], data[:, 0])
+
+    def test_memmap_sink(self):
+        expected = self._collect(self._simulator())
+        paths = [os.path.join(self.tmp_dir, name) for name in ('raw.npy', 'tavg.npy')]
+        output = self._simulator().run(sinks=[sinks.MemmapSink(path) for path in paths])
+        self._assert_outputs_equal(expected, output)
+        for path, (_, x) in zip(paths, expected):
+            numpy.testing.assert_array_equal(x, numpy.load(path, mmap_mode='r'))
+
+    @unittest.skipIf(sinks.h5py is None, 'h5py is not available')
+    def test_hdf5_sink(self):
+        expected = self._collect(self._simulator())
+        path = os.path.join(self.tmp_dir, 'output.h5')
+        output = self._simulator().run(sinks=[sinks.HDF5Sink(path, group='raw', chunk_size=64),
+                                              sinks.HDF5Sink(path, group='tavg', chunk_size=64)])
+        self._assert_outputs_equal(expected, output)
+        # handles of the datasets, read on indexing
+        (times, data), _ = output
+        self.assertIsInstance(data, sinks.HDF5Dataset)
+        self.assertEqual(expected[0][1].shape, data.shape)
+        numpy.testing.assert_array_equal(expected[0][0][10:20], times[10:20])
+        numpy.testing.assert_array_equal(expected[0][1][10:20], data[10:20])
+
+    @unittest.skipUnless(sinks.h5py is None, 'h5py is available')
+    def test_hdf5_sink_requires_h5py(self):
+        self.assertRaises(ImportError, sinks.HDF5Sink, os.path.join(self.tmp_dir, 'output.h5'))
+
+    def test_wrong_number_of_sinks(self):
+        self.assertRaises(ValueError, self._simulator().run, sinks=[sinks.ArraySink()])
+
+
+
+def suite():
+    """
+    Gather all the tests in a test suite.
+    """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(SinksTest))
+    return test_suite
+
+
+
+if __name__ == "__main__":
+    #So you can run tests from this package individually.
+    TEST_RUNNER = unittest.TextTestRunner()
+    TEST_SUITE = suite()
+    TEST_RUNNER.run(TEST_SUITE)